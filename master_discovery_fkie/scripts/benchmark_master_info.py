@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Measures the memory footprint of the MasterInfo instances for a fleet of
+# ROS masters, as stored by master_sync and node_manager for each remote master.
+#
+# usage: benchmark_master_info.py [masters] [topics]
+#   masters: count of ROS masters in the fleet (Default: 50)
+#   topics:  count of all topics in the fleet (Default: 20000)
+
+import gc
+import sys
+import time
+
+import roslib; roslib.load_manifest('master_discovery_fkie')
+from master_discovery_fkie.master_info import MasterInfo
+
+
+def _fresh(s):
+  '''
+  Returns a new string object with the same value, like a string unmarshalled
+  from a XML-RPC response.
+  '''
+  return ''.join(list(s))
+
+def create_listed_state(master_idx, topics, nodes, services):
+  '''
+  Creates a state in the form of L{MasterInfo.listedState()}. All masters run
+  the same software, so the names are equal on all masters.
+  '''
+  masteruri = 'http://robot%d:11311' % master_idx
+  publishers = []
+  subscribers = []
+  topic_types = []
+  node_list = []
+  service_list = []
+  service_provider = []
+  for t in range(topics):
+    name = '/robot/sensor_%d/data' % t
+    publishers.append((_fresh(name), [_fresh('/robot/node_%d' % (t % nodes))]))
+    subscribers.append((_fresh(name), [_fresh('/robot/node_%d' % ((t + 1) % nodes)),
+                                       _fresh('/robot/node_%d' % ((t + 2) % nodes))]))
+    topic_types.append((_fresh(name), _fresh('sensor_msgs/LaserScan')))
+  for n in range(nodes):
+    node_list.append((_fresh('/robot/node_%d' % n), 'http://robot%d:%d/' % (master_idx, 40000 + n),
+                      masteruri, 1000 + n, 'local'))
+  for s in range(services):
+    name = '/robot/node_%d/set_parameters' % (s % nodes)
+    service_list.append((_fresh(name), [_fresh('/robot/node_%d' % (s % nodes))]))
+    service_provider.append((_fresh(name), 'rosrpc://robot%d:%d' % (master_idx, 50000 + s),
+                             masteruri, _fresh('dynamic_reconfigure/Reconfigure'), 'local'))
+  return (str(time.time()), masteruri, 'robot%d' % master_idx, publishers, subscribers,
+          service_list, topic_types, node_list, service_provider)
+
+def deep_sizeof(obj, seen):
+  '''
+  Returns the size of the object and all referenced objects not in C{seen}.
+  '''
+  result = 0
+  stack = [obj]
+  while stack:
+    o = stack.pop()
+    if id(o) in seen or isinstance(o, type):
+      continue
+    seen.add(id(o))
+    result += sys.getsizeof(o)
+    if isinstance(o, dict):
+      stack.extend(o.iterkeys())
+      stack.extend(o.itervalues())
+    elif isinstance(o, (list, tuple, set, frozenset)):
+      stack.extend(o)
+    if hasattr(o, '__dict__'):
+      stack.append(o.__dict__)
+    for cls in type(o).__mro__:
+      for slot in cls.__dict__.get('__slots__', ()):
+        if slot.startswith('__') and not slot.endswith('__'):
+          slot = ''.join(['_', cls.__name__.lstrip('_'), slot])
+        if hasattr(o, slot):
+          stack.append(getattr(o, slot))
+  return result
+
+def main():
+  masters = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+  topics = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+  topics_per_master = topics / masters
+  nodes_per_master = max(1, topics_per_master / 4)
+  services_per_master = nodes_per_master
+  states = [create_listed_state(i, topics_per_master, nodes_per_master, services_per_master) for i in range(masters)]
+  gc.collect()
+  start = time.time()
+  infos = [MasterInfo.from_list(s) for s in states]
+  duration = time.time() - start
+  del states
+  gc.collect()
+  size = deep_sizeof(infos, set())
+  print "masters: %d, topics: %d, nodes: %d, services: %d" % (masters, topics_per_master * masters,
+                                                              nodes_per_master * masters,
+                                                              services_per_master * masters)
+  print "from_list: %.3f sec" % duration
+  print "memory: %.2f MB (%d bytes per topic)" % (size / 1048576.0, size / (topics_per_master * masters))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+#
+# Compares the size on the wire and the decode time of the master state
+# transferred by XML-RPC and by the compressed binary transport.
+#
+# usage: benchmark_transport.py [topics]
+#   topics: count of topics of the ROS master (Default: 20000)
+
+import sys
+import time
+import xmlrpclib
+import zlib
+
+import roslib; roslib.load_manifest('master_discovery_fkie')
+from master_discovery_fkie import state_codec
+from benchmark_master_info import create_listed_state
+
+
+def measure(func, arg, repeat=5):
+  '''
+  Returns the result and the best duration of C{repeat} calls of C{func(arg)}.
+  '''
+  best = None
+  for _ in range(repeat):
+    start = time.time()
+    result = func(arg)
+    duration = time.time() - start
+    if best is None or duration < best:
+      best = duration
+  return result, best
+
+def main():
+  topics = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+  nodes = max(1, topics / 4)
+  listed = create_listed_state(0, topics, nodes, nodes)
+  xml, xml_encode = measure(lambda l: xmlrpclib.dumps((l,), methodresponse=1, allow_none=True), listed)
+  _, xml_decode = measure(xmlrpclib.loads, xml)
+  binary, binary_encode = measure(state_codec.encode_listed_state, listed)
+  decoded, binary_decode = measure(state_codec.decode_listed_state, binary)
+  assert xmlrpclib.loads(xml)[0][0] == xmlrpclib.loads(xmlrpclib.dumps((decoded,), methodresponse=1, allow_none=True))[0][0]
+  print "topics: %d, nodes: %d, services: %d" % (topics, nodes, nodes)
+  print "%-16s %12s %10s %10s" % ('transport', 'bytes', 'encode', 'decode')
+  print "%-16s %12d %9.3fs %9.3fs" % ('XML-RPC', len(xml), xml_encode, xml_decode)
+  print "%-16s %12d %10s %10s" % ('XML-RPC (gzip)', len(zlib.compress(xml)), '-', '-')
+  print "%-16s %12d %9.3fs %9.3fs" % ('binary', len(binary), binary_encode, binary_decode)
+
+if __name__ == '__main__':
+  main()
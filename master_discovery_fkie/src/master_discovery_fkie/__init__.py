@@ -94,7 +94,10 @@ def main():
   mcast_group = rospy.get_param('~mcast_group', MCAST_GROUP)
   mcast_port = rospy.get_param('~mcast_port', MCAST_PORT)
   rpc_port = rospy.get_param('~rpc_port', getDefaultRPCPort())
-  discoverer = master_discovery.Discoverer(mcast_port, mcast_group, rpc_port)
+  if rospy.get_param('~engine', 'threads') == 'eventloop':
+    discoverer = master_discovery.EventLoopDiscoverer(mcast_port, mcast_group, rpc_port)
+  else:
+    discoverer = master_discovery.Discoverer(mcast_port, mcast_group, rpc_port)
   discoverer.start()
   rospy.spin()
 
@@ -0,0 +1,226 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2012, Fraunhofer FKIE/US, Alexander Tiderko
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Fraunhofer nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import collections
+import errno
+import fcntl
+import heapq
+import os
+import select
+import time
+from multiprocessing.pool import ThreadPool
+
+import roslib; roslib.load_manifest('master_discovery_fkie')
+import rospy
+
+
+class EventLoop(object):
+  '''
+  A single threaded event loop based on C{select()}. It calls the callbacks of 
+  readable file descriptors and of expired timers in the thread running 
+  L{run()}. Blocking functions are executed by a small thread pool, their 
+  results are passed to the callbacks in the thread of the loop.
+  Only L{callSoonThreadsafe()}, L{runInExecutor()} and L{stop()} may be 
+  called from other threads.
+  '''
+
+  def __init__(self, workers=2):
+    '''
+    @param workers: the count of threads to execute the blocking functions
+    @type workers: C{int} (Default: C{2})
+    '''
+    self._workers = workers
+    self._pool = None
+    self._timers = []
+    self._timer_seq = 0
+    self._readers = dict()
+    self._pending = collections.deque()
+    self._running = False
+    self.max_timer_latency = 0.
+    '''@ivar: the maximal delay of a timer callback in seconds'''
+    self._wakeup_r, self._wakeup_w = os.pipe()
+    for fd in (self._wakeup_r, self._wakeup_w):
+      flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+      fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    self._readers[self._wakeup_r] = self._readWakeup
+
+  def callAt(self, deadline, callback, *args):
+    '''
+    Calls the callback at the given time.
+    @param deadline: the time in seconds since the epoch
+    @type deadline: C{float}
+    @return: the handle to cancel the timer, see L{cancel()}
+    '''
+    timer = [deadline, self._timer_seq, callback, args]
+    self._timer_seq += 1
+    heapq.heappush(self._timers, timer)
+    return timer
+
+  def callLater(self, delay, callback, *args):
+    '''
+    Calls the callback after the given delay.
+    @param delay: the delay in seconds
+    @type delay: C{float}
+    @return: the handle to cancel the timer, see L{cancel()}
+    '''
+    return self.callAt(time.time() + delay, callback, *args)
+
+  def cancel(self, timer):
+    '''
+    Cancels the timer created by L{callAt()} or L{callLater()}.
+    '''
+    timer[2] = None
+
+  def callSoonThreadsafe(self, callback, *args):
+    '''
+    Calls the callback in the thread of the loop as soon as possible. This 
+    method can be called from any thread.
+    '''
+    self._pending.append((callback, args))
+    try:
+      os.write(self._wakeup_w, 'x')
+    except OSError, e:
+      # the pipe is full, the loop wakes up anyway
+      if e.errno != errno.EAGAIN:
+        raise
+
+  def addReader(self, fileobj, callback):
+    '''
+    Calls the callback each time the file descriptor is readable.
+    @param fileobj: the file descriptor or an object with C{fileno()} method
+    '''
+    fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+    self._readers[fd] = callback
+
+  def removeReader(self, fileobj):
+    try:
+      fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+      del self._readers[fd]
+    except:
+      pass
+
+  def runInExecutor(self, func, args=(), callback=None):
+    '''
+    Executes the blocking function in the thread pool. The result is passed to 
+    the callback in the thread of the loop. If the function raises an 
+    exception, it will be logged and the callback gets C{None}. This method 
+    can be called from any thread.
+    @param func: the blocking function
+    @param args: the arguments of the function
+    @type args: C{tuple}
+    @param callback: the callback for the result
+    @type callback: C{<method>(result)} 
+    '''
+    if self._pool is None:
+      self._pool = ThreadPool(self._workers)
+    def done(result):
+      if not callback is None:
+        self.callSoonThreadsafe(callback, result)
+    self._pool.apply_async(self._guarded, (func, args), callback=done)
+
+  @classmethod
+  def _guarded(cls, func, args):
+    try:
+      return func(*args)
+    except:
+      import traceback
+      rospy.logwarn("Error in %s: %s", str(func), traceback.format_exc())
+      return None
+
+  def run(self):
+    '''
+    Runs the loop until L{stop()} is called.
+    '''
+    self._running = True
+    while self._running:
+      timeout = None
+      if self._pending:
+        timeout = 0.
+      elif self._timers:
+        timeout = max(0., self._timers[0][0] - time.time())
+      try:
+        readable, _, _ = select.select(self._readers.keys(), [], [], timeout)
+      except (select.error, OSError), e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+      for fd in readable:
+        callback = self._readers.get(fd, None)
+        if not callback is None:
+          self._call(callback)
+      while self._pending:
+        callback, args = self._pending.popleft()
+        self._call(callback, *args)
+      now = time.time()
+      while self._timers and self._timers[0][0] <= now:
+        deadline, _, callback, args = heapq.heappop(self._timers)
+        if not callback is None:
+          self.max_timer_latency = max(self.max_timer_latency, now - deadline)
+          self._call(callback, *args)
+
+  def stop(self):
+    '''
+    Stops the loop. This method can be called from any thread.
+    '''
+    self.callSoonThreadsafe(self._stop)
+
+  def _stop(self):
+    self._running = False
+
+  def close(self):
+    '''
+    Terminates the thread pool and closes the wakeup pipe.
+    '''
+    if not self._pool is None:
+      self._pool.terminate()
+      self._pool = None
+    for fd in (self._wakeup_r, self._wakeup_w):
+      try:
+        os.close(fd)
+      except OSError:
+        pass
+
+  def _readWakeup(self):
+    try:
+      while os.read(self._wakeup_r, 4096):
+        pass
+    except OSError, e:
+      if e.errno != errno.EAGAIN:
+        raise
+
+  def _call(self, callback, *args):
+    try:
+      callback(*args)
+    except:
+      import traceback
+      rospy.logwarn("Error in event loop callback %s: %s", str(callback), traceback.format_exc())
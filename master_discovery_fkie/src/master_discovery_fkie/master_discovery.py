@@ -30,6 +30,10 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import array
+import collections
+import math
+import os
 import threading
 import xmlrpclib
 import copy
@@ -43,8 +47,204 @@ import roslib.network
 
 from master_discovery_fkie.msg import *
 from master_discovery_fkie.srv import *
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 from master_monitor import MasterMonitor, MasterConnectionException
 from udp import McastSocket
+from event_loop import EventLoop
+from retrieval_pool import RetrievalPool
+
+
+class HeartbeatBuffer(object):
+  '''
+  A fixed-size ring buffer with the arrival times of the heartbeats received
+  in the measurement interval. The sums of the inter-arrival times, of the 
+  heartbeat periods advertised by the sender and the largest count of lost 
+  heartbeats between two received heartbeats are updated on each added or 
+  removed heartbeat in constant (amortized) time. If the buffer is full, the 
+  oldest heartbeat will be replaced.
+  '''
+
+  PHI_MIN_SAMPLES = 5
+  ''' @ivar: the minimal count of inter-arrival times to calculate the suspicion level (Default: 5)'''
+
+  def __init__(self, rate, duration):
+    '''
+    @param rate: the expected rate of the heartbeats in Hz
+    @type rate: C{float}
+    @param duration: the measurement interval in seconds
+    @type duration: C{float}
+    '''
+    self.rate = rate
+    self.capacity = self._capacity(rate, duration)
+    self._stamps = array.array('d', [0.0]) * self.capacity
+    self._gaps = array.array('d', [0.0]) * self.capacity
+    self._periods = array.array('d', [0.0]) * self.capacity
+    self._start = 0
+    self._count = 0
+    self._last = None
+    self._last_rate = rate
+    self._gap_count = 0
+    self._gap_sum = 0.
+    self._gap_sq_sum = 0.
+    self._period_sum = 0.
+    # (arrival time, lost heartbeats before) with decreasing lost heartbeats
+    self._losses = collections.deque()
+
+  @classmethod
+  def _capacity(cls, rate, duration):
+    # twice the expected count, to keep the heartbeats received on more interfaces
+    return max(16, int(math.ceil(rate * duration)) * 2)
+
+  def __len__(self):
+    return self._count
+
+  def setRate(self, rate, duration):
+    '''
+    Sets the new rate advertised by the sender. The buffer will be enlarged, 
+    if it is to small for the new rate. The stored heartbeats are kept.
+    @param rate: the expected rate of the heartbeats in Hz
+    @type rate: C{float}
+    @param duration: the measurement interval in seconds
+    @type duration: C{float}
+    '''
+    capacity = self._capacity(rate, duration)
+    if capacity > self.capacity:
+      order = [(self._start + i) % self.capacity for i in range(self._count)]
+      for name in ('_stamps', '_gaps', '_periods'):
+        old = getattr(self, name)
+        new = array.array('d', [old[i] for i in order])
+        new.extend(array.array('d', [0.0]) * (capacity - self._count))
+        setattr(self, name, new)
+      self._start = 0
+      self.capacity = capacity
+    self.rate = rate
+
+  def append(self, stamp):
+    '''
+    Adds the arrival time of a heartbeat sent with the current rate.
+    @param stamp: the arrival time
+    @type stamp: C{float}
+    '''
+    if self._count == self.capacity:
+      self._removeOldest()
+    gap = -1. if self._last is None else stamp - self._last
+    self._last = stamp
+    idx = (self._start + self._count) % self.capacity
+    period = 1. / self.rate if self.rate > 0 else 0.
+    self._stamps[idx] = stamp
+    self._gaps[idx] = gap
+    self._periods[idx] = period
+    self._period_sum += period
+    self._count += 1
+    if gap >= 0:
+      self._gap_count += 1
+      self._gap_sum += gap
+      self._gap_sq_sum += gap * gap
+      lost = max(0, int(round(gap * self._last_rate)) - 1)
+      while self._losses and self._losses[-1][1] <= lost:
+        self._losses.pop()
+      self._losses.append((stamp, lost))
+    self._last_rate = self.rate
+
+  def removeOlder(self, timestamp):
+    '''
+    Removes all heartbeats, which are older than the given timestamp.
+    @param timestamp: heartbeats older this timestamp will be removed.
+    @type timestamp:  C{float}
+    @return: the count of removed heartbeats
+    @rtype: C{int}
+    '''
+    removed = 0
+    while self._count > 0 and self._stamps[self._start] < timestamp:
+      self._removeOldest()
+      removed += 1
+    return removed
+
+  def _removeOldest(self):
+    stamp = self._stamps[self._start]
+    gap = self._gaps[self._start]
+    self._period_sum -= self._periods[self._start]
+    if gap >= 0:
+      self._gap_count -= 1
+      self._gap_sum -= gap
+      self._gap_sq_sum -= gap * gap
+    self._start = (self._start + 1) % self.capacity
+    self._count -= 1
+    while self._losses and self._losses[0][0] <= stamp:
+      self._losses.popleft()
+    if self._gap_count == 0:
+      # avoid the accumulation of rounding errors
+      self._gap_sum = 0.
+      self._gap_sq_sum = 0.
+    if self._count == 0:
+      self._period_sum = 0.
+
+  def coveredTime(self):
+    '''
+    @return: the sum of the heartbeat periods advertised with the received 
+    heartbeats. Divided by the measurement interval it gives the ratio of the 
+    received heartbeats, also if the sender changes its rate.
+    @rtype: C{float}
+    '''
+    return max(0., self._period_sum)
+
+  def meanGap(self):
+    '''
+    @return: the mean time between two heartbeats in seconds or C{0}, if no 
+    inter-arrival times are available.
+    @rtype: C{float}
+    '''
+    if self._gap_count == 0:
+      return 0.
+    return self._gap_sum / self._gap_count
+
+  def jitter(self):
+    '''
+    @return: the standard deviation of the times between two heartbeats in seconds
+    @rtype: C{float}
+    '''
+    if self._gap_count == 0:
+      return 0.
+    mean = self._gap_sum / self._gap_count
+    return math.sqrt(max(0., self._gap_sq_sum / self._gap_count - mean * mean))
+
+  def phi(self, now, min_std=0.05):
+    '''
+    Returns the suspicion level of the phi-accrual failure detector: the 
+    negative decimal logarithm of the probability, that the next heartbeat 
+    arrives later than C{now}. The inter-arrival times are assumed to be 
+    normal distributed with the mean and the standard deviation of the stored 
+    gaps. The mean is at least the period advertised by the sender.
+    @param now: the current time
+    @type now: C{float}
+    @param min_std: the minimal standard deviation in seconds, to avoid false 
+    suspicions on links without jitter
+    @type min_std: C{float}
+    @return: the suspicion level or C{None}, if not enough heartbeats are available
+    @rtype: C{float} or C{None}
+    '''
+    if self._last is None or self._gap_count < self.PHI_MIN_SAMPLES:
+      return None
+    elapsed = now - self._last
+    mean = self.meanGap()
+    if self.rate > 0:
+      mean = max(mean, 1. / self.rate)
+    std = max(self.jitter(), min_std)
+    # logistic approximation of the cumulative normal distribution
+    y = max(-10., min(10., (elapsed - mean) / std))
+    e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+    if elapsed > mean:
+      return -math.log10(e / (1. + e))
+    return -math.log10(1. - 1. / (1. + e))
+
+  def burstLoss(self):
+    '''
+    @return: the largest count of consecutive lost heartbeats 
+    @rtype: C{int}
+    '''
+    if self._losses:
+      return self._losses[0][1]
+    return 0
 
 
 class DiscoveredMaster(object):
@@ -54,7 +254,7 @@ class DiscoveredMaster(object):
   connection to remote discoverer will be established to get additional 
   information about the ROS master.
   '''
-  def __init__(self, monitoruri, heartbeat_rate=1., timestamp=0.0, callback_master_state=None):
+  def __init__(self, monitoruri, heartbeat_rate=1., timestamp=0.0, callback_master_state=None, version=1, digests=None, state_size=None, retrieve_thread=True, relay_uri=None):
     '''
     Initialize method for the DiscoveredMaster class.
     @param monitoruri: The URI of the remote RPC server, which moniter the ROS master
@@ -65,6 +265,22 @@ class DiscoveredMaster(object):
     @type timestamp:  C{float} (Default: c{0})
     @param callback_master_state: the callback method to publish the changes of the ROS masters
     @type callback_master_state: C{<method>(master_discovery_fkie/MasterState)}  (Default: C{None})
+    @param version: the version of the heartbeat messages sent by the remote discoverer
+    @type version: C{int} (Default: C{1})
+    @param digests: the digests of the nodes, topics and services of the remote 
+    ROS master state, available since heartbeat version 2
+    @type digests: C{(int, int, int)} or C{None}
+    @param state_size: the size of the remote ROS master state in bytes, available 
+    since heartbeat version 2
+    @type state_size: C{int} or C{None}
+    @param retrieve_thread: creates a thread to retrieve the information about 
+    the remote ROS master, otherwise L{requestMasterinfo()} have to be called 
+    by the creator.
+    @type retrieve_thread: C{bool} (Default: C{True})
+    @param relay_uri: the URI of the RPC server of the relay, which reported 
+    this master of a remote segment. The relay answers the request for the 
+    contacts from its cache.
+    @type relay_uri: C{str} or C{None}
     '''
     self.masteruri = None
     self.mastername = None
@@ -72,38 +288,83 @@ class DiscoveredMaster(object):
     self.discoverername = None
     self.monitoruri = monitoruri
     self.heartbeat_rate = heartbeat_rate
-    self.heartbeats = list()
+    self.version = version
+    self.digests = digests
+    self.state_size = state_size
+    self._published_digests = None
+    self.rtt = None
+    '''@ivar: the smoothed round-trip time in seconds, measured by echo messages'''
+    self.rtt_var = None
+    '''@ivar: the variance of the round-trip time'''
+    self._echo_seq = 0
+    self.request_failures = 0
+    '''@ivar: the count of failed requests for the information about the ROS master'''
+    self.relay_uri = relay_uri
+    '''@ivar: the URI of the relay, if the master is in a remote segment, otherwise C{None}'''
+    self._contacts_proxy = (None, None)
+    '''@ivar: the URI and the kept C{ServerProxy} used to request the information about the ROS master'''
+    self.unconfirmed = False
+    '''@ivar: C{True}, if the master was loaded from the peer cache and no heartbeat is received yet'''
+    self.version_probed = False
+    '''@ivar: C{True}, if the heartbeat of the newest version was sent to this discoverer to announce the version'''
+    self.heartbeats = self._createHeartbeatBuffer(heartbeat_rate)
     self.last_heartbeat_ts = time.time()
     self.online = False
     self.callback_master_state = callback_master_state
-    # create a thread to retrieve additional information about the remote ROS master
-    self._retrieveThread = threading.Thread(target = self.__retrieveMasterinfo)
-    self._retrieveThread.setDaemon(True)
-    self._retrieveThread.start()
+    if retrieve_thread:
+      # create a thread to retrieve additional information about the remote ROS master
+      self._retrieveThread = threading.Thread(target = self.__retrieveMasterinfo)
+      self._retrieveThread.setDaemon(True)
+      self._retrieveThread.start()
 
-  def addHeartbeat(self, timestamp, rate):
+  def addHeartbeat(self, timestamp, rate, version=1, digests=None, state_size=None):
     '''
     Adds a new heartbeat measurement. If it is a new timestamp a ROS message 
     about the change of this ROS master will be published into ROS network.
+    Heartbeats with the same timestamp received within a quarter of the 
+    heartbeat period are counted only once.
+    If the heartbeat contains the digests of the state (version 2) and they are 
+    equal to the digests on last published change, the change of the timestamp 
+    will not be published, so the consumer skip the needless request.
     @param timestamp: The new timestamp of the ROS master state
     @type timestamp:  C{float}
     @param rate: The remote rate, which is used to send the heartbeat messages. 
     @type rate:  C{float}
+    @param version: the version of the heartbeat message, the highest received 
+    version is stored as supported version
+    @type version: C{int} (Default: C{1})
+    @param digests: the digests of the nodes, topics and services
+    @type digests: C{(int, int, int)} or C{None}
+    @param state_size: the size of the ROS master state in bytes
+    @type state_size: C{int} or C{None}
     '''
     cur_time = time.time()
-    self.heartbeats.append(cur_time)
-    self.last_heartbeat_ts = cur_time
-    # reset the list, if the heartbeat is changed
+    # the heartbeats sent redundantly on changes or received on more interfaces
+    # update only the state
+    duplicate = (self.timestamp == timestamp and self.heartbeat_rate > 0 and
+                 cur_time - self.last_heartbeat_ts < 0.25 / self.heartbeat_rate)
+    # adapt the buffer, if the heartbeat rate is changed
     if self.heartbeat_rate != rate:
       self.heartbeat_rate = rate
-      self.heartbeats = list()
+      self.heartbeats.setRate(rate, Discoverer.measurementDuration(rate))
+    if not duplicate:
+      self.heartbeats.append(cur_time)
+    self.last_heartbeat_ts = cur_time
+    self.unconfirmed = False
+    # a discoverer sends older versions to the multicast group, if not all 
+    # discoverer support the newest version
+    self.version = max(self.version, version)
+    self.digests = digests
+    self.state_size = state_size
     # publish new master state, if the timestamp is changed 
     if (self.timestamp != timestamp or not self.online):
+      unchanged = self.online and not digests is None and digests == self._published_digests
       self.timestamp = timestamp
       if not (self.masteruri is None):
         #set the state to 'online'
         self.online = True
-        if not (self.callback_master_state is None):
+        self._published_digests = digests
+        if not (self.callback_master_state is None) and not unchanged:
           self.callback_master_state(MasterState(MasterState.STATE_CHANGED, 
                                                  ROSMaster(str(self.mastername), 
                                                            self.masteruri, 
@@ -120,15 +381,35 @@ class DiscoveredMaster(object):
     @return: the count of removed heartbeats
     @rtype: C{int}
     '''
-    do_remove = True
-    removed = 0
-    while do_remove:
-      if len(self.heartbeats) > 0 and self.heartbeats[0] < timestamp:
-        del self.heartbeats[0]
-        removed = removed + 1
-      else:
-        do_remove = False
-    return removed
+    return self.heartbeats.removeOlder(timestamp)
+
+  def addEchoReply(self, seq, rtt):
+    '''
+    Adds a measured round-trip time. The smoothed round-trip time and its 
+    variance are estimated like the TCP retransmission timer (RFC 6298). 
+    Replies to older requests than the last one are ignored.
+    @param seq: the sequence number of the echo request
+    @type seq: C{int}
+    @param rtt: the measured round-trip time in seconds
+    @type rtt: C{float}
+    '''
+    if seq <= self._echo_seq or rtt < 0:
+      return
+    self._echo_seq = seq
+    if self.rtt is None:
+      self.rtt = rtt
+      self.rtt_var = rtt / 2.
+    else:
+      self.rtt_var = 0.75 * self.rtt_var + 0.25 * abs(self.rtt - rtt)
+      self.rtt = 0.875 * self.rtt + 0.125 * rtt
+
+  @classmethod
+  def _createHeartbeatBuffer(cls, rate):
+    '''
+    Creates the heartbeat buffer for the measurement interval used by the 
+    L{Discoverer} for given heartbeat rate.
+    '''
+    return HeartbeatBuffer(rate, Discoverer.measurementDuration(rate))
 
   def setOffline(self):
     '''
@@ -153,33 +434,66 @@ class DiscoveredMaster(object):
     '''
     if not (self.monitoruri is None):
       while self._retrieveThread.is_alive() and not rospy.is_shutdown() and (self.mastername is None):
-        try:
-#          print "get Info about master", self.monitoruri
-          remote_monitor = xmlrpclib.ServerProxy(self.monitoruri)
-          timestamp, masteruri, mastername, nodename, monitoruri = remote_monitor.masterContacts()
-        except:
-          import traceback
-          rospy.logwarn("socket error: %s", traceback.format_exc())
+        if not self.requestMasterinfo():
           time.sleep(1)
-        else:
-          if float(timestamp) != 0:
-            self.masteruri = masteruri
-            self.mastername = mastername
-            self.discoverername = nodename
-#            self.monitoruri = monitoruri
-            self.timestamp = float(timestamp)
-            self.online = True
-            #publish new node 
-            if not (self.callback_master_state is None):
-              self.callback_master_state(MasterState(MasterState.STATE_NEW, 
-                                                     ROSMaster(str(self.mastername), 
-                                                               self.masteruri, 
-                                                               self.timestamp, 
-                                                               self.online, 
-                                                               self.discoverername, 
-                                                               self.monitoruri)))
-          else:
-            time.sleep(1)
+
+  def _contactsProxy(self, uri):
+    '''
+    Returns the C{ServerProxy} for the given URI. The proxy is kept, so its 
+    connection is reused by the next requests while the URI is not changed.
+    @param uri: the URI of the remote discoverer or of the relay
+    @type uri: C{str}
+    @rtype: C{xmlrpclib.ServerProxy}
+    '''
+    proxy_uri, proxy = self._contacts_proxy
+    if proxy_uri != uri:
+      proxy = xmlrpclib.ServerProxy(uri)
+      self._contacts_proxy = (uri, proxy)
+    return proxy
+
+  def requestMasterinfo(self):
+    '''
+    Requests once the information about the Master URI, name of the service, 
+    and other from the remote RPC server of the discoverer node. On success 
+    the new ROS master will be published.
+    @return: C{True}, if the information was retrieved
+    @rtype: C{bool}
+    '''
+    try:
+#      print "get Info about master", self.monitoruri
+      if self.relay_uri is None:
+        remote_monitor = self._contactsProxy(self.monitoruri)
+        timestamp, masteruri, mastername, nodename, monitoruri = remote_monitor.masterContacts()
+      else:
+        relay = self._contactsProxy(self.relay_uri)
+        timestamp, masteruri, mastername, nodename, monitoruri = relay.masterContacts(self.monitoruri)
+    except Exception, e:
+      # log only the first error as warning
+      self.request_failures += 1
+      if self.request_failures == 1:
+        rospy.logwarn("masterContacts() of %s failed: %s", self.monitoruri, e)
+      else:
+        rospy.logdebug("masterContacts() of %s failed %d times: %s", self.monitoruri, self.request_failures, e)
+      return False
+    if float(timestamp) != 0:
+      self.masteruri = masteruri
+      self.mastername = mastername
+      self.discoverername = nodename
+#      self.monitoruri = monitoruri
+      self.timestamp = float(timestamp)
+      self.online = True
+      self._published_digests = self.digests
+      #publish new node 
+      if not (self.callback_master_state is None):
+        self.callback_master_state(MasterState(MasterState.STATE_NEW, 
+                                               ROSMaster(str(self.mastername), 
+                                                         self.masteruri, 
+                                                         self.timestamp, 
+                                                         self.online, 
+                                                         self.discoverername, 
+                                                         self.monitoruri)))
+      return True
+    return False
 
 
 
@@ -188,8 +502,8 @@ class Discoverer(threading.Thread):
   The class to publish the current state of the ROS master.
   '''
 
-  VERSION = 1
-  '''@ivar: the version of the packet format described by L{HEARTBEAT_FMT}'''
+  VERSION = 3
+  '''@ivar: the newest version of the packet format described by L{HEARTBEAT_FMT}, L{HEARTBEAT_FMT_V2} and L{HEARTBEAT_FMT_V3}'''
   '''
   Version 1: 'cBBiiH'
     one character 'R'
@@ -198,11 +512,95 @@ class Discoverer(threading.Thread):
     int: secs of the ROS Master state
     int: nsecs of the ROS Master state
     unsigned short: the port number of the RPC Server of the remote ROS-Core monitor
+  Version 2: '!cBBiiHIIII' (network byte order)
+    the fields of version 1, followed by
+    unsigned int: digest of the nodes of the ROS Master state (0 if unknown)
+    unsigned int: digest of the topics of the ROS Master state (0 if unknown)
+    unsigned int: digest of the services of the ROS Master state (0 if unknown)
+    unsigned int: size of the ROS Master state in bytes, as sent on complete request (0 if unknown)
+  Version 3: '!cBBB' followed by the entries '!iiHIIII' (network byte order)
+    one character 'R'
+    unsigned char: version of the hearbeat message
+    unsigned char: rate of the heartbeat message in HZ*10
+    unsigned char: count of the following entries, one for each local ROS master
+    each entry: the secs, nsecs and port number of version 1 and the digests 
+    and size of version 2
+  Version 1 is sent until a newer version is received from the other 
+  discoverer. To announce the own version, the heartbeat of the newest version 
+  is sent once by unicast to each discoverer, which sends an older version. A 
+  discoverer not upgrading after this probe does not support the newer version 
+  and is not probed again, each probe lets it log a warning. A newer version is sent to the multicast group only, if all known 
+  discoverer support it, and to a static host only, if it was received from 
+  this host. Version 1 and 2 are sent for each local ROS master in its own 
+  message.
   '''
   HEARTBEAT_FMT = 'cBBiiH'
-  ''' @ivar: packet format description, see: U{http://docs.python.org/library/struct.html} '''
+  ''' @ivar: packet format description of version 1, see: U{http://docs.python.org/library/struct.html} '''
+  HEARTBEAT_FMT_V2 = '!cBBiiHIIII'
+  ''' @ivar: packet format description of version 2 '''
+  HEARTBEAT_FMT_V3 = '!cBBB'
+  ''' @ivar: packet format description of the header of version 3 '''
+  HEARTBEAT_ENTRY_FMT_V3 = '!iiHIIII'
+  ''' @ivar: packet format description of an entry of version 3 '''
+  HEARTBEAT_ENTRIES = 20
+  ''' @ivar: the maximal count of entries in one heartbeat message of version 3 '''
+  ECHO_FMT = '!cBIdHH'
+  '''
+  @ivar: packet format description of the echo messages, sent only to the discoverer with version 2:
+    one character 'Q' for echo request or 'P' for echo reply
+    unsigned char: version of the hearbeat message
+    unsigned int: sequence number of the request
+    double: send time of the request, copied into the reply
+    unsigned short: the port number of the RPC Server of the sender
+    unsigned short: the port number of the RPC Server of the receiver
+  '''
+  ECHO_REQUEST = 'Q'
+  ECHO_REPLY = 'P'
+  DIGEST_LIST_FMT = '!cBBBHH'
+  '''
+  @ivar: packet format description of the header of the digest lists sent by the relays:
+    one character 'L'
+    unsigned char: version of the hearbeat message
+    unsigned char: rate of the digest lists in HZ*10
+    unsigned char: scope of the list: L{RELAY_SCOPE_SEGMENT} or L{RELAY_SCOPE_REMOTE}
+    unsigned short: the port number of the RPC Server of the relay
+    unsigned short: the count of the following entries, see L{DIGEST_ENTRY_FMT}
+  '''
+  DIGEST_ENTRY_FMT = '!B16sHHiiIII'
+  '''
+  @ivar: packet format description of an entry of the digest lists:
+    unsigned char: the IP version of the address (4 or 6)
+    16 bytes: the packed IP address of the discoverer, IPv4 uses the first 4 bytes
+    unsigned short: the port number, the heartbeats of the discoverer are sent from
+    unsigned short: the port number of the RPC Server of the discoverer
+    int: secs of the ROS Master state
+    int: nsecs of the ROS Master state
+    unsigned int: digest of the nodes (0 if unknown)
+    unsigned int: digest of the topics (0 if unknown)
+    unsigned int: digest of the services (0 if unknown)
+  '''
+  DIGEST_LIST = 'L'
+  RELAY_SCOPE_SEGMENT = 0
+  ''' @ivar: the digest list contains the masters of the segment of the relay and is sent to the other relays '''
+  RELAY_SCOPE_REMOTE = 1
+  ''' @ivar: the digest list contains the masters of the remote segments and is sent by the relay to its segment '''
+  DIGEST_LIST_ENTRIES = 20
+  ''' @ivar: the maximal count of entries in one digest list message, to keep the messages in the receive buffer '''
   HEARTBEAT_HZ = 2
   ''' @ivar: the send rate of the heartbeat packets in hz (Default: 2 Hz)'''
+  HEARTBEAT_ADAPTIVE = False
+  ''' @ivar: adapt the send rate of the heartbeats: on change of the ROS master 
+  state L{HEARTBEAT_BURST} heartbeats are sent immediately and the rate is set to 
+  L{HEARTBEAT_HZ}, while the state is stable, the rate decays down to 
+  L{HEARTBEAT_MIN_HZ} (Default: False)'''
+  HEARTBEAT_MIN_HZ = 0.2
+  ''' @ivar: the lowest heartbeat rate in adaptive mode (Default: 0.2 Hz)'''
+  HEARTBEAT_DECAY = 0.9
+  ''' @ivar: the factor applied to the heartbeat rate after each heartbeat in adaptive mode (Default: 0.9)'''
+  HEARTBEAT_BURST = 3
+  ''' @ivar: the count of heartbeats sent on change of the ROS master state in adaptive mode (Default: 3)'''
+  HEARTBEAT_BURST_INTERVAL = 0.05
+  ''' @ivar: the time in seconds between the heartbeats sent on change (Default: 0.05 sec)'''
   MEASUREMENT_INTERVALS = 5
   ''' @ivar: the count of intervals (1 sec) used for a quality calculation. If 
   HEARTBEAT_HZ is smaller then 1, MEASUREMENT_INTERVALS will be divided by HEARTBEAT_HZ value. 
@@ -213,6 +611,38 @@ class Discoverer(threading.Thread):
   ''' @ivar: the test rate of ROS master state in Hz (Default: 1 Hz). '''
   REMOVE_AFTER = 300
   ''' @ivar: remove an offline host after this time in [sec] (Default: 300 sec). '''
+  PHI_THRESHOLD = 0.
+  ''' @ivar: the suspicion level of the phi-accrual failure detector to set a 
+  master offline. 0 disables the detector, then only the timeout defined by 
+  TIMEOUT_FACTOR is used, which is also active with the detector (Default: 0, typical: 8). '''
+  PHI_MIN_STD = 0.05
+  ''' @ivar: the minimal standard deviation of the heartbeat inter-arrival times in seconds used by the failure detector (Default: 0.05 sec). '''
+  PHI_CHECK_HZ = 10.
+  ''' @ivar: the rate of the failure detection, if the PHI_THRESHOLD is enabled (Default: 10 Hz). '''
+  RTT_PROBE_HZ = 0.
+  ''' @ivar: the rate of the echo requests to measure the round-trip time to the other discoverer, 0 disables the measurement (Default: 0 Hz). '''
+  RETRIEVE_WORKERS = 4
+  ''' @ivar: the count of threads to request the information about the discovered masters (Default: 4). '''
+  RETRIEVE_BACKOFF_MAX = 60.
+  ''' @ivar: the maximal delay in seconds between two failed requests for the information about a discovered master (Default: 60 sec). '''
+  RELAY = False
+  ''' @ivar: the relay mode: the masters of the local segment are forwarded as 
+  digest list to the relays given by C{~relay_peers} and the masters reported 
+  by the other relays are forwarded to the local multicast group. The contacts 
+  of the remote masters are answered from the cache of the relays (Default: False). '''
+  RELAY_HZ = 1.
+  ''' @ivar: the maximal rate of the digest lists sent by a relay together with the heartbeats (Default: 1 Hz). '''
+  PEER_CACHE = ''
+  ''' @ivar: the file to store the known discoverer periodically and on shutdown. 
+  On start the stored discoverer are requested at once as unconfirmed masters, 
+  before their heartbeats are received. An empty string disables the cache (Default: ''). '''
+  PEER_CACHE_INTERVAL = 30.
+  ''' @ivar: the interval in seconds to store the known discoverer to the L{PEER_CACHE} (Default: 30 sec). '''
+  PEER_CACHE_MAX_AGE = 3600.
+  ''' @ivar: the discoverer without heartbeats since this time in seconds are not loaded from the L{PEER_CACHE} (Default: 3600 sec). '''
+  CHANGES_BATCH_WINDOW = 0.1
+  ''' @ivar: the time in seconds to coalesce the changes of the masters published 
+  as one message on C{~changes_batch}, 0 disables the topic (Default: 0.1 sec). '''
   
   def __init__(self, mcast_port, mcast_group, monitor_port):
     '''
@@ -226,7 +656,7 @@ class Discoverer(threading.Thread):
     '''
     threading.Thread.__init__(self)
     self.do_finish = False
-    self.__lock = threading.RLock()
+    self._lock = threading.RLock()
     # the list with all ROS master neighbors
     self.masters = dict() # (ip, DiscoveredMaster)
     
@@ -235,21 +665,80 @@ class Discoverer(threading.Thread):
       Discoverer.ROSMASTER_HZ = rospy.get_param('~rosmaster_hz')
     if rospy.has_param('~heartbeat_hz'):
       Discoverer.HEARTBEAT_HZ = rospy.get_param('~heartbeat_hz')
+    if rospy.has_param('~heartbeat_adaptive'):
+      Discoverer.HEARTBEAT_ADAPTIVE = rospy.get_param('~heartbeat_adaptive')
+    if rospy.has_param('~heartbeat_min_hz'):
+      Discoverer.HEARTBEAT_MIN_HZ = max(0.1, rospy.get_param('~heartbeat_min_hz'))
+    if rospy.has_param('~heartbeat_burst'):
+      Discoverer.HEARTBEAT_BURST = max(1, rospy.get_param('~heartbeat_burst'))
     if rospy.has_param('~measurement_intervals'):
       Discoverer.MEASUREMENT_INTERVALS = rospy.get_param('~measurement_intervals')
     if rospy.has_param('~timeout_factor'):
       Discoverer.TIMEOUT_FACTOR = rospy.get_param('~timeout_factor')
     if rospy.has_param('~remove_after'):
       Discoverer.REMOVE_AFTER = rospy.get_param('~remove_after')
+    if rospy.has_param('~phi_threshold'):
+      Discoverer.PHI_THRESHOLD = rospy.get_param('~phi_threshold')
+    if rospy.has_param('~phi_min_std'):
+      Discoverer.PHI_MIN_STD = rospy.get_param('~phi_min_std')
+    if rospy.has_param('~phi_check_hz'):
+      Discoverer.PHI_CHECK_HZ = rospy.get_param('~phi_check_hz')
+    if rospy.has_param('~rtt_probe_hz'):
+      Discoverer.RTT_PROBE_HZ = rospy.get_param('~rtt_probe_hz')
+    if rospy.has_param('~retrieve_workers'):
+      Discoverer.RETRIEVE_WORKERS = max(1, rospy.get_param('~retrieve_workers'))
+    if rospy.has_param('~retrieve_backoff_max'):
+      Discoverer.RETRIEVE_BACKOFF_MAX = rospy.get_param('~retrieve_backoff_max')
     if rospy.has_param('~static_hosts'):
       self.static_hosts[len(self.static_hosts):] = rospy.get_param('~static_hosts')
+    self.relay_peers = []
+    if rospy.has_param('~relay'):
+      Discoverer.RELAY = rospy.get_param('~relay')
+    if rospy.has_param('~relay_hz'):
+      Discoverer.RELAY_HZ = max(0.1, rospy.get_param('~relay_hz'))
+    if rospy.has_param('~changes_batch_window'):
+      Discoverer.CHANGES_BATCH_WINDOW = rospy.get_param('~changes_batch_window')
+    if rospy.has_param('~relay_peers'):
+      self.relay_peers[len(self.relay_peers):] = rospy.get_param('~relay_peers')
+    if rospy.has_param('~peer_cache'):
+      Discoverer.PEER_CACHE = os.path.expanduser(rospy.get_param('~peer_cache'))
+    if rospy.has_param('~peer_cache_interval'):
+      Discoverer.PEER_CACHE_INTERVAL = rospy.get_param('~peer_cache_interval')
+    if rospy.has_param('~peer_cache_max_age'):
+      Discoverer.PEER_CACHE_MAX_AGE = rospy.get_param('~peer_cache_max_age')
+    self.local_masters = []
+    if rospy.has_param('~local_masters'):
+      self.local_masters[len(self.local_masters):] = rospy.get_param('~local_masters')
 
     rospy.loginfo("Static hosts: " + str(self.static_hosts))
+    if Discoverer.RELAY:
+      rospy.loginfo("Relay peers: " + str(self.relay_peers))
 
     self.current_check_hz = Discoverer.HEARTBEAT_HZ
+    self.current_heartbeat_hz = Discoverer.HEARTBEAT_HZ
+    '''@ivar: the current heartbeat rate, changed in adaptive mode'''
+    self._state_changed_event = threading.Event()
+    self._state_summary = dict()
+    '''@ivar: the timestamp, digests and size of the current state of each local ROS master sent with heartbeats of version 2 C{{rpc port: (timestamp, digests, size)}}'''
+    self._echo_seq = 0
+    self._last_echo_ts = 0
+    self._last_relay_ts = 0
+    self._mcast_version = 1
+    '''@ivar: the version of the heartbeats sent to the multicast group'''
+    self._static_host_addresses = dict()
+    '''@ivar: the resolved addresses of the static hosts C{{host: set(ip)}}'''
+    self._last_peer_cache_ts = time.time()
     # initialize the ROS publishers
     self.pubchanges = rospy.Publisher("~changes", MasterState)
+    self.pubchanges_batch = rospy.Publisher("~changes_batch", MasterStatesStamped)
+    self._pending_lock = threading.Lock()
+    self._pending_changes = []
+    '''@ivar: the changes to publish on C{~changes_batch} after the L{CHANGES_BATCH_WINDOW}'''
+    self._pending_index = dict()
+    '''@ivar: the index of the last pending change for each master name'''
     self.pubstats = rospy.Publisher("~linkstats", LinkStatesStamped)
+    self.pubstats_ext = rospy.Publisher("~linkstats_ext", LinkStatesExtStamped)
+    self.pubdiagnostics = None
     # initialize the ROS services
     rospy.Service('~list_masters', DiscoverMasters, self.rosservice_list_masters)
 
@@ -268,13 +757,43 @@ class Discoverer(threading.Thread):
 #    if not msocket.hasEnabledMulticastIface():
 #      sys.exit("No enabled multicast interfaces available!\nAdd multicast support e.g. sudo ifconfig eth0 multicast")
 #
+    # create the monitor of the ROS master state
+    self.master_monitor = MasterMonitor(monitor_port)
+    self.master_monitors = [self.master_monitor]
+    '''@ivar: the monitors of the ROS master of this node and of the other local 
+    ROS masters given by C{~local_masters}, which are served by this discoverer 
+    with the following port numbers of the RPC server.'''
+    for idx, masteruri in enumerate(self.local_masters):
+      rospy.loginfo("Monitor local ROS master %s", masteruri)
+      self.master_monitors.append(MasterMonitor(monitor_port + idx + 1, masteruri))
+    for monitor in self.master_monitors:
+      if Discoverer.RELAY:
+        monitor.setContactsResolver(self.getRelayedContacts)
+      monitor.addStatsSource('retrieval', self.retrievalMetrics)
+    if MasterMonitor.DIAGNOSTICS:
+      self.pubdiagnostics = rospy.Publisher("~diagnostics", DiagnosticArray)
+    self._check_try_count = dict()
+    self._retrieval_pool = None
+    self._startEngine()
+    if Discoverer.PEER_CACHE:
+      self._loadPeerCache()
+    # set the callback to finish all running threads
+    rospy.on_shutdown(self.finish)
+
+  def _startEngine(self):
+    '''
+    Creates the threads to receive the multicast messages, to monitor the ROS 
+    master state, the pool to request the information about the discovered 
+    masters and the timer for the link statistics. The heartbeats are sent by 
+    the thread of the discoverer itself, see L{run()}.
+    '''
+    self._retrieval_pool = RetrievalPool(Discoverer.RETRIEVE_WORKERS, backoff_max=Discoverer.RETRIEVE_BACKOFF_MAX)
     # create a thread to handle the received multicast messages
     self._recvThread = threading.Thread(target = self.recv_loop)
     self._recvThread.setDaemon(True)
     self._recvThread.start()
     
     # create a thread to monitor the ROS master state
-    self.master_monitor = MasterMonitor(monitor_port)
     self._masterMonitorThread = threading.Thread(target = self.checkROSMaster_loop)
     self._masterMonitorThread.setDaemon(True)
     self._masterMonitorThread.start()
@@ -285,8 +804,10 @@ class Discoverer(threading.Thread):
       self._statsTimer.start()
     except:
       rospy.logwarn("ROS Timer is not available! Statistic calculation and timeouts are deactivated!")
-    # set the callback to finish all running threads
-    rospy.on_shutdown(self.finish)
+    # create a timer for the failure detection with a higher rate than the statistics
+    if Discoverer.PHI_THRESHOLD > 0:
+      self._failureTimer = threading.Timer(1.0/Discoverer.PHI_CHECK_HZ, self.timed_failure_detection)
+      self._failureTimer.start()
 
   def _init_mcast_socket(self, doexit_on_error=False):
     rospy.loginfo("Init multicast socket")
@@ -301,12 +822,17 @@ class Discoverer(threading.Thread):
     Callback called on exit of the ros node to publish the empty list of 
     ROSMasters.
     '''
+    if Discoverer.PEER_CACHE:
+      self._savePeerCache()
     # publish all master as removed
-    self.__lock.acquire(True)
+    self._lock.acquire(True)
     # tell other loops to finish
     self.do_finish = True
     # finish the RPC server and timer
-    self.master_monitor.shutdown()
+    for monitor in self.master_monitors:
+      monitor.shutdown()
+    if not self._retrieval_pool is None:
+      self._retrieval_pool.shutdown()
     for (k, v) in self.masters.iteritems():
       if not v.mastername is None:
         self.publish_masterstate(MasterState(MasterState.STATE_REMOVED, 
@@ -316,11 +842,17 @@ class Discoverer(threading.Thread):
                                                  v.online, 
                                                  v.discoverername, 
                                                  v.monitoruri)))
-    self.__lock.release()
+    self._lock.release()
+    # publish the removed masters at once
+    self._flushChanges()
     try:
       self._statsTimer.cancel()
     except:
       pass
+    try:
+      self._failureTimer.cancel()
+    except:
+      pass
 
   def run(self):
     '''
@@ -329,78 +861,443 @@ class Discoverer(threading.Thread):
     nodes associated with ROS master.
     '''
     while (not rospy.is_shutdown()) and not self.do_finish:
-      if not self.master_monitor.getMasteruri() is None:
-        t = 0
-        if not self.master_monitor.getCurrentState() is None:
-          t = self.master_monitor.getCurrentState().timestamp
-        msg = struct.pack(Discoverer.HEARTBEAT_FMT,'R', Discoverer.VERSION, int(Discoverer.HEARTBEAT_HZ*10), int(t), int((t-(int(t))) * 1000000000), self.master_monitor.rpcport)
-        try:
-          self.msocket.send2group(msg)
-          for a in self.static_hosts:
-            try:
-              self.msocket.send2addr(msg, a)
-            except socket.gaierror as e:
-              rospy.logwarn("send to static host: " + str(a) + " failed: " + str(e))
-        except Exception as e:
-          rospy.logwarn(e)
-          self._init_mcast_socket()
-      time.sleep(1.0/Discoverer.HEARTBEAT_HZ)
-    msg = struct.pack(Discoverer.HEARTBEAT_FMT,'R', Discoverer.VERSION, int(Discoverer.HEARTBEAT_HZ*10), -1, -1, self.master_monitor.rpcport)
-    self.msocket.send2group(msg)
-    for a in self.static_hosts:
-      rospy.loginfo("send Discoverer.HEARTBEAT_FMT to static host: " + str(a))
-      self.msocket.send2addr(msg, a)
+      if self._state_changed_event.is_set():
+        # send the heartbeats redundant on change
+        self._state_changed_event.clear()
+        for i in range(Discoverer.HEARTBEAT_BURST):
+          if i > 0:
+            time.sleep(Discoverer.HEARTBEAT_BURST_INTERVAL)
+          self._sendHeartbeat()
+      else:
+        self._sendHeartbeat()
+      # the event is set only in adaptive mode
+      self._state_changed_event.wait(self._nextHeartbeatPeriod())
+    self._sendFinalHeartbeat()
+
+  def _nextHeartbeatPeriod(self):
+    '''
+    Returns the time until the next heartbeat. The period matches the rate 
+    advertised in the just sent heartbeat. In adaptive mode the heartbeat rate 
+    decays afterwards by L{HEARTBEAT_DECAY} down to L{HEARTBEAT_MIN_HZ} for the 
+    next heartbeat. The rate is rounded down to the resolution of the 
+    heartbeat message (0.1 Hz).
+    @rtype: C{float}
+    '''
+    period = 1.0/self.current_heartbeat_hz
+    if Discoverer.HEARTBEAT_ADAPTIVE:
+      # round down, otherwise the rate can stay above the minimum
+      rate = math.floor(self.current_heartbeat_hz * Discoverer.HEARTBEAT_DECAY * 10 + 1e-6) / 10.
+      self.current_heartbeat_hz = max(0.1, Discoverer.HEARTBEAT_MIN_HZ, rate)
+    return period
+
+  def _notifyStateChanged(self):
+    '''
+    Resets the heartbeat rate and wakes up the sending of the heartbeats in 
+    adaptive mode. Called on changes of the ROS master state.
+    '''
+    if Discoverer.HEARTBEAT_ADAPTIVE:
+      self.current_heartbeat_hz = Discoverer.HEARTBEAT_HZ
+      self._state_changed_event.set()
+
+  def _sendHeartbeat(self):
+    '''
+    Sends the heartbeat message to the multicast group and the static hosts and
+    the echo requests, if they are due.
+    '''
+    try:
+      sent = self._sendHeartbeatMessages()
+    except Exception as e:
+      rospy.logwarn(e)
+      self._init_mcast_socket()
+      sent = True
+    if sent:
+      if Discoverer.RTT_PROBE_HZ > 0 and time.time() - self._last_echo_ts >= 1.0/Discoverer.RTT_PROBE_HZ:
+        self._last_echo_ts = time.time()
+        self._sendEchoRequests()
+      # tolerate the half heartbeat period, otherwise a heartbeat is skipped on equal rates
+      if Discoverer.RELAY and time.time() - self._last_relay_ts + 0.5/self.current_heartbeat_hz >= 1.0/Discoverer.RELAY_HZ:
+        self._last_relay_ts = time.time()
+        self._sendDigestLists()
+
+  def _sendFinalHeartbeat(self):
+    '''
+    Sends the heartbeat message signaling the shutdown and closes the socket.
+    '''
+    self._sendHeartbeatMessages(True)
     self.msocket.close()
 
+  def _sendHeartbeatMessages(self, final=False):
+    '''
+    Sends the heartbeat messages to the multicast group in the version supported 
+    by all known discoverer and to each static host in the version received 
+    from this host.
+    @param final: send the messages signaling the shutdown
+    @type final: C{bool}
+    @return: C{False}, if no local ROS master is available
+    @rtype: C{bool}
+    '''
+    version = self._heartbeatVersion()
+    if version != self._mcast_version:
+      self._logHeartbeatVersion(version)
+    msgs = {version: self._createHeartbeats(final, version)}
+    if not msgs[version]:
+      return False
+    for msg in msgs[version]:
+      self.msocket.send2group(msg)
+    for a in self.static_hosts:
+      host_version = self._heartbeatVersion(self._staticHostAddresses(a))
+      if not msgs.has_key(host_version):
+        msgs[host_version] = self._createHeartbeats(final, host_version)
+      try:
+        for msg in msgs[host_version]:
+          self.msocket.send2addr(msg, a)
+      except socket.gaierror as e:
+        rospy.logwarn("send to static host: " + str(a) + " failed: " + str(e))
+    return True
+
+  def _heartbeatVersion(self, addresses=None):
+    '''
+    Returns the version of the heartbeat messages to send: the lowest version
+    received from the known discoverer, but not newer than L{VERSION}. If no 
+    discoverer is known, the version 1 is used.
+    @param addresses: consider only the discoverer with these IP addresses, 
+    C{None} considers all discoverer
+    @type addresses: C{set(str)} or C{None}
+    @rtype: C{int}
+    '''
+    with self._lock:
+      versions = [m.version for (address, monitor_port), m in self.masters.iteritems() 
+                  if m.relay_uri is None and not m.unconfirmed and (addresses is None or address[0] in addresses)]
+    if not versions:
+      return 1
+    return min(versions + [Discoverer.VERSION])
+
+  def _logHeartbeatVersion(self, version):
+    '''
+    Logs the change of the version of the heartbeats sent to the multicast group 
+    together with the discoverer, which limit the version.
+    @param version: the new version
+    @type version: C{int}
+    '''
+    with self._lock:
+      limiting = [m.monitoruri for m in self.masters.itervalues() 
+                  if m.relay_uri is None and not m.unconfirmed and m.version == version]
+    if version < self._mcast_version:
+      rospy.logwarn("Send heartbeats of version %d to the multicast group, supported by: %s", version, ', '.join(limiting))
+    else:
+      rospy.loginfo("Send heartbeats of version %d to the multicast group", version)
+    self._mcast_version = version
+
+  def _staticHostAddresses(self, host):
+    '''
+    Returns the IP addresses of the static host, resolved on first call.
+    @param host: the name or the address of the static host
+    @type host: C{str}
+    @rtype: C{set(str)}
+    '''
+    if not self._static_host_addresses.has_key(host):
+      try:
+        self._static_host_addresses[host] = set([ai[4][0] for ai in socket.getaddrinfo(host, None)])
+      except socket.gaierror as e:
+        rospy.logdebug("resolve static host %s failed: %s", host, str(e))
+        return set()
+    return self._static_host_addresses[host]
+
+  def _announceVersion(self, master_key):
+    '''
+    Sends the heartbeats of the newest version by unicast to the discoverer, 
+    which sends an older version, to announce the own version. Each 
+    discoverer is probed only once.
+    @param master_key: the key of the discovered master C{((ip, port), monitor port)}
+    '''
+    with self._lock:
+      master = self.masters.get(master_key, None)
+      if (master is None or master.version >= Discoverer.VERSION or not master.relay_uri is None or
+          master.version_probed):
+        return
+      master.version_probed = True
+    try:
+      for msg in self._createHeartbeats(version=Discoverer.VERSION):
+        self.msocket.sendto(msg, master_key[0])
+    except socket.error, e:
+      rospy.logdebug("send heartbeat of version %d to %s failed: %s", Discoverer.VERSION, str(master_key[0]), str(e))
+
+  def _createHeartbeats(self, final=False, version=None):
+    '''
+    Creates the heartbeat messages for the current states of the local ROS 
+    masters. Version 3 combines all local ROS masters in one message.
+    @param final: create the messages signaling the shutdown
+    @type final: C{bool}
+    @param version: the version of the messages, C{None} uses the version 
+    supported by all known discoverer
+    @type version: C{int} or C{None}
+    @rtype: C{[str]}
+    '''
+    rate = min(255, int(round(self.current_heartbeat_hz*10)))
+    if version is None:
+      version = self._heartbeatVersion()
+    entries = []
+    for monitor in self.master_monitors:
+      try:
+        if monitor.getMasteruri() is None:
+          continue
+      except Exception as e:
+        rospy.logdebug("ROS master %s not available: %s", str(monitor.rpcport), str(e))
+        continue
+      timestamp = -1
+      if not final:
+        state = monitor.getCurrentState()
+        timestamp = state.timestamp if not state is None else 0
+      secs = int(timestamp)
+      nsecs = -1 if timestamp == -1 else int((timestamp - secs) * 1000000000)
+      state_ts, digests, size = self._state_summary.get(monitor.rpcport, (None, (0, 0, 0), 0))
+      if state_ts != timestamp:
+        digests, size = (0, 0, 0), 0
+      entries.append((secs, nsecs, monitor.rpcport, digests[0], digests[1], digests[2], size))
+    if version < 2:
+      return [struct.pack(Discoverer.HEARTBEAT_FMT, 'R', 1, rate, secs, nsecs, port) 
+              for (secs, nsecs, port, d_nodes, d_topics, d_services, size) in entries]
+    if version < 3:
+      return [struct.pack(Discoverer.HEARTBEAT_FMT_V2, 'R', 2, rate, *entry) for entry in entries]
+    result = []
+    for i in range(0, len(entries), Discoverer.HEARTBEAT_ENTRIES):
+      chunk = entries[i:i+Discoverer.HEARTBEAT_ENTRIES]
+      packed = [struct.pack(Discoverer.HEARTBEAT_FMT_V3, 'R', 3, rate, len(chunk))]
+      packed.extend([struct.pack(Discoverer.HEARTBEAT_ENTRY_FMT_V3, *entry) for entry in chunk])
+      result.append(''.join(packed))
+    return result
+
+  def _updateStateSummary(self):
+    '''
+    Calculates the digests and the size of the current state of each local ROS
+    master for the heartbeat messages of version 2.
+    '''
+    for monitor in self.master_monitors:
+      state = monitor.getCurrentState()
+      if state is None:
+        self._state_summary[monitor.rpcport] = (None, (0, 0, 0), 0)
+        continue
+      digests = state.digests
+      folded = tuple([(digests[kind] ^ (digests[kind] >> 32)) & 0xffffffff for kind in ('nodes', 'topics', 'services')])
+      self._state_summary[monitor.rpcport] = (state.timestamp, folded, min(monitor.getStateSize(), 0xffffffff))
+
+  def _sendEchoRequests(self):
+    '''
+    Sends an echo request by unicast to each online discoverer supporting the 
+    version 2 of the heartbeat messages.
+    '''
+    self._echo_seq = (self._echo_seq + 1) % 0xffffffff
+    with self._lock:
+      receivers = [(address, monitor_port) for (address, monitor_port), v in self.masters.iteritems() 
+                   if v.online and v.version >= 2 and v.relay_uri is None]
+    for address, monitor_port in receivers:
+      msg = struct.pack(Discoverer.ECHO_FMT, Discoverer.ECHO_REQUEST, 2, self._echo_seq, time.time(), 
+                        self.master_monitor.rpcport, monitor_port)
+      try:
+        self.msocket.sendto(msg, address)
+      except socket.error, e:
+        rospy.logdebug("send echo request to %s failed: %s", str(address), str(e))
+
+  def _handleEcho(self, msg, address):
+    '''
+    Answers the echo requests and adds the round-trip time of the echo replies
+    to the corresponding master.
+    @param msg: the received echo message, see L{ECHO_FMT}
+    @type msg: C{str}
+    @param address: the address of the sender
+    '''
+    (kind, version, seq, stamp, sender_port, receiver_port) = struct.unpack(Discoverer.ECHO_FMT, msg)
+    if not receiver_port in [monitor.rpcport for monitor in self.master_monitors]:
+      # addressed to another discoverer on the same host
+      return
+    if kind == Discoverer.ECHO_REQUEST:
+      reply = struct.pack(Discoverer.ECHO_FMT, Discoverer.ECHO_REPLY, 2, seq, stamp, 
+                          receiver_port, sender_port)
+      self.msocket.sendto(reply, address)
+    else:
+      with self._lock:
+        master = self.masters.get((address, sender_port), None)
+        if not master is None:
+          master.addEchoReply(seq, time.time() - stamp)
+
+  def _sendDigestLists(self):
+    '''
+    Sends in relay mode the digest lists of the online masters in the local 
+    segment to the other relays and the digest lists of the online masters in 
+    the remote segments to the local multicast group.
+    '''
+    rate = max(1, min(255, int(round(min(Discoverer.RELAY_HZ, self.current_heartbeat_hz)*10))))
+    with self._lock:
+      local = [(k, v) for k, v in self.masters.iteritems() if v.online and not v.mastername is None and v.relay_uri is None]
+      remote = [(k, v) for k, v in self.masters.iteritems() if v.online and not v.mastername is None and not v.relay_uri is None]
+    for msg in self._createDigestLists(local, Discoverer.RELAY_SCOPE_SEGMENT, rate):
+      for a in self.relay_peers:
+        try:
+          self.msocket.send2addr(msg, a)
+        except socket.gaierror as e:
+          rospy.logwarn("send to relay peer: " + str(a) + " failed: " + str(e))
+    for msg in self._createDigestLists(remote, Discoverer.RELAY_SCOPE_REMOTE, rate):
+      self.msocket.send2group(msg)
+
+  def _createDigestLists(self, masters, scope, rate):
+    '''
+    Creates the digest list messages for the given masters, each with at most 
+    L{DIGEST_LIST_ENTRIES} entries.
+    @param masters: the list with keys and masters
+    @type masters: C{[((address, monitor_port), L{DiscoveredMaster})]}
+    @param scope: the scope of the list
+    @type scope: L{RELAY_SCOPE_SEGMENT} or L{RELAY_SCOPE_REMOTE}
+    @param rate: the rate of the digest lists in HZ*10
+    @type rate: C{int}
+    @rtype: C{[str]}
+    '''
+    entries = []
+    for ((address, monitor_port), v) in masters:
+      try:
+        packed = socket.inet_pton(socket.AF_INET, address[0])
+        family = 4
+      except socket.error:
+        packed = socket.inet_pton(socket.AF_INET6, address[0])
+        family = 6
+      secs = int(v.timestamp)
+      nsecs = int((v.timestamp - secs) * 1000000000)
+      digests = v.digests if not v.digests is None else (0, 0, 0)
+      entries.append(struct.pack(Discoverer.DIGEST_ENTRY_FMT, family, packed, address[1], monitor_port, secs, nsecs,
+                                 digests[0], digests[1], digests[2]))
+    result = []
+    for i in range(0, len(entries), Discoverer.DIGEST_LIST_ENTRIES):
+      chunk = entries[i:i+Discoverer.DIGEST_LIST_ENTRIES]
+      header = struct.pack(Discoverer.DIGEST_LIST_FMT, Discoverer.DIGEST_LIST, Discoverer.VERSION, rate, scope,
+                           self.master_monitor.rpcport, len(chunk))
+      result.append(''.join([header] + chunk))
+    return result
+
+  def _handleDigestList(self, msg, address):
+    '''
+    Adds the masters of a received digest list. The relays accept only the 
+    lists of the other relays, all other discoverer only the lists forwarded 
+    by the relay to their segment. Masters with direct heartbeats are skipped.
+    @param msg: the received digest list, see L{DIGEST_LIST_FMT}
+    @type msg: C{str}
+    @param address: the address of the relay
+    '''
+    header_size = struct.calcsize(Discoverer.DIGEST_LIST_FMT)
+    entry_size = struct.calcsize(Discoverer.DIGEST_ENTRY_FMT)
+    (l, version, rate, scope, relay_port, count) = struct.unpack(Discoverer.DIGEST_LIST_FMT, msg[:header_size])
+    if scope != (Discoverer.RELAY_SCOPE_SEGMENT if Discoverer.RELAY else Discoverer.RELAY_SCOPE_REMOTE):
+      return
+    if len(msg) != header_size + count * entry_size:
+      raise Exception(' '.join(["wrong size", str(len(msg)), "of the digest list with", str(count), "entries"]))
+    relay_uri = ''.join(['http://', address[0], ':', str(relay_port)])
+    with self._lock:
+      for i in range(count):
+        (family, packed, origin_port, monitor_port, secs, nsecs, d_nodes, d_topics, d_services) = struct.unpack_from(Discoverer.DIGEST_ENTRY_FMT, msg, header_size + i * entry_size)
+        if family == 4:
+          ip = socket.inet_ntop(socket.AF_INET, packed[:4])
+        else:
+          ip = socket.inet_ntop(socket.AF_INET6, packed)
+        # use the key of the heartbeats sent by the remote discoverer
+        master_key = ((ip, origin_port), monitor_port)
+        timestamp = float(secs)+float(nsecs)/1000000000.0
+        digests = (d_nodes, d_topics, d_services) if (d_nodes, d_topics, d_services) != (0, 0, 0) else None
+        master = self.masters.get(master_key, None)
+        if master is None:
+          self.masters[master_key] = self._createMaster(monitoruri=''.join(['http://', ip, ':', str(monitor_port)]),
+                                                        heartbeat_rate=float(rate)/10.0,
+                                                        timestamp=timestamp,
+                                                        version=version,
+                                                        digests=digests,
+                                                        state_size=None,
+                                                        relay_uri=relay_uri)
+        elif not master.relay_uri is None:
+          master.relay_uri = relay_uri
+          master.addHeartbeat(timestamp, float(rate)/10.0, version, digests)
+
+  def getRelayedContacts(self, monitoruri):
+    '''
+    Answers in relay mode the C{masterContacts()} requests for the given master 
+    from the cache, see L{MasterMonitor.setContactsResolver()}.
+    @param monitoruri: the URI of the RPC server of the requested master
+    @type monitoruri: C{str}
+    @return: the contacts like C{masterContacts()} or C{None}, if the master is not known
+    @rtype: C{(str, str, str, str, str)} or C{None}
+    '''
+    with self._lock:
+      for v in self.masters.itervalues():
+        if v.monitoruri == monitoruri and not v.mastername is None:
+          return (repr(v.timestamp), str(v.masteruri), str(v.mastername), str(v.discoverername), v.monitoruri)
+    return None
+
   def checkROSMaster_loop(self):
     '''
     The method test periodically the state of the ROS master. The new state will
     be published as heartbeat messages.
     '''
-    import os
-    try_count = 0
     while (not rospy.is_shutdown()) and not self.do_finish:
+      self._checkROSMaster()
+      self._removeOfflineMasters()
+#      print "update rate", self.current_check_hz
+      time.sleep(1.0/self.current_check_hz)
+
+  def _checkROSMaster(self):
+    '''
+    Checks once the state of the local ROS masters and adapts the check rate to 
+    the used CPU time.
+    '''
+    import os
+    cputimes = os.times()
+    cputime_init = cputimes[0] + cputimes[1]
+    changed = False
+    for monitor in self.master_monitors:
       try:
-        cputimes = os.times()
-        cputime_init = cputimes[0] + cputimes[1]
-        if self.master_monitor.checkState():
-          # publish the new state ?
-          pass
-        # adapt the check rate to the CPU usage time
-        cputimes = os.times()
-        cputime = cputimes[0] + cputimes[1] - cputime_init
-        if self.current_check_hz*cputime > 0.20:
-          self.current_check_hz = float(self.current_check_hz)/2.0
-        elif self.current_check_hz*cputime < 0.10 and self.current_check_hz < Discoverer.HEARTBEAT_HZ:
-          self.current_check_hz = float(self.current_check_hz)*2.0
-#        print "self.current_check_hz:", self.current_check_hz
-        try_count = 0
+        if monitor.checkState():
+          changed = True
+        self._check_try_count[monitor.rpcport] = 0
       except MasterConnectionException, e:
-        try_count = try_count + 1
-        if try_count == 5:
+        count = self._check_try_count.get(monitor.rpcport, 0) + 1
+        self._check_try_count[monitor.rpcport] = count
+        if count == 5:
           rospy.logerr("Communication with ROS Master failed: %s", e)
-#          rospy.signal_shutdown("ROS Master not reachable")
-#          time.sleep(3)
-      # remove offline hosts
-      self.__lock.acquire(True)
-      current_time = time.time()
-      to_remove = []
-      for (k, v) in self.masters.iteritems():
-        if Discoverer.REMOVE_AFTER > 0 and current_time - v.last_heartbeat_ts > Discoverer.REMOVE_AFTER:
-          to_remove.append(k)
-          if not v.mastername is None:
-            self.publish_masterstate(MasterState(MasterState.STATE_REMOVED, 
-                                           ROSMaster(str(v.mastername), 
-                                                     v.masteruri, 
-                                                     v.timestamp, 
-                                                     v.online, 
-                                                     v.discoverername, 
-                                                     v.monitoruri)))
-      for r in to_remove:
-        del self.masters[r]
-      self.__lock.release()
-#      print "update rate", self.current_check_hz
-      time.sleep(1.0/self.current_check_hz)
+#        rospy.signal_shutdown("ROS Master not reachable")
+#        time.sleep(3)
+    # adapt the check rate to the CPU usage time
+    cputimes = os.times()
+    cputime = cputimes[0] + cputimes[1] - cputime_init
+    if changed:
+      self._updateStateSummary()
+      self._notifyStateChanged()
+    if self.current_check_hz*cputime > 0.20:
+      self.current_check_hz = float(self.current_check_hz)/2.0
+    elif self.current_check_hz*cputime < 0.10 and self.current_check_hz < Discoverer.HEARTBEAT_HZ:
+      self.current_check_hz = float(self.current_check_hz)*2.0
+#    print "self.current_check_hz:", self.current_check_hz
+
+  def _removeOfflineMasters(self):
+    '''
+    Removes the masters without heartbeats since L{REMOVE_AFTER} seconds.
+    '''
+    self._lock.acquire(True)
+    current_time = time.time()
+    to_remove = []
+    for (k, v) in self.masters.iteritems():
+      timeout = Discoverer.REMOVE_AFTER
+      if v.unconfirmed:
+        # the masters loaded from the peer cache are removed without heartbeats
+        timeout = Discoverer.measurementDuration(v.heartbeat_rate) * Discoverer.TIMEOUT_FACTOR
+      if timeout > 0 and current_time - v.last_heartbeat_ts > timeout:
+        to_remove.append(k)
+        if not v.mastername is None:
+          self.publish_masterstate(MasterState(MasterState.STATE_REMOVED, 
+                                         ROSMaster(str(v.mastername), 
+                                                   v.masteruri, 
+                                                   v.timestamp, 
+                                                   v.online, 
+                                                   v.discoverername, 
+                                                   v.monitoruri)))
+    for r in to_remove:
+      self._forgetMaster(self.masters[r])
+      del self.masters[r]
+    self._lock.release()
 
   def recv_loop(self):
     '''
@@ -416,48 +1313,186 @@ class Discoverer(threading.Thread):
         import traceback
         rospy.logwarn("socket error: %s", traceback.format_exc())
       else:
-        try:
-          (version, msg_tuple) = self.msg2masterState(msg)
-          if (version == Discoverer.VERSION):
-            (r, version, rate, secs, nsecs, monitor_port) = msg_tuple
-            master_key = (address, monitor_port)
-            # remove master if sec and nsec are -1
-            if secs == -1:
-              self.__lock.acquire(True)
-              if self.masters.has_key(master_key):
-                master = self.masters[master_key]
-                if not master.mastername is None:
-                  self.publish_masterstate(MasterState(MasterState.STATE_REMOVED, 
-                                                 ROSMaster(str(master.mastername), 
-                                                           master.masteruri, 
-                                                           master.timestamp, 
-                                                           False, 
-                                                           master.discoverername, 
-                                                           master.monitoruri)))
-                del self.masters[master_key]
-              self.__lock.release()
-            # update the timestamp of existing master
-            elif self.masters.has_key(master_key):
-              self.__lock.acquire(True)
-              self.masters[master_key].addHeartbeat(float(secs)+float(nsecs)/1000000000.0, float(rate)/10.0)
-              self.__lock.release()
-            # or create a new master
-            else:
-#                print "create new masterstate", ''.join(['http://', address[0],':',str(monitor_port)])
-              self.__lock.acquire(True)
-              self.masters[master_key] = DiscoveredMaster(monitoruri=''.join(['http://', address[0],':',str(monitor_port)]), 
-                                                          heartbeat_rate=float(rate)/10.0,
-                                                          timestamp=float(secs)+float(nsecs)/1000000000.0,
-                                                          callback_master_state=self.publish_masterstate)
-              self.__lock.release()
-        except Exception, e:
-          rospy.logwarn("Error while decode message: %s", str(e))
+        self._handleMessage(msg, address)
+
+  def _handleMessage(self, msg, address):
+    '''
+    Handles a received heartbeat or echo message.
+    @param msg: the received message
+    @type msg: C{str}
+    @param address: the address of the sender
+    '''
+    try:
+      if msg[0] in [Discoverer.ECHO_REQUEST, Discoverer.ECHO_REPLY]:
+        self._handleEcho(msg, address)
+        return
+      if msg[0] == Discoverer.DIGEST_LIST:
+        self._handleDigestList(msg, address)
+        return
+      for (version, rate, secs, nsecs, monitor_port, digests, state_size) in self.msg2heartbeats(msg):
+        master_key = (address, monitor_port)
+        # remove master if sec and nsec are -1
+        if secs == -1:
+          self._lock.acquire(True)
+          if self.masters.has_key(master_key):
+            master = self.masters[master_key]
+            if not master.mastername is None:
+              self.publish_masterstate(MasterState(MasterState.STATE_REMOVED, 
+                                             ROSMaster(str(master.mastername), 
+                                                       master.masteruri, 
+                                                       master.timestamp, 
+                                                       False, 
+                                                       master.discoverername, 
+                                                       master.monitoruri)))
+            self._forgetMaster(master)
+            del self.masters[master_key]
+          self._lock.release()
+        # update the timestamp of existing master
+        elif self.masters.has_key(master_key):
+          self._lock.acquire(True)
+          # the heartbeats are received directly, the relay is not longer needed
+          self.masters[master_key].relay_uri = None
+          self.masters[master_key].addHeartbeat(float(secs)+float(nsecs)/1000000000.0, float(rate)/10.0,
+                                                version, digests, state_size)
+          self._lock.release()
+        # or create a new master
+        else:
+#            print "create new masterstate", ''.join(['http://', address[0],':',str(monitor_port)])
+          self._lock.acquire(True)
+          self.masters[master_key] = self._createMaster(monitoruri=''.join(['http://', address[0],':',str(monitor_port)]), 
+                                                        heartbeat_rate=float(rate)/10.0,
+                                                        timestamp=float(secs)+float(nsecs)/1000000000.0,
+                                                        version=version,
+                                                        digests=digests,
+                                                        state_size=state_size)
+          self._lock.release()
+        if secs != -1 and version < Discoverer.VERSION:
+          self._announceVersion(master_key)
+    except Exception, e:
+      rospy.logwarn("Error while decode message: %s", str(e))
+
+  def _createMaster(self, monitoruri, heartbeat_rate, timestamp, version, digests, state_size, relay_uri=None):
+    '''
+    Creates a new discovered master and adds it to the L{RetrievalPool} to 
+    retrieve the information about the ROS master.
+    @rtype: L{DiscoveredMaster}
+    '''
+    master = DiscoveredMaster(monitoruri=monitoruri, 
+                              heartbeat_rate=heartbeat_rate,
+                              timestamp=timestamp,
+                              callback_master_state=self.publish_masterstate,
+                              version=version,
+                              digests=digests,
+                              state_size=state_size,
+                              retrieve_thread=False,
+                              relay_uri=relay_uri)
+    self._retrieval_pool.add(master)
+    return master
+
+  def _forgetMaster(self, master):
+    '''
+    Called before the master is removed, stops the pending requests.
+    @type master: L{DiscoveredMaster}
+    '''
+    self._retrieval_pool.discard(master)
+
+  def _updatePeerCache(self):
+    '''
+    Stores the known discoverer to the L{PEER_CACHE}, if the 
+    L{PEER_CACHE_INTERVAL} is elapsed.
+    '''
+    if Discoverer.PEER_CACHE and time.time() - self._last_peer_cache_ts >= Discoverer.PEER_CACHE_INTERVAL:
+      self._last_peer_cache_ts = time.time()
+      self._savePeerCache()
+
+  def _savePeerCache(self):
+    '''
+    Stores the discoverer with retrieved contacts to the L{PEER_CACHE}. Each 
+    line contains the tab separated address of the heartbeats, the port of 
+    the RPC server, monitor URI, master URI, master name, timestamp of the 
+    state, time of the last heartbeat, heartbeat rate and version. The masters 
+    reported by a relay are not stored.
+    '''
+    with self._lock:
+      lines = []
+      for ((address, monitor_port), v) in self.masters.iteritems():
+        if v.mastername is None or not v.relay_uri is None:
+          continue
+        lines.append('\t'.join([','.join([str(a) for a in address]), str(monitor_port), v.monitoruri, 
+                                v.masteruri, v.mastername, repr(v.timestamp), repr(v.last_heartbeat_ts),
+                                repr(v.heartbeat_rate), str(v.version)]))
+    try:
+      path = os.path.dirname(Discoverer.PEER_CACHE)
+      if path and not os.path.isdir(path):
+        os.makedirs(path)
+      tmp_file = ''.join([Discoverer.PEER_CACHE, '.tmp'])
+      with open(tmp_file, 'w') as f:
+        f.write('# address\trpc port\tmonitor URI\tmaster URI\tmaster name\ttimestamp\tlast heartbeat\theartbeat rate\tversion\n')
+        for line in lines:
+          f.write(line)
+          f.write('\n')
+      # replace the file at once, so an abort does not leave a truncated cache
+      os.rename(tmp_file, Discoverer.PEER_CACHE)
+    except (IOError, OSError), e:
+      rospy.logwarn("Error while store the peer cache %s: %s", Discoverer.PEER_CACHE, str(e))
+
+  def _loadPeerCache(self):
+    '''
+    Loads the discoverer stored in the L{PEER_CACHE} as unconfirmed masters. 
+    The contacts of all loaded masters are requested at once by the pool, the 
+    masters without heartbeats are removed after the timeout, see 
+    L{_removeOfflineMasters()}.
+    '''
+    if not os.path.isfile(Discoverer.PEER_CACHE):
+      return
+    count = 0
+    current_time = time.time()
+    try:
+      with open(Discoverer.PEER_CACHE, 'r') as f:
+        for line in f:
+          if line.startswith('#') or not line.strip():
+            continue
+          try:
+            (address, monitor_port, monitoruri, masteruri, mastername, timestamp, last_heartbeat_ts, 
+             heartbeat_rate, version) = line.rstrip('\n').split('\t')
+            if current_time - float(last_heartbeat_ts) > Discoverer.PEER_CACHE_MAX_AGE:
+              continue
+            address = address.split(',')
+            master_key = (tuple([address[0]] + [int(a) for a in address[1:]]), int(monitor_port))
+            with self._lock:
+              if master_key in self.masters:
+                continue
+              master = self._createMaster(monitoruri=monitoruri,
+                                          heartbeat_rate=float(heartbeat_rate),
+                                          timestamp=float(timestamp),
+                                          version=int(version),
+                                          digests=None,
+                                          state_size=None)
+              master.unconfirmed = True
+              self.masters[master_key] = master
+            count += 1
+          except ValueError:
+            rospy.logwarn("Skip invalid line in the peer cache %s: %s", Discoverer.PEER_CACHE, line.strip())
+    except IOError, e:
+      rospy.logwarn("Error while load the peer cache %s: %s", Discoverer.PEER_CACHE, str(e))
+    rospy.loginfo("Loaded %d discoverer from the peer cache %s", count, Discoverer.PEER_CACHE)
+
+  def retrievalMetrics(self):
+    '''
+    Returns the counters of the requests for the information about the 
+    discovered masters.
+    @see: L{RetrievalPool.metrics()}
+    @rtype: C{dict(str: int)}
+    '''
+    return self._retrieval_pool.metrics()
 
   @classmethod
   def msg2masterState(cls, msg):
     '''
     @return: parses the hearbeat message and return a tuple of
             version and values corresponding with current version of message.
+            Version 3 returns C{(r, version, rate, [entry, ...])} with the 
+            entries corresponding to L{HEARTBEAT_ENTRY_FMT_V3}.
             @see L{Discoverer.HEARTBEAT_FMT}
     @raise Exception on invalid message
     @rtype: C{(unsigned char, tuple corresponding to L{Discoverer.HEARTBEAT_FMT})}
@@ -465,68 +1500,176 @@ class Discoverer(threading.Thread):
     if len(msg) > 2:
       (r,) = struct.unpack('c', msg[0])
       (version,) = struct.unpack('B', msg[1])
-      if (version == Discoverer.VERSION):
+      if (version in [1, 2, 3]):
         if (r == 'R'):
-          if len(msg) == struct.calcsize(Discoverer.HEARTBEAT_FMT):
-            return (version, struct.unpack(Discoverer.HEARTBEAT_FMT, msg))
+          if version == 3:
+            header_size = struct.calcsize(Discoverer.HEARTBEAT_FMT_V3)
+            entry_size = struct.calcsize(Discoverer.HEARTBEAT_ENTRY_FMT_V3)
+            (r, version, rate, count) = struct.unpack(Discoverer.HEARTBEAT_FMT_V3, msg[:header_size])
+            if len(msg) != header_size + count * entry_size:
+              raise Exception(' '.join(["wrong size", str(len(msg)), "of the heartbeat version 3 with", str(count), "entries"]))
+            entries = [struct.unpack_from(Discoverer.HEARTBEAT_ENTRY_FMT_V3, msg, header_size + i * entry_size) for i in range(count)]
+            return (version, (r, version, rate, entries))
+          fmt = Discoverer.HEARTBEAT_FMT if version == 1 else Discoverer.HEARTBEAT_FMT_V2
+          if len(msg) == struct.calcsize(fmt):
+            return (version, struct.unpack(fmt, msg))
+          raise Exception(' '.join(["wrong size", str(len(msg)), "of the heartbeat version", str(version)]))
         else:
-          raise Exception(' '.join(["wrong initial discovery message char", str(r), "received from", str(address)]))
+          raise Exception(' '.join(["wrong initial discovery message char", str(r)]))
       elif (version > Discoverer.VERSION):
         raise Exception(' '.join(["newer heartbeat version", str(version), "(own:", str(Discoverer.VERSION), ") detected, please update your master_discovery"]))
-      elif (version < Discoverer.VERSION):
-        raise Exception(' '.join(["old heartbeat version", str(version), "detected (current:", str(Discoverer.VERSION),"), please update master_discovery on", str(address)]))
       else:
-        raise Exception(' '.join(["heartbeat version", str(Discoverer.VERSION), "expected, received:", str(version)]))
+        raise Exception(' '.join(["old heartbeat version", str(version), "detected (current:", str(Discoverer.VERSION),"), please update master_discovery"]))
     raise Exception("massage is to small")
 
+  @classmethod
+  def msg2heartbeats(cls, msg):
+    '''
+    Parses the heartbeat message of any version and returns the values for 
+    each contained ROS master.
+    @see: L{msg2masterState()}
+    @raise Exception on invalid message
+    @return: the list with C{(version, rate, secs, nsecs, monitor_port, digests, state_size)}, 
+    the digests and state size are C{None} if unknown.
+    @rtype: C{[(int, int, int, int, int, (int, int, int), int)]}
+    '''
+    (version, msg_tuple) = cls.msg2masterState(msg)
+    if version == 1:
+      (r, version, rate, secs, nsecs, monitor_port) = msg_tuple
+      return [(version, rate, secs, nsecs, monitor_port, None, None)]
+    if version == 2:
+      (r, version, rate) = msg_tuple[:3]
+      entries = [msg_tuple[3:]]
+    else:
+      (r, version, rate, entries) = msg_tuple
+    result = []
+    for (secs, nsecs, monitor_port, d_nodes, d_topics, d_services, state_size) in entries:
+      digests = (d_nodes, d_topics, d_services) if (d_nodes, d_topics, d_services) != (0, 0, 0) else None
+      result.append((version, rate, secs, nsecs, monitor_port, digests, state_size if state_size > 0 else None))
+    return result
+
+  @classmethod
+  def measurementDuration(cls, rate):
+    '''
+    Returns the duration of the measurement interval for the given heartbeat rate.
+    @see: L{MEASUREMENT_INTERVALS}
+    @rtype: C{float}
+    '''
+    if rate < 1.:
+      return cls.MEASUREMENT_INTERVALS / rate
+    return cls.MEASUREMENT_INTERVALS
+
   def timed_stats_calculation(self):
     '''
-    This method will be called by a timer and has two jobs:
-     1. set the masters offline, if no heartbeat messages are received a long time
-     2. calculate the quality of known links
-    @see: L{float}
+    This method will be called by a timer, calculates and publishes the 
+    statistics, see L{_calculateStats()}.
+    '''
+    self.publish_stats(*self._calculateStats())
+    self.publish_diagnostics()
+    self._updatePeerCache()
+    try:
+      if not rospy.is_shutdown():
+        self._statsTimer = threading.Timer(1, self.timed_stats_calculation)
+        self._statsTimer.start()
+    except:
+      pass
+
+  def timed_failure_detection(self):
+    '''
+    This method will be called by a timer, if the phi-accrual failure detector 
+    is enabled, and sets the masters offline, see L{_detectFailures()}.
+    '''
+    self._detectFailures()
+    try:
+      if not rospy.is_shutdown() and not self.do_finish:
+        self._failureTimer = threading.Timer(1.0/Discoverer.PHI_CHECK_HZ, self.timed_failure_detection)
+        self._failureTimer.start()
+    except:
+      pass
+
+  def _detectFailures(self):
+    '''
+    Checks the online state of all known online masters, see L{_updateOnline()}.
+    '''
+    current_time = time.time()
+    with self._lock:
+      for v in self.masters.itervalues():
+        if not v.mastername is None and v.online:
+          self._updateOnline(v, current_time)
+
+  def _updateOnline(self, master, current_time):
+    '''
+    Sets the master offline, if the last received heartbeat is older than the 
+    timeout defined by L{TIMEOUT_FACTOR} or the suspicion level of the 
+    phi-accrual failure detector exceeds the L{PHI_THRESHOLD}.
+    @param master: the master to check
+    @type master: L{DiscoveredMaster}
+    @param current_time: the current time
+    @type current_time: C{float}
+    @return: the suspicion level or C{-1}, if not enough heartbeats are available
+    @rtype: C{float}
+    '''
+    phi = master.heartbeats.phi(current_time, Discoverer.PHI_MIN_STD)
+    if master.online:
+      measurement_duration = Discoverer.measurementDuration(master.heartbeat_rate)
+      if current_time - master.last_heartbeat_ts > (measurement_duration * Discoverer.TIMEOUT_FACTOR):
+        master.setOffline()
+      elif Discoverer.PHI_THRESHOLD > 0 and not phi is None and phi > Discoverer.PHI_THRESHOLD:
+        rospy.logdebug("%s suspected to be offline, phi: %.2f", master.mastername, phi)
+        master.setOffline()
+    return -1. if phi is None else phi
+
+  def _calculateStats(self):
+    '''
+    This method has two jobs:
+     1. set the masters offline, if no heartbeat messages are received a long 
+        time, see L{_updateOnline()}
+     2. calculate the quality, the mean time between the heartbeats, the jitter
+        and the largest burst loss of known links. The round-trip time is 
+        published, if L{RTT_PROBE_HZ} is enabled (otherwise C{-1}), and the 
+        suspicion level of the failure detector (C{-1} on too few heartbeats).
+    @return: the link states for C{~linkstats} and C{~linkstats_ext}
+    @rtype: C{(L{master_discovery_fkie.LinkStatesStamped}, L{master_discovery_fkie.LinkStatesExtStamped})}
     '''
     result = LinkStatesStamped()
+    result_ext = LinkStatesExtStamped()
     current_time = time.time()
     result.header.stamp.secs = int(current_time)
     result.header.stamp.nsecs = int((current_time - result.header.stamp.secs) * 1000000000)
+    result_ext.header.stamp = result.header.stamp
     try:
-      self.__lock.acquire(True)
-  #    self.__lock.release()
+      self._lock.acquire(True)
+  #    self._lock.release()
       for (k, v) in self.masters.iteritems():
         quality = -1.0
-   #     self.__lock.acquire(True)
+   #     self._lock.acquire(True)
         if not (v.mastername is None):
           rate = v.heartbeat_rate
-          measurement_duration = Discoverer.MEASUREMENT_INTERVALS
-          if rate < 1.:
-            measurement_duration = Discoverer.MEASUREMENT_INTERVALS / rate
+          measurement_duration = Discoverer.measurementDuration(rate)
           # remove all heartbeats, which are to old
           ts_oldest = current_time - measurement_duration
           removed_ts = v.removeHeartbeats(ts_oldest)
           # sets the master offline if the last received heartbeat is to old
-          if current_time - v.last_heartbeat_ts > (measurement_duration * Discoverer.TIMEOUT_FACTOR):
-            v.setOffline()
+          phi = self._updateOnline(v, current_time)
           # calculate the quality for inly online masters
           if v.online:
-            beats_count = len(v.heartbeats)
-            expected_count = rate * measurement_duration
-    #        print "beats_count:",beats_count, ", expected_count:",expected_count
-            if expected_count > 0:
-              quality = float(beats_count) / float(expected_count) * 100.0
+            # the heartbeats are weighted by the period advertised by the sender, 
+            # so the quality is also correct for adaptive heartbeat rates
+            if measurement_duration > 0:
+              quality = v.heartbeats.coveredTime() / measurement_duration * 100.0
               if quality > 100.0:
                 quality = 100.0
             result.links.append(LinkState(v.mastername, quality))
+            result_ext.links.append(LinkStateExt(v.mastername, quality,
+                                                 v.heartbeats.meanGap(),
+                                                 v.heartbeats.jitter(),
+                                                 v.heartbeats.burstLoss(),
+                                                 -1. if v.rtt is None else v.rtt,
+                                                 -1. if v.rtt_var is None else v.rtt_var,
+                                                 phi))
     finally:
-      self.__lock.release()
-    #publish the results
-    self.publish_stats(result)
-    try:
-      if not rospy.is_shutdown():
-        self._statsTimer = threading.Timer(1, self.timed_stats_calculation)
-        self._statsTimer.start()
-    except:
-      pass
+      self._lock.release()
+    return (result, result_ext)
 
   def publish_masterstate(self, master_state):
     '''
@@ -534,37 +1677,121 @@ class Discoverer(threading.Thread):
     @param master_state: the master state to publish
     @type master_state:  L{master_discovery_fkie.MasterState}
     '''
-    if self.__lock.acquire(True):
+    if self._lock.acquire(True):
       try:
         self.pubchanges.publish(master_state)
       except:
         import traceback
         traceback.print_exc()
       finally:
-        self.__lock.release()
-    
+        self._lock.release()
+    self._addPendingChange(master_state)
+
+  def _addPendingChange(self, master_state):
+    '''
+    Adds the change to the changes published on C{~changes_batch}. A change of 
+    a master, which has already a pending new or changed state, replaces the 
+    pending state, so only the newest state is published. The first pending 
+    change schedules the publication after L{CHANGES_BATCH_WINDOW}.
+    @param master_state: the master state to publish
+    @type master_state:  L{master_discovery_fkie.MasterState}
+    '''
+    if Discoverer.CHANGES_BATCH_WINDOW <= 0:
+      return
+    with self._pending_lock:
+      schedule = not self._pending_changes
+      idx = self._pending_index.get(master_state.master.name, None)
+      if (not idx is None and master_state.state == MasterState.STATE_CHANGED and 
+          self._pending_changes[idx].state in [MasterState.STATE_NEW, MasterState.STATE_CHANGED]):
+        self._pending_changes[idx] = MasterState(self._pending_changes[idx].state, master_state.master)
+      else:
+        self._pending_index[master_state.master.name] = len(self._pending_changes)
+        self._pending_changes.append(master_state)
+    if schedule:
+      self._scheduleChangesFlush()
+
+  def _scheduleChangesFlush(self):
+    '''
+    Schedules the publication of the pending changes by L{_flushChanges()}.
+    '''
+    timer = threading.Timer(Discoverer.CHANGES_BATCH_WINDOW, self._flushChanges)
+    timer.setDaemon(True)
+    timer.start()
+
+  def _flushChanges(self):
+    '''
+    Publishes all pending changes as one message on C{~changes_batch}.
+    '''
+    with self._pending_lock:
+      states = self._pending_changes
+      self._pending_changes = []
+      self._pending_index = dict()
+    if states:
+      msg = MasterStatesStamped()
+      current_time = time.time()
+      msg.header.stamp.secs = int(current_time)
+      msg.header.stamp.nsecs = int((current_time - msg.header.stamp.secs) * 1000000000)
+      msg.states = states
+      try:
+        self.pubchanges_batch.publish(msg)
+      except:
+        import traceback
+        traceback.print_exc()
+
 
-  def publish_stats(self, stats):
+  def publish_stats(self, stats, stats_ext=None):
     '''
     Publishes the link quality states to the ROS network.This method is thread safe.
     @param stats: the link quality states to publish
     @type stats:  L{master_discovery_fkie.LinkStatesStamped}
+    @param stats_ext: the extended link states to publish on C{~linkstats_ext}
+    @type stats_ext:  L{master_discovery_fkie.LinkStatesExtStamped}
     '''
-    if self.__lock.acquire(True):
+    if self._lock.acquire(True):
       try:
         self.pubstats.publish(stats)
+        if not stats_ext is None:
+          self.pubstats_ext.publish(stats_ext)
       except:
         import traceback
         traceback.print_exc()
       finally:
-        self.__lock.release()
+        self._lock.release()
+
+  def publish_diagnostics(self):
+    '''
+    Publishes the times of the update phases of the master state and the 
+    counters of the RPC server and of the retrieval of the discovered masters 
+    on C{~diagnostics}, if the parameter C{~diagnostics} is enabled.
+    @see: L{MasterMonitor.getMonitorStats()}
+    '''
+    if self.pubdiagnostics is None:
+      return
+    try:
+      msg = DiagnosticArray()
+      msg.header.stamp = rospy.Time.now()
+      counters = [('retrieval', str(self.master_monitor.getMastername()), self.retrievalMetrics())]
+      for monitor in self.master_monitors:
+        mastername = str(monitor.getMastername())
+        msg.status.extend(monitor.phase_timer.diagnostics('master_discovery', mastername))
+        counters.append(('rpc server', mastername, monitor.rpcServer.metrics()))
+      for name, mastername, values in counters:
+        status = DiagnosticStatus(level=DiagnosticStatus.OK,
+                                  name=''.join(['master_discovery: ', name]),
+                                  hardware_id=mastername)
+        status.values = [KeyValue(k, str(v)) for k, v in sorted(values.items())]
+        msg.status.append(status)
+      self.pubdiagnostics.publish(msg)
+    except:
+      import traceback
+      rospy.logwarn("Error while publish diagnostics: %s", traceback.format_exc().splitlines()[-1])
 
   def rosservice_list_masters(self, req):
     '''
     Callback for the ROS service to get the current list of the known ROS masters.
     '''
     masters = list()
-    self.__lock.acquire(True)
+    self._lock.acquire(True)
     try:
       for (k, v) in self.masters.iteritems():
         if not v.mastername is None:
@@ -578,5 +1805,182 @@ class Discoverer(threading.Thread):
       import traceback
       traceback.print_exc()
     finally:
-      self.__lock.release()
+      self._lock.release()
       return DiscoverMastersResponse(masters)
+
+
+class EventLoopDiscoverer(Discoverer):
+  '''
+  The discoverer with an alternative engine: the heartbeats, the received 
+  messages, the statistics, the offline timeouts and the requests to the 
+  remote discoverer are handled by one L{EventLoop} in the thread of the 
+  discoverer. Only the blocking XML-RPC requests to the ROS master and to the 
+  remote discoverer are executed by a small thread pool. Enabled by the 
+  parameter C{~engine: eventloop}.
+  '''
+
+  EXECUTOR_WORKERS = 4
+  ''' @ivar: the count of threads used for the blocking XML-RPC requests (Default: 4). '''
+
+  def _startEngine(self):
+    '''
+    Creates the event loop and registers the multicast socket. The timers are 
+    started by L{run()}.
+    '''
+    if rospy.has_param('~executor_workers'):
+      EventLoopDiscoverer.EXECUTOR_WORKERS = max(1, rospy.get_param('~executor_workers'))
+    self.loop = EventLoop(EventLoopDiscoverer.EXECUTOR_WORKERS)
+    self._heartbeat_timer = None
+    self._retrieval_metrics = {'queue_depth': 0, 'in_progress': 0, 'retries': 0, 'failures': 0, 'successes': 0}
+    self._retrievals = dict()
+    '''@ivar: the masters to retrieve with the timer of the pending retry C{{id(master): timer or None}}'''
+    self._registered_fd = None
+    self._registerSocket()
+
+  def _init_mcast_socket(self, doexit_on_error=False):
+    Discoverer._init_mcast_socket(self, doexit_on_error)
+    if not getattr(self, 'loop', None) is None:
+      self._registerSocket()
+
+  def _registerSocket(self):
+    if not self._registered_fd is None:
+      self.loop.removeReader(self._registered_fd)
+    self._registered_fd = self.msocket.fileno()
+    self.loop.addReader(self._registered_fd, self._onReadable)
+
+  def finish(self, *arg):
+    Discoverer.finish(self, *arg)
+    self.loop.stop()
+
+  def run(self):
+    '''
+    Runs the event loop until the node is shut down.
+    '''
+    now = time.time()
+    self._heartbeat_timer = self.loop.callAt(now, self._onHeartbeatTimer, now)
+    self.loop.callAt(now + 1, self._onStatsTimer, now + 1)
+    if Discoverer.PHI_THRESHOLD > 0:
+      self.loop.callAt(now, self._onFailureTimer, now)
+    self.loop.callAt(now, self._onCheckTimer)
+    self.loop.run()
+    self._sendFinalHeartbeat()
+    self.loop.close()
+
+  def _schedulePeriodic(self, deadline, period, callback):
+    '''
+    Schedules the callback for the next period relative to the last deadline 
+    to avoid a drift. Missed periods are skipped.
+    @return: the handle of the timer or C{None} on shutdown
+    '''
+    if rospy.is_shutdown() or self.do_finish:
+      self.loop.stop()
+      return None
+    next_deadline = max(deadline + period, time.time())
+    return self.loop.callAt(next_deadline, callback, next_deadline)
+
+  def _onHeartbeatTimer(self, deadline):
+    self._sendHeartbeat()
+    self._heartbeat_timer = self._schedulePeriodic(deadline, self._nextHeartbeatPeriod(), self._onHeartbeatTimer)
+
+  def _notifyStateChanged(self):
+    if Discoverer.HEARTBEAT_ADAPTIVE:
+      self.current_heartbeat_hz = Discoverer.HEARTBEAT_HZ
+      self.loop.callSoonThreadsafe(self._onStateChanged)
+
+  def _onStateChanged(self):
+    # send the heartbeats redundant and restart the periodic heartbeats
+    if not self._heartbeat_timer is None:
+      self.loop.cancel(self._heartbeat_timer)
+    for i in range(1, Discoverer.HEARTBEAT_BURST):
+      self.loop.callLater(i * Discoverer.HEARTBEAT_BURST_INTERVAL, self._sendHeartbeat)
+    self._onHeartbeatTimer(time.time())
+
+  def _scheduleChangesFlush(self):
+    self.loop.callSoonThreadsafe(self.loop.callLater, Discoverer.CHANGES_BATCH_WINDOW, self._flushChanges)
+
+  def _onStatsTimer(self, deadline):
+    self.publish_stats(*self._calculateStats())
+    self.publish_diagnostics()
+    self._updatePeerCache()
+    self._schedulePeriodic(deadline, 1.0, self._onStatsTimer)
+
+  def _onFailureTimer(self, deadline):
+    self._detectFailures()
+    self._schedulePeriodic(deadline, 1.0/Discoverer.PHI_CHECK_HZ, self._onFailureTimer)
+
+  def _onCheckTimer(self):
+    self.loop.runInExecutor(self._checkROSMaster, callback=self._onROSMasterChecked)
+
+  def _onROSMasterChecked(self, result):
+    self._removeOfflineMasters()
+    if not (rospy.is_shutdown() or self.do_finish):
+      self.loop.callLater(1.0/self.current_check_hz, self._onCheckTimer)
+
+  def _onReadable(self):
+    try:
+      (msg, address) = self.msocket.recvfrom(1024)
+    except socket.error:
+      import traceback
+      rospy.logwarn("socket error: %s", traceback.format_exc())
+    else:
+      self._handleMessage(msg, address)
+
+  def _createMaster(self, monitoruri, heartbeat_rate, timestamp, version, digests, state_size, relay_uri=None):
+    '''
+    Creates a new discovered master and requests the information about the 
+    ROS master by the thread pool of the event loop.
+    @rtype: L{DiscoveredMaster}
+    '''
+    master = DiscoveredMaster(monitoruri=monitoruri, 
+                              heartbeat_rate=heartbeat_rate,
+                              timestamp=timestamp,
+                              callback_master_state=self.publish_masterstate,
+                              version=version,
+                              digests=digests,
+                              state_size=state_size,
+                              retrieve_thread=False,
+                              relay_uri=relay_uri)
+    with self._lock:
+      self._retrievals[id(master)] = None
+    self._retrieval_metrics['queue_depth'] += 1
+    self._retrieve(master)
+    return master
+
+  def _forgetMaster(self, master):
+    '''
+    Called before the master is removed, cancels the pending retry.
+    @type master: L{DiscoveredMaster}
+    '''
+    with self._lock:
+      timer = self._retrievals.pop(id(master), None)
+    if not timer is None:
+      self.loop.cancel(timer)
+      self._retrieval_metrics['queue_depth'] -= 1
+
+  def retrievalMetrics(self):
+    return dict(self._retrieval_metrics)
+
+  def _retrieve(self, master):
+    self._retrieval_metrics['queue_depth'] -= 1
+    with self._lock:
+      if not id(master) in self._retrievals:
+        return
+      self._retrievals[id(master)] = None
+    self._retrieval_metrics['in_progress'] += 1
+    self.loop.runInExecutor(master.requestMasterinfo, callback=lambda ok: self._onRetrieved(master, ok))
+
+  def _onRetrieved(self, master, ok):
+    self._retrieval_metrics['in_progress'] -= 1
+    self._retrieval_metrics['successes' if ok else 'failures'] += 1
+    with self._lock:
+      # the master was removed meanwhile
+      if not id(master) in self._retrievals:
+        return
+      if ok or self.do_finish:
+        del self._retrievals[id(master)]
+        return
+      # retry with backoff, while the master is known
+      self._retrieval_metrics['retries'] += 1
+      self._retrieval_metrics['queue_depth'] += 1
+      delay = RetrievalPool.backoff(master.request_failures, backoff_max=Discoverer.RETRIEVE_BACKOFF_MAX)
+      self._retrievals[id(master)] = self.loop.callLater(delay, self._retrieve, master)
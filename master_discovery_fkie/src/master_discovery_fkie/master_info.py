@@ -30,15 +30,112 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import collections
+import hashlib
+import struct
 import time
 
 import roslib; roslib.load_manifest('master_discovery_fkie')
 import rospy
 
-class NodeInfo(object):
+
+def _intern(name):
+  '''
+  Interns the given string, so equal names of nodes, topics and types share 
+  the same string object in all L{MasterInfo} instances.
+  @param name: the name to intern
+  @type name: C{str} or C{unicode} or C{None}
+  @return: the interned string or the given object, if it can't be interned
+  '''
+  if type(name) is str:
+    return intern(name)
+  return name
+
+_DIGEST_FMT = struct.Struct('<Q')
+_md5 = hashlib.md5
+_unpackDigest = _DIGEST_FMT.unpack_from
+
+def _partDigest(part):
+  '''
+  Returns the 64 bit digest of a content part: the first 8 bytes of the MD5 
+  of its elements. Unlike C{hash()}, the digests of different parts collide 
+  only by chance and are equal in all processes. A part with the value 
+  C{None} as last element has the digest C{0}, so the unset values need no 
+  calculation.
+  @param part: the tuple of strings, integers and C{None}
+  @type part: C{tuple}
+  @rtype: C{int}
+  '''
+  if part[-1] is None:
+    return 0
+  try:
+    key = '\0'.join(part)
+  except TypeError:
+    key = '\0'.join(['\1' if p is None else (p if isinstance(p, basestring) else str(p)) for p in part])
+  if isinstance(key, unicode):
+    key = key.encode('utf-8')
+  return _unpackDigest(_md5(key).digest())[0]
+
+def _hashParts(parts):
+  '''
+  Returns the XOR of the digests of the given content parts.
+  @rtype: C{int}
+  '''
+  result = 0
+  for part in parts:
+    result ^= _partDigest(part)
+  return result
+
+
+class DigestInfo(object):
+  '''
+  Base class of the info classes, which maintains a digest of the compared 
+  content. The digest is the XOR of the digests of all content parts, so it can
+  be updated on each change without iterating over the unchanged parts. The 
+  changes are also passed to the owning L{MasterInfo}.
+  @note: the digest is only valid while the content is changed using the 
+  properties.
+  '''
+  __slots__ = ('_digest', '_digest_owner')
+  _digest_kind = None
+  '''@ivar: the name of the collection in the L{MasterInfo}'''
+
+  def __init__(self):
+    self._digest = 0
+    self._digest_owner = None
+
+  @property
+  def digest(self):
+    '''
+    Returns the digest of the content. Equal content has an equal digest, 
+    different content an equal digest only with the probability of 2^-64.
+    @rtype: C{int}
+    '''
+    return self._digest
+
+  def _xorDigest(self, *parts):
+    '''
+    Adds the given parts to the digest or removes them, if they are already in.
+    '''
+    diff = 0
+    for part in parts:
+      diff ^= _partDigest(part)
+    self._digest ^= diff
+    if not self._digest_owner is None:
+      self._digest_owner._xorDigest(self._digest_kind, diff)
+
+  def _setDigestOwner(self, owner):
+    self._digest_owner = owner
+
+
+class NodeInfo(DigestInfo):
   '''
   The NodeInfo class stores informations about a ROS node.
   '''
+  __slots__ = ('__name', '__masteruri', '__org_masteruri', '__uri', '__pid', '__local',
+               '_publishedTopics', '_subscribedTopics', '_services')
+  _digest_kind = 'nodes'
+
   def __init__(self, name, masteruri):
     '''
     Creates a new NodeInfo for a node with given name.
@@ -49,16 +146,17 @@ class NodeInfo(object):
     node are running on the same machine.
     @type masteruri: C{str}
     '''
-    self.__name = name
-    self.__masteruri = masteruri
+    DigestInfo.__init__(self)
+    self.__name = name = _intern(name)
+    self.__masteruri = masteruri = _intern(masteruri)
     self.__org_masteruri = masteruri
     self.__uri = None
-    self.pid = None
-    '''@ivar: the process id of the node. Invalid id has a C{None} value'''
+    self.__pid = None
     self.__local = False
     self._publishedTopics = []
     self._subscribedTopics = []
     self._services = []
+    self._xorDigest(('node', name))
 
   @property
   def name(self):
@@ -81,9 +179,26 @@ class NodeInfo(object):
     '''
     Sets the URI of the RPC API of the node.
     '''
+    self._xorDigest(('node.uri', self.__name, self.__uri), ('node.uri', self.__name, uri))
     self.__uri = uri
     self.__local = NodeInfo.local_(self.__masteruri, self.__org_masteruri, self.__uri)
 
+  @property
+  def pid(self):
+    '''
+    Returns the process id of the node. Invalid id has a C{None} value.
+    @rtype: C{int}
+    '''
+    return self.__pid
+
+  @pid.setter
+  def pid(self, pid):
+    '''
+    Sets the process id of the node.
+    '''
+    self._xorDigest(('node.pid', self.__name, self.__pid), ('node.pid', self.__name, pid))
+    self.__pid = pid
+
   @property
   def masteruri(self):
     '''
@@ -97,7 +212,7 @@ class NodeInfo(object):
     '''
     Sets the ROS master URI.
     '''
-    self.__org_masteruri = uri
+    self.__org_masteruri = _intern(uri)
     self.__local = NodeInfo.local_(self.__masteruri, self.__org_masteruri, self.__uri)
 
   @property
@@ -125,12 +240,14 @@ class NodeInfo(object):
     '''
     try:
       if isinstance(name, list):
+        self._xorDigest(*[('pub', self.__name, n) for n in set(self._publishedTopics) ^ set(name)])
         del self._publishedTopics
-        self._publishedTopics = name
+        self._publishedTopics = [_intern(n) for n in name]
       else:
         self._publishedTopics.index(name)
     except ValueError:
-      self._publishedTopics.append(name)
+      self._xorDigest(('pub', self.__name, name))
+      self._publishedTopics.append(_intern(name))
 
 #  @publishedTopics.deleter
 #  def publishedTopics(self):
@@ -153,12 +270,14 @@ class NodeInfo(object):
     '''
     try:
       if isinstance(name, list):
+        self._xorDigest(*[('sub', self.__name, n) for n in set(self._subscribedTopics) ^ set(name)])
         del self._subscribedTopics
-        self._subscribedTopics = name
+        self._subscribedTopics = [_intern(n) for n in name]
       else:
         self._subscribedTopics.index(name)
     except ValueError:
-      self._subscribedTopics.append(name)
+      self._xorDigest(('sub', self.__name, name))
+      self._subscribedTopics.append(_intern(name))
 
 #  @subscribedTopics.deleter
 #  def subscribedTopics(self):
@@ -181,12 +300,14 @@ class NodeInfo(object):
     '''
     try:
       if isinstance(name, list):
+        self._xorDigest(*[('srv', self.__name, n) for n in set(self._services) ^ set(name)])
         del self._services
-        self._services = name
+        self._services = [_intern(n) for n in name]
       else:
         self._services.index(name)
     except ValueError:
-      self._services.append(name)
+      self._xorDigest(('srv', self.__name, name))
+      self._services.append(_intern(name))
 
 #  @services.deleter
 #  def services(self):
@@ -200,11 +321,24 @@ class NodeInfo(object):
     result = NodeInfo(self.name, self.masteruri)
     result.uri = ''.join([self.uri]) if not self.uri is None else None
     result.pid = self.pid
-    result._publishedTopics = list(self._publishedTopics)
-    result._subscribedTopics = list(self._subscribedTopics)
-    result._services = list(self._services)
+    result.publishedTopics = list(self._publishedTopics)
+    result.subscribedTopics = list(self._subscribedTopics)
+    result.services = list(self._services)
     return result
 
+  @staticmethod
+  def rawDigest(name, uri, pid, published, subscribed, services):
+    '''
+    Returns the digest of a node with given content without creating the 
+    instance. It is equal to the digest of an instance with this content.
+    @rtype: C{int}
+    '''
+    parts = [('node', name), ('node.uri', name, uri), ('node.pid', name, pid)]
+    parts.extend([('pub', name, n) for n in set(published)])
+    parts.extend([('sub', name, n) for n in set(subscribed)])
+    parts.extend([('srv', name, n) for n in set(services)])
+    return _hashParts(parts)
+
   @staticmethod
   def local_(masteruri, org_masteruri, uri):
     result = False
@@ -221,21 +355,25 @@ class NodeInfo(object):
     return result
 
 
-class TopicInfo(object):
+class TopicInfo(DigestInfo):
   '''
   The TopicInfo class stores informations about a ROS topic.
   '''
+  __slots__ = ('__name', '__type', '_publisherNodes', '_subscriberNodes')
+  _digest_kind = 'topics'
+
   def __init__(self, name):
     '''
     Creates a new TopicInfo for a topic with given name.
     @param name: the name of the topic
     @type name: C{str} 
     '''
-    self.__name = name
-    self.type = None
-    '''@ivar: the type of the topic. (Default: None)'''
-    self._publisherNodes = []
-    self._subscriberNodes = []
+    DigestInfo.__init__(self)
+    self.__name = name = _intern(name)
+    self.__type = None
+    self._publisherNodes = ()
+    self._subscriberNodes = ()
+    self._xorDigest(('topic', name))
 
   @property
   def name(self):
@@ -245,6 +383,22 @@ class TopicInfo(object):
     '''
     return self.__name
 
+  @property
+  def type(self):
+    '''
+    Returns the type of the topic. (Default: None)
+    @rtype: C{str}
+    '''
+    return self.__type
+
+  @type.setter
+  def type(self, type):
+    '''
+    Sets the type of the topic.
+    '''
+    self._xorDigest(('topic.type', self.__name, self.__type), ('topic.type', self.__name, type))
+    self.__type = _intern(type)
+
   @property
   def publisherNodes(self):
     '''
@@ -256,16 +410,17 @@ class TopicInfo(object):
   @publisherNodes.setter
   def publisherNodes(self, name):
     '''
-    Append a new publishing node to this topic.
+    Append a new publishing node to this topic or replaces all by the given 
+    list. Appending copies the stored tuple, set the complete list to fill a 
+    new topic.
     '''
     try:
       if isinstance(name, list):
-        del self._publisherNodes
-        self._publisherNodes = name
+        self._publisherNodes = tuple([_intern(n) for n in name])
       else:
         self._publisherNodes.index(name)
     except ValueError:
-      self._publisherNodes.append(name)
+      self._publisherNodes += (_intern(name),)
 
 #  @publisherNodes.deleter
 #  def publisherNodes(self):
@@ -282,16 +437,17 @@ class TopicInfo(object):
   @subscriberNodes.setter
   def subscriberNodes(self, name):
     '''
-    Append a new subscribing node to this topic.
+    Append a new subscribing node to this topic or replaces all by the given 
+    list. Appending copies the stored tuple, set the complete list to fill a 
+    new topic.
     '''
     try:
       if isinstance(name, list):
-        del self._subscriberNodes
-        self._subscriberNodes = name
+        self._subscriberNodes = tuple([_intern(n) for n in name])
       else:
         self._subscriberNodes.index(name)
     except ValueError:
-      self._subscriberNodes.append(name)
+      self._subscriberNodes += (_intern(name),)
 
 #  @subscriberNodes.deleter
 #  def subscriberNodes(self):
@@ -304,15 +460,28 @@ class TopicInfo(object):
     '''
     result = TopicInfo(self.name)
     result.type = self.type
-    result._publisherNodes = list(self._publisherNodes)
-    result._subscriberNodes = list(self._subscriberNodes)
+    result._publisherNodes = self._publisherNodes
+    result._subscriberNodes = self._subscriberNodes
     return result
 
+  @staticmethod
+  def rawDigest(name, type):
+    '''
+    Returns the digest of a topic with given type without creating the 
+    instance. It is equal to the digest of an instance with this type.
+    @rtype: C{int}
+    '''
+    return _hashParts([('topic', name), ('topic.type', name, type)])
+
 
-class ServiceInfo(object):
+class ServiceInfo(DigestInfo):
   '''
   The ServiceInfo class stores informations about a ROS service.
   '''
+  __slots__ = ('__name', '__masteruri', '__org_masteruri', '__uri', '__local', 
+               'type', '__service_class', 'args', '__serviceProvider')
+  _digest_kind = 'services'
+
   def __init__(self, name, masteruri):
     '''
     Creates a new instance of the ServiceInfo. 
@@ -323,11 +492,13 @@ class ServiceInfo(object):
     service are running on the same machine.
     @type masteruri: C{str}
     '''
-    self.__name = name
-    self.__masteruri = masteruri
+    DigestInfo.__init__(self)
+    self.__name = name = _intern(name)
+    self.__masteruri = masteruri = _intern(masteruri)
     self.__org_masteruri = masteruri
     self.__uri = None
     self.__local = False
+    self._xorDigest(('service', name))
     self.type = None
     '''@ivar: the type of the service. (Default: None)'''
     self.__service_class = None
@@ -358,6 +529,7 @@ class ServiceInfo(object):
     @param uri: The URI of the service RPC interface
     @type uri: C{str}
     '''
+    self._xorDigest(('service.uri', self.__name, self.__uri), ('service.uri', self.__name, uri))
     self.__uri = uri
     self.__local = NodeInfo.local_(self.__masteruri, self.__org_masteruri, self.__uri)
 
@@ -377,7 +549,7 @@ class ServiceInfo(object):
     @param uri: The URI of the ROS master
     @type uri: C{str}
     '''
-    self.__org_masteruri = uri
+    self.__org_masteruri = _intern(uri)
     self.__local = NodeInfo.local_(self.__masteruri, self.__org_masteruri, self.__uri)
 
   @property
@@ -389,6 +561,15 @@ class ServiceInfo(object):
     '''
     return self.__local
 
+  @staticmethod
+  def rawDigest(name, uri):
+    '''
+    Returns the digest of a service with given URI without creating the 
+    instance. It is equal to the digest of an instance with this URI.
+    @rtype: C{int}
+    '''
+    return _hashParts([('service', name), ('service.uri', name, uri)])
+
   @property
   def serviceProvider(self):
     '''
@@ -407,7 +588,7 @@ class ServiceInfo(object):
     try:
       self.__serviceProvider.index(name)
     except ValueError:
-      self.__serviceProvider.append(name)
+      self.__serviceProvider.append(_intern(name))
 
   @serviceProvider.deleter
   def serviceProvider(self):
@@ -502,22 +683,28 @@ class MasterInfo(object):
     self.__nodelist = {}
     self.__topiclist = {}
     self.__servicelist = {}
+    self.__digests = {'nodes': 0, 'topics': 0, 'services': 0}
     self.__timestamp = 0
     self.check_ts = 0
     '''@ivar: the last time, when the state of the ROS master retrieved'''
 
   @staticmethod
-  def from_list(l):
+  def from_list(l, lazy=False):
     '''
     Creates a new instance of the MasterInfo from given list.
     @see: L{listedState()}
     @param l: the list returned by listedState()
     @type l: list
+    @param lazy: creates a L{LazyMasterInfo}, which creates the contained 
+    L{NodeInfo}, L{TopicInfo} and L{ServiceInfo} instances on first access.
+    @type lazy: C{bool} (Default: C{False})
     @return: the new instance of the MasterInfo filled from list.
     @rtype: MasterInfo
     '''
     if l is None:
       return None
+    if lazy:
+      return LazyMasterInfo(l)
     result = MasterInfo(l[1], l[2])
     result.timestamp = time.time()
     publishers = l[3]
@@ -526,27 +713,29 @@ class MasterInfo(object):
     topicTypes = l[6]
     nodes = l[7]
     serviceProvider = l[8]
+    # the lists of the nodes are collected and set at once, appending each 
+    # entry on its own costs a search in the list
+    node_lists = dict() # node: ([published], [subscribed], [services])
     # set the publishers
     for pub, nodelist in publishers:
       result.topics = pub
+      result.getTopic(pub).publisherNodes = list(nodelist)
       for n in nodelist:
-        result.nodes = n
-        result.getNode(n).publishedTopics = pub
-        result.getTopic(pub).publisherNodes = n
+        node_lists.setdefault(n, ([], [], []))[0].append(pub)
     # set the subscribers
     for sub, nodelist in subscribers:
       result.topics = sub
+      result.getTopic(sub).subscriberNodes = list(nodelist)
       for n in nodelist:
-        result.nodes = n
-        result.getNode(n).subscribedTopics = sub
-        result.getTopic(sub).subscriberNodes = n
+        node_lists.setdefault(n, ([], [], []))[1].append(sub)
     # set the services
     for s, provider in services:
       result.services = s
+      service = result.getService(s)
       for n in provider:
-        result.nodes = n
-        result.getNode(n).services = s
-        result.getService(s).serviceProvider = n
+        service.serviceProvider = n
+        node_lists.setdefault(n, ([], [], []))[2].append(s)
+    result.setNodeLists(node_lists)
     # set the topic types
     for topic, type in topicTypes:
       result.topics = topic
@@ -565,6 +754,54 @@ class MasterInfo(object):
       result.getService(servicename).type = type
     return result
 
+  @staticmethod
+  def listed_delta(old, new):
+    '''
+    Compares two lists returned by L{listedState()} and returns the entries
+    changed between them. The entries of each sub list are identified by their
+    first element (topic, service or node name).
+    @param old: the older list returned by listedState()
+    @type old: list
+    @param new: the newer list returned by listedState()
+    @type new: list
+    @return: C{(updated, removed)}, where C{updated} contains for each sub list
+             (publishers, subscribers, services, topicTypes, nodes,
+             serviceProvider) the new or changed entries and C{removed} the
+             names of the removed entries.
+    @rtype: C{([[...], ...], [[str, ...], ...])}
+    '''
+    updated = []
+    removed = []
+    for idx in range(3, 9):
+      old_entries = dict((e[0], e) for e in old[idx]) if not old is None else dict()
+      new_entries = dict((e[0], e) for e in new[idx])
+      updated.append([e for name, e in new_entries.iteritems() if old_entries.get(name) != e])
+      removed.append([name for name in old_entries.iterkeys() if not name in new_entries])
+    return (updated, removed)
+
+  @staticmethod
+  def apply_listed_delta(l, delta):
+    '''
+    Applies a delta returned by the C{masterInfoSince()} RPC method of the
+    L{master_discovery_fkie.master_monitor.MasterMonitor} to the given list.
+    @param l: the list returned by listedState()
+    @type l: list
+    @param delta: C{(stamp, since_stamp, masteruri, mastername, updated, removed)}
+    @type delta: tuple
+    @return: the new list with the same form as returned by listedState()
+    @rtype: tuple
+    '''
+    (stamp, since_stamp, masteruri, mastername, updated, removed) = delta
+    result = [stamp, masteruri, mastername]
+    for idx in range(3, 9):
+      entries = dict((e[0], e) for e in l[idx])
+      for name in removed[idx - 3]:
+        entries.pop(name, None)
+      for e in updated[idx - 3]:
+        entries[e[0]] = e
+      result.append(entries.values())
+    return tuple(result)
+
   @property
   def mastername(self):
     '''
@@ -621,7 +858,10 @@ class MasterInfo(object):
     if (name is None) or not name:
       return None
     if not (name in self.__nodelist):
-      self.__nodelist[name] = NodeInfo(name, self.__masteruri)
+      info = NodeInfo(name, self.__masteruri)
+      info._setDigestOwner(self)
+      self._xorDigest(info._digest_kind, info.digest)
+      self.__nodelist[name] = info
 
   @property
   def node_names(self):
@@ -662,7 +902,10 @@ class MasterInfo(object):
     if (name is None) or not name:
       return None
     if not (name in self.__topiclist):
-      self.__topiclist[name] = TopicInfo(name)
+      info = TopicInfo(name)
+      info._setDigestOwner(self)
+      self._xorDigest(info._digest_kind, info.digest)
+      self.__topiclist[name] = info
 
   @property
   def topic_names(self):
@@ -691,7 +934,10 @@ class MasterInfo(object):
     if (name is None) or not name:
       return None
     if not (name in self.__servicelist):
-      self.__servicelist[name] = ServiceInfo(name, self.__masteruri)
+      info = ServiceInfo(name, self.__masteruri)
+      info._setDigestOwner(self)
+      self._xorDigest(info._digest_kind, info.digest)
+      self.__servicelist[name] = info
 
   @property
   def service_names(self):
@@ -723,6 +969,26 @@ class MasterInfo(object):
       return None
     return self.__nodelist.get(name, None)
 
+  def setNodeLists(self, node_lists):
+    '''
+    Adds the nodes and replaces their lists of published and subscribed topics
+    and provided services. Used to fill a new instance, each list is set
+    at once instead of appending each entry.
+    @param node_lists: the lists C{{node: ([published], [subscribed], [services])}}
+    @type node_lists: C{dict}
+    '''
+    for name, (published, subscribed, services) in node_lists.iteritems():
+      self.nodes = name
+      node = self.getNode(name)
+      if node is None:
+        continue
+      if published:
+        node.publishedTopics = published
+      if subscribed:
+        node.subscribedTopics = subscribed
+      if services:
+        node.services = services
+
   def getNodeEndsWith(self, suffix):
     '''
     Returns the node, which name ends with given suffix
@@ -760,10 +1026,40 @@ class MasterInfo(object):
       return None
     return self.__servicelist.get(name, None)
   
+  def _xorDigest(self, kind, diff):
+    '''
+    Updates the digest of the given collection. Called by the contained info 
+    objects on each change.
+    '''
+    self.__digests[kind] ^= diff
+
+  @property
+  def digests(self):
+    '''
+    Returns the digests of the contained nodes, topics and services.
+    @rtype: C{dict(str:int)}
+    '''
+    return dict(self.__digests)
+
+  def changedCollections(self, other):
+    '''
+    Compares the digests with the digests of other master state and returns the
+    names of the changed collections.
+    @param other: the another L{MasterInfo} instance.
+    @type other: L{MasterInfo}
+    @return: the names of changed collections, a subset of 
+    C{['nodes', 'topics', 'services']}
+    @rtype: C{[str]}
+    '''
+    if (other is None):
+      return self.__digests.keys()
+    other_digests = other.digests
+    return [kind for kind, digest in self.digests.items() if other_digests[kind] != digest]
+
   def __eq__(self, other):
     '''
     Compares the master state with other master state. The timestamp will not be 
-    compared.
+    compared. Only the digests of the nodes, topics and services are compared.
     @param other: the another L{MasterInfo} instance.
     @type other: L{MasterInfo}
     @return: True, if the states are equal.
@@ -773,32 +1069,7 @@ class MasterInfo(object):
       return False
     if (self.masteruri != other.masteruri):
       return False
-    if (set(self.node_uris) ^ set(other.node_uris)):
-      return False
-    if (set(self.node_names) ^ set(other.node_names)):
-      return False
-    if (set(self.topic_names) ^ set(other.topic_names)):
-      return False
-    if (set(self.service_names) ^ set(other.service_names)):
-      return False
-    if (set(self.service_uris) ^ set(other.service_uris)):
-      return False
-    # test for changes of each node parameter
-    for name in self.node_names:
-      n1 = self.getNode(name)
-      n2 = other.getNode(name)
-      if not n1 is None and not n2 is None:
-        if n1.pid != n2.pid:
-          return False
-        if n1.uri != n2.uri:
-          return False
-        if set(n1.publishedTopics) ^ set(n2.publishedTopics):
-          return False
-        if set(n1.subscribedTopics) ^ set(n2.subscribedTopics):
-          return False
-        if set(n1.services) ^ set(n2.services):
-          return False
-    return True
+    return not self.changedCollections(other)
   
   def __ne__(self, other):
     return not self.__eq__(other)
@@ -844,7 +1115,7 @@ class MasterInfo(object):
                [ [str,str,str,int,str] ], 
                [ [str,str,str,str,str] ])}
     '''
-    stamp = str(self.timestamp)
+    stamp = repr(self.timestamp)
     publishers = []
     subscribers = []
     services = []
@@ -869,3 +1140,337 @@ class MasterInfo(object):
   
 #  def __str__(self):
 #    return str(self.listedState())
+
+
+class _LazyInfoDict(collections.Mapping):
+  '''
+  A read only dictionary with names and corresponding info instances of the
+  L{LazyMasterInfo}. The info instances are created on access.
+  '''
+  def __init__(self, names, getter):
+    self._names = names
+    self._getter = getter
+
+  def __getitem__(self, name):
+    if not name in self._names:
+      raise KeyError(name)
+    return self._getter(name)
+
+  def __contains__(self, name):
+    return name in self._names
+
+  def __iter__(self):
+    return iter(self._names)
+
+  def __len__(self):
+    return len(self._names)
+
+  def has_key(self, name):
+    return name in self._names
+
+
+class LazyMasterInfo(MasterInfo):
+  '''
+  The MasterInfo created from the list returned by L{MasterInfo.listedState()}.
+  The names are indexed on first access, the L{NodeInfo}, L{TopicInfo} and 
+  L{ServiceInfo} instances are created on first access of the entry. The 
+  digests of the not created entries are calculated from the raw entries.
+  Not thread safe!
+  '''
+  def __init__(self, l):
+    '''
+    @param l: the list returned by listedState()
+    @type l: list
+    '''
+    MasterInfo.__init__(self, l[1], l[2])
+    self.timestamp = time.time()
+    self.__listed = l
+    self.__index = None
+    self.__infos = {'nodes': {}, 'topics': {}, 'services': {}}
+    self.__raw_digests = None
+    '''@ivar: the digests of the raw entries without created info instances'''
+
+  def _index(self):
+    '''
+    Creates the index of the names on first call.
+    @return: the dictionary with the raw entries of the nodes 
+    C{{name: [published, subscribed, services, node entry]}}, topics 
+    C{{name: [publisher, subscriber, type]}} and services 
+    C{{name: [provider, service entry]}}
+    @rtype: C{dict}
+    '''
+    if self.__index is None:
+      l = self.__listed
+      nodes = dict()
+      topics = dict()
+      services = dict()
+      for pub, nodelist in l[3]:
+        topics.setdefault(pub, [[], [], None])[0] = nodelist
+        for n in nodelist:
+          nodes.setdefault(n, [[], [], [], None])[0].append(pub)
+      for sub, nodelist in l[4]:
+        topics.setdefault(sub, [[], [], None])[1] = nodelist
+        for n in nodelist:
+          nodes.setdefault(n, [[], [], [], None])[1].append(sub)
+      for srv, provider in l[5]:
+        services.setdefault(srv, [[], None])[0] = provider
+        for n in provider:
+          nodes.setdefault(n, [[], [], [], None])[2].append(srv)
+      for topic, type in l[6]:
+        topics.setdefault(topic, [[], [], None])[2] = type
+      for entry in l[7]:
+        nodes.setdefault(entry[0], [[], [], [], None])[3] = entry
+      for entry in l[8]:
+        services.setdefault(entry[0], [[], None])[1] = entry
+      self.__index = {'nodes': nodes, 'topics': topics, 'services': services}
+      self.__listed = None
+      self.__raw_digests = dict()
+      for kind, entries in self.__index.iteritems():
+        digest = 0
+        for name, entry in entries.iteritems():
+          digest ^= self._entryDigest(kind, name, entry)
+        self.__raw_digests[kind] = digest
+    return self.__index
+
+  @staticmethod
+  def _entryContent(kind, entry):
+    '''
+    Returns the content of the raw entry created by L{_index()}, which is 
+    covered by the digest.
+    @rtype: C{tuple}
+    '''
+    if kind == 'nodes':
+      (published, subscribed, services, node) = entry
+      uri, pid = (node[1], node[3]) if not node is None else (None, None)
+      return (uri, pid, frozenset(published), frozenset(subscribed), frozenset(services))
+    if kind == 'topics':
+      return (entry[2],)
+    return (entry[1][1] if not entry[1] is None else None,)
+
+  @staticmethod
+  def _entryDigest(kind, name, entry):
+    '''
+    Returns the digest of the raw entry created by L{_index()}, equal to the 
+    digest of the created info instance.
+    @rtype: C{int}
+    '''
+    content = LazyMasterInfo._entryContent(kind, entry)
+    if kind == 'nodes':
+      return NodeInfo.rawDigest(name, *content)
+    if kind == 'topics':
+      return TopicInfo.rawDigest(name, *content)
+    return ServiceInfo.rawDigest(name, *content)
+
+  def _fromRaw(self, info, entry):
+    '''
+    Adds the info instance created from the raw entry and removes the digest 
+    of the raw entry.
+    '''
+    self.__raw_digests[info._digest_kind] ^= self._entryDigest(info._digest_kind, info.name, entry)
+    return self._addInfo(info)
+
+  def _addInfo(self, info):
+    info._setDigestOwner(self)
+    self._xorDigest(info._digest_kind, info.digest)
+    self.__infos[info._digest_kind][info.name] = info
+    return info
+
+  @property
+  def nodes(self):
+    '''
+    Returns the dictionary with node names and corresponding instances of L{NodeInfo}.
+    @rtype: C{dict(str:L{NodeInfo}, ...)}
+    '''
+    return _LazyInfoDict(self._index()['nodes'], self.getNode)
+
+  @nodes.setter
+  def nodes(self, name):
+    '''
+    Adds a new L{NodeInfo} with given name. 
+    @note: If the NodeInfo already exists, do nothing.
+    '''
+    if (name is None) or not name:
+      return None
+    if not name in self._index()['nodes']:
+      self._index()['nodes'][name] = [[], [], [], None]
+      self._addInfo(NodeInfo(name, self.masteruri))
+
+  @property
+  def node_names(self):
+    '''
+    Returns the list with node names
+    @rtype: C{[str, ...]}
+    '''
+    return self._index()['nodes'].keys()
+
+  @property
+  def node_uris(self):
+    '''
+    Returns the list with node URI's.
+    @rtype: C{[str, ...]}
+    '''
+    return [self.getNode(name).uri for name in self.node_names]
+
+  @property
+  def topics(self):
+    '''
+    Returns the dictionary with topic names and corresponding L{TopicInfo} instances.
+    @rtype: C{dict(str:L{TopicInfo}, ...)}
+    '''
+    return _LazyInfoDict(self._index()['topics'], self.getTopic)
+
+  @topics.setter
+  def topics(self, name):
+    '''
+    Adds a new TopicInfo with given name. If the L{TopicInfo} already exists, do
+    nothing.
+    '''
+    if (name is None) or not name:
+      return None
+    if not name in self._index()['topics']:
+      self._index()['topics'][name] = [[], [], None]
+      self._addInfo(TopicInfo(name))
+
+  @property
+  def topic_names(self):
+    '''
+    Returns the list with topic names.
+    @rtype: C{[str, ...]}
+    '''
+    return self._index()['topics'].keys()
+
+  @property
+  def services(self):
+    '''
+    Returns the dictionary with service names and corresponding L{ServiceInfo} instances.
+    @rtype: C{dict(str:L{ServiceInfo}, ...)}
+    '''
+    return _LazyInfoDict(self._index()['services'], self.getService)
+
+  @services.setter
+  def services(self, name):
+    '''
+    Adds a new L{ServiceInfo} with given name. If the L{ServiceInfo} already exists, do
+    nothing.
+    '''
+    if (name is None) or not name:
+      return None
+    if not name in self._index()['services']:
+      self._index()['services'][name] = [[], None]
+      self._addInfo(ServiceInfo(name, self.masteruri))
+
+  @property
+  def service_names(self):
+    '''
+    Returns the list with service names.
+    @rtype: C{[str, ...]}
+    '''
+    return self._index()['services'].keys()
+
+  @property
+  def service_uris(self):
+    '''
+    Returns the list with service URI's.
+    @rtype: C{[str, ...]}
+    '''
+    return [self.getService(name).uri for name in self.service_names]
+
+  def getNode(self, name):
+    '''
+    @param name: the name of the node
+    @type name: str
+    @return: the instance of the L{NodeInfo} with given name
+    @rtype: L{NodeInfo} or C{None}
+    '''
+    if (name is None) or not name:
+      return None
+    result = self.__infos['nodes'].get(name, None)
+    if result is None:
+      entry = self._index()['nodes'].get(name, None)
+      if not entry is None:
+        (published, subscribed, services, node) = entry
+        result = NodeInfo(name, self.masteruri)
+        result.publishedTopics = list(published)
+        result.subscribedTopics = list(subscribed)
+        result.services = list(services)
+        if not node is None:
+          (nodename, uri, masteruri, pid, local) = node
+          result.uri = uri
+          result.masteruri = masteruri
+          result.pid = pid
+        self._fromRaw(result, entry)
+    return result
+
+  def getNodeEndsWith(self, suffix):
+    '''
+    Returns the node, which name ends with given suffix
+    @param suffix: the end of the name
+    @type suffix: C{str}
+    @return: the instance of the L{NodeInfo} with with given suffix
+    @rtype: L{NodeInfo} or C{None}
+    '''
+    if (suffix is None) or not suffix:
+      return None
+    for name in self.node_names:
+      if name.endswith(suffix):
+        return self.getNode(name)
+    return None
+
+  def getTopic(self, name):
+    '''
+    @param name: the name of the topic
+    @type name: C{str}
+    @return: the instance of the L{TopicInfo} with given name
+    @rtype: L{NodeInfo} or C{None}
+    '''
+    if (name is None) or not name:
+      return None
+    result = self.__infos['topics'].get(name, None)
+    if result is None:
+      entry = self._index()['topics'].get(name, None)
+      if not entry is None:
+        (publisher, subscriber, type) = entry
+        result = TopicInfo(name)
+        result.publisherNodes = list(publisher)
+        result.subscriberNodes = list(subscriber)
+        result.type = type
+        self._fromRaw(result, entry)
+    return result
+
+  def getService(self, name):
+    '''
+    @param name: the name of the service
+    @type name: C{str}
+    @return: the instance of the L{ServiceInfo} with given name
+    @rtype: L{ServiceInfo} or C{None}
+    '''
+    if (name is None) or not name:
+      return None
+    result = self.__infos['services'].get(name, None)
+    if result is None:
+      entry = self._index()['services'].get(name, None)
+      if not entry is None:
+        (provider, service) = entry
+        result = ServiceInfo(name, self.masteruri)
+        for n in provider:
+          result.serviceProvider = n
+        if not service is None:
+          (servicename, uri, masteruri, type, local) = service
+          result.uri = uri
+          result.masteruri = masteruri
+          result.type = type
+        self._fromRaw(result, entry)
+    return result
+
+  @property
+  def digests(self):
+    '''
+    Returns the digests of the contained nodes, topics and services. The not 
+    yet created info instances are not created.
+    @rtype: C{dict(str:int)}
+    '''
+    self._index()
+    result = MasterInfo.digests.fget(self)
+    for kind, digest in self.__raw_digests.iteritems():
+      result[kind] ^= digest
+    return result
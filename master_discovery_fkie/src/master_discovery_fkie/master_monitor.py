@@ -30,14 +30,24 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import collections
+import copy
 import cStringIO
+import errno
+import os
+import Queue
+import random
+import select
+import sys
 import threading
 import xmlrpclib
 import socket
 import time
+import urlparse
 from SimpleXMLRPCServer import SimpleXMLRPCServer
 from SimpleXMLRPCServer import SimpleXMLRPCRequestHandler
-from SocketServer import ThreadingMixIn
+from SocketServer import ThreadingMixIn, TCPServer
+from multiprocessing.pool import ThreadPool
 
 import roslib; roslib.load_manifest('master_discovery_fkie')
 import roslib.network
@@ -47,6 +57,10 @@ import rosnode
 from master_discovery_fkie.msg import *
 from master_discovery_fkie.srv import *
 from master_info import MasterInfo, NodeInfo, TopicInfo, ServiceInfo
+from monitor_client import TimeoutTransport
+from phase_timer import PhaseTimer
+from service_prober import ServiceProber
+import state_codec
 import interface_finder
 
 class MasterConnectionException(Exception):
@@ -61,8 +75,509 @@ def _succeed(args):
         raise rosnode.ROSNodeException("remote call failed: %s"%msg)
     return val
 
+class ServiceProxyByURI(rospy.ServiceProxy):
+  '''
+  A service client connecting to the given URI of the service instead of 
+  looking up the service on the ROS master of this node. Used for the services
+  registered on another local ROS master.
+  '''
+  def __init__(self, name, service_class, uri, persistent=False):
+    '''
+    @param uri: the URI of the service, e.g. C{rosrpc://host:port}
+    @type uri: C{str}
+    '''
+    rospy.ServiceProxy.__init__(self, name, service_class, persistent=persistent)
+    self.service_uri = uri
+
+  def _get_service_uri(self, request):
+    return rospy.parse_rosrpc_uri(self.service_uri)
+
+class RPCRequestHandler(SimpleXMLRPCRequestHandler):
+  '''
+  Handles additionally to the XML-RPC requests the HTTP GET requests for the 
+  binary data registered by L{RPCThreading.register_binary_function()}.
+  '''
+  def do_POST(self):
+    # the deferred functions need the connection of the current request
+    self.server._current.handler = self
+    try:
+      SimpleXMLRPCRequestHandler.do_POST(self)
+    finally:
+      self.server._current.handler = None
+
+  def do_GET(self):
+    path, _, query = self.path.partition('?')
+    func = self.server._binary_funcs.get(path, None)
+    if func is None:
+      self.report_404()
+      return
+    try:
+      params = dict(urlparse.parse_qsl(query))
+      data = func(**params)
+    except:
+      import traceback
+      self.log_error("%s", traceback.format_exc())
+      self.send_response(500)
+      self.send_header("Content-length", "0")
+      self.end_headers()
+      return
+    if data is None:
+      self.send_response(304)
+      self.send_header("Content-length", "0")
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header("Content-type", "application/octet-stream")
+    self.send_header("Content-length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+
 class RPCThreading(ThreadingMixIn, SimpleXMLRPCServer):
-  pass
+  '''
+  The XML-RPC server handles each request in its own thread. Additionally to 
+  the normal functions, functions returning already marshalled responses can 
+  be registered, so the responses can be cached. Binary data is served on 
+  HTTP GET requests to the paths registered by L{register_binary_function()}.
+  The functions registered by L{register_deferred_function()} can send their 
+  response later, without holding the thread of the request.
+  '''
+
+  DEFERRED_SEND_TIMEOUT = 5.
+  ''' @ivar: the timeout in seconds to send a deferred response (Default: 5 sec)'''
+  request_queue_size = 32
+  ''' @ivar: the listen backlog, increased for the reconnects of the waiting clients after a change'''
+
+  def __init__(self, *args, **kwargs):
+    kwargs.setdefault('requestHandler', RPCRequestHandler)
+    SimpleXMLRPCServer.__init__(self, *args, **kwargs)
+    self._marshaled_funcs = dict()
+    self._binary_funcs = dict()
+    self._deferred_funcs = dict()
+    self._current = threading.local()
+    self._detached = set()
+    '''@ivar: the connections closed after the deferred response'''
+    self._detached_lock = threading.Lock()
+    self._metrics_lock = threading.Lock()
+    self._in_flight = 0
+    self._rejected = 0
+
+  def register_marshaled_function(self, function, name):
+    '''
+    Registers a function, which returns the marshalled XML-RPC response.
+    @param function: the function returning the result of C{xmlrpclib.dumps()}
+    @param name: the name of the RPC method
+    @type name: C{str}
+    '''
+    self._marshaled_funcs[name] = function
+    # register also as normal function to list it by introspection 
+    self.register_function(function, name)
+
+  def register_binary_function(self, function, path):
+    '''
+    Registers a function, which returns the data for HTTP GET requests to 
+    given path. The query parameter of the request are passed as keyword 
+    arguments. If the function returns C{None}, the status 304 (Not Modified) 
+    will be sent.
+    @param function: the function returning the data or C{None}
+    @param path: the HTTP path
+    @type path: C{str}
+    '''
+    self._binary_funcs[path] = function
+
+  def register_deferred_function(self, function, name):
+    '''
+    Registers a function, which can defer its response. The function is called
+    with a responder followed by the parameter of the request. It returns the 
+    marshalled response or C{None}; in this case the connection is held open 
+    and the response is sent by calling the responder with the marshalled 
+    response from any thread.
+    @param function: the function C{<method>(responder, *params)}
+    @param name: the name of the RPC method
+    @type name: C{str}
+    '''
+    self._deferred_funcs[name] = function
+    # register also as normal function to list it by introspection 
+    self.register_function(function, name)
+
+  def process_request_thread(self, request, client_address):
+    with self._metrics_lock:
+      self._in_flight += 1
+    try:
+      ThreadingMixIn.process_request_thread(self, request, client_address)
+    finally:
+      with self._metrics_lock:
+        self._in_flight -= 1
+
+  def metrics(self):
+    '''
+    Returns the counters of the requests: C{in_flight} handled requests, 
+    C{queued} requests waiting for a worker and the count of C{rejected} 
+    requests since start.
+    @rtype: C{dict(str: int)}
+    '''
+    with self._metrics_lock:
+      return {'in_flight': self._in_flight, 'queued': 0, 'rejected': self._rejected}
+
+  def shutdown_request(self, request):
+    with self._detached_lock:
+      if request in self._detached:
+        # closed after the deferred response
+        self._detached.discard(request)
+        return
+    TCPServer.shutdown_request(self, request)
+
+  def _dispatch_deferred(self, func, params):
+    '''
+    Calls the deferred function in the thread of the request. If the response 
+    is deferred, the output of the request handler is dropped, so the 
+    handler thread finishes without closing the connection.
+    @return: the marshalled response or an empty string, if the response is deferred
+    @rtype: C{str}
+    '''
+    handler = self._current.handler
+    request = handler.request
+    # the deferred response is sent by a copy of the handler writing to the 
+    # connection, the handler itself finishes with a dropped output
+    responder = copy.copy(handler)
+    handler.wfile = cStringIO.StringIO()
+    with self._detached_lock:
+      self._detached.add(request)
+    deferred = False
+    try:
+      result = func(lambda response: self._send_deferred(responder, response), *params)
+      deferred = result is None
+    finally:
+      if not deferred:
+        with self._detached_lock:
+          self._detached.discard(request)
+        handler.wfile = responder.wfile
+    if deferred:
+      handler.close_connection = 1
+      return ''
+    return result
+
+  def _send_deferred(self, handler, response):
+    '''
+    Sends the deferred response in the protocol version of the request handler 
+    and closes the connection.
+    @param handler: the copy of the request handler writing to the connection
+    @type handler: L{RPCRequestHandler}
+    @param response: the marshalled response
+    @type response: C{str}
+    '''
+    try:
+      handler.request.settimeout(self.DEFERRED_SEND_TIMEOUT)
+      handler.send_response(200)
+      handler.send_header("Content-type", "text/xml")
+      handler.send_header("Content-length", str(len(response)))
+      handler.send_header("Connection", "close")
+      handler.end_headers()
+      handler.wfile.write(response)
+      handler.wfile.flush()
+    except socket.error:
+      pass
+    finally:
+      TCPServer.shutdown_request(self, handler.request)
+
+  def _marshaled_dispatch(self, data, dispatch_method=None, path=None):
+    # the request is parsed only once, also for the normal functions
+    try:
+      params, method = xmlrpclib.loads(data)
+      deferred = self._deferred_funcs.get(method, None)
+      if not deferred is None:
+        return self._dispatch_deferred(deferred, params)
+      func = self._marshaled_funcs.get(method, None)
+      if not func is None:
+        return func(*params)
+      if not dispatch_method is None:
+        response = dispatch_method(method, params)
+      else:
+        response = self._dispatch(method, params)
+      return xmlrpclib.dumps((response,), methodresponse=1,
+                             allow_none=self.allow_none, encoding=self.encoding)
+    except xmlrpclib.Fault, fault:
+      return xmlrpclib.dumps(fault, allow_none=self.allow_none, encoding=self.encoding)
+    except:
+      exc_type, exc_value, exc_tb = sys.exc_info()
+      return xmlrpclib.dumps(xmlrpclib.Fault(1, "%s:%s" % (exc_type, exc_value)),
+                             encoding=self.encoding, allow_none=self.allow_none)
+
+
+class PooledRPCRequestHandler(RPCRequestHandler):
+  '''
+  Handles only one request of a persistent HTTP/1.1 connection, the 
+  connection is kept by the L{RPCThreadPool} until the next request. The 
+  buffered reader of the connection is kept by the server, too, so the data 
+  of the next request already read into the buffer is not lost.
+  '''
+  protocol_version = 'HTTP/1.1'
+  timeout = 30.
+
+  def setup(self):
+    RPCRequestHandler.setup(self)
+    reader = self.server._connectionReader(self.request, self.rfile)
+    if not reader is self.rfile:
+      self.rfile.close()
+      self.rfile = reader
+
+  def handle(self):
+    self.close_connection = 1
+    self.handle_one_request()
+
+  def finish(self):
+    # the reader is closed with the connection by the server
+    if not self.wfile.closed:
+      try:
+        self.wfile.flush()
+      except socket.error:
+        pass
+    self.wfile.close()
+
+
+class OverloadRequestHandler(SimpleXMLRPCRequestHandler):
+  '''
+  Answers the requests rejected by a full L{RPCThreadPool}: the XML-RPC 
+  requests with the fault L{RPCThreadPool.FAULT_OVERLOADED}, all other with 
+  the status 503.
+  '''
+  timeout = 1.
+
+  def do_POST(self):
+    # read the request, the client expects the response after sending
+    self.rfile.read(int(self.headers.get("content-length", 0)))
+    response = xmlrpclib.dumps(xmlrpclib.Fault(RPCThreadPool.FAULT_OVERLOADED, "server overloaded, try again later"),
+                               methodresponse=1)
+    self.send_response(200)
+    self.send_header("Content-type", "text/xml")
+    self.send_header("Content-length", str(len(response)))
+    self.end_headers()
+    self.wfile.write(response)
+
+  def do_GET(self):
+    self.send_response(503)
+    self.send_header("Content-length", "0")
+    self.end_headers()
+
+
+class RPCThreadPool(RPCThreading):
+  '''
+  The XML-RPC server handles the requests by a fixed count of worker threads. 
+  The connections are kept open (HTTP/1.1 keep-alive): between the requests 
+  an idle connection is watched by one thread using C{poll()} and does not 
+  hold a worker. 
+  If the queue of waiting requests is full, the request is answered with the 
+  fault L{FAULT_OVERLOADED} by a separate thread.
+  '''
+
+  FAULT_OVERLOADED = -32400
+  ''' @ivar: the fault code of the rejected requests (the code of a system error in the XML-RPC fault code specification)'''
+  KEEPALIVE_TIMEOUT = 15.
+  ''' @ivar: an idle connection is closed after this time in seconds (Default: 15 sec)'''
+
+  def __init__(self, addr, workers=8, queue_limit=64, **kwargs):
+    '''
+    @param addr: the address of the server
+    @type addr: C{(str, int)}
+    @param workers: the count of the worker threads
+    @type workers: C{int} (Default: C{8})
+    @param queue_limit: the maximal count of the requests waiting for a worker
+    @type queue_limit: C{int} (Default: C{64})
+    '''
+    kwargs.setdefault('requestHandler', PooledRPCRequestHandler)
+    RPCThreading.__init__(self, addr, **kwargs)
+    self._queue = Queue.Queue(max(1, queue_limit))
+    self._reject_queue = Queue.Queue(max(1, queue_limit))
+    self._idle = dict()
+    '''@ivar: the idle connections C{{socket: (client address, since)}}'''
+    self._idle_added = []
+    '''@ivar: the idle connections not yet watched by the idle thread'''
+    self._idle_lock = threading.Lock()
+    self._readers = dict()
+    '''@ivar: the buffered readers of the open connections C{{socket: file}}'''
+    self._wakeup_r, self._wakeup_w = os.pipe()
+    self._finish = False
+    self._threads = []
+    for i in range(max(1, workers)):
+      self._startThread(self._worker_loop)
+    self._startThread(self._idle_loop)
+    self._startThread(self._reject_loop)
+
+  def _startThread(self, target):
+    thread = threading.Thread(target=target)
+    thread.setDaemon(True)
+    thread.start()
+    self._threads.append(thread)
+
+  def process_request(self, request, client_address):
+    self._enqueue(request, client_address)
+
+  def metrics(self):
+    with self._metrics_lock:
+      return {'in_flight': self._in_flight, 'queued': self._queue.qsize(), 'rejected': self._rejected}
+
+  def shutdown(self):
+    RPCThreading.shutdown(self)
+    self._finish = True
+    for i in range(len(self._threads)):
+      try:
+        self._queue.put_nowait(None)
+      except Queue.Full:
+        pass
+    self._reject_queue.put(None)
+    os.write(self._wakeup_w, 'x')
+
+  def shutdown_request(self, request):
+    self._dropReader(request)
+    RPCThreading.shutdown_request(self, request)
+
+  def _connectionReader(self, request, rfile):
+    '''
+    Returns the kept reader of the connection. The given reader is kept, if 
+    the connection has no reader yet.
+    '''
+    return self._readers.setdefault(request, rfile)
+
+  def _dropReader(self, request):
+    reader = self._readers.pop(request, None)
+    if not reader is None:
+      reader.close()
+
+  def _hasBufferedRequest(self, request):
+    '''
+    Returns C{True}, if the reader of the connection has already read data of 
+    the next request into its buffer. This data is not seen by C{poll()}.
+    '''
+    reader = self._readers.get(request, None)
+    if reader is None:
+      return False
+    buf = reader._rbuf
+    buf.seek(0, 2)
+    return buf.tell() > 0
+
+  def _enqueue(self, request, client_address):
+    '''
+    Adds the connection with a pending request to the queue of the workers or 
+    rejects it, if the queue is full.
+    '''
+    try:
+      self._queue.put_nowait((request, client_address))
+    except Queue.Full:
+      with self._metrics_lock:
+        self._rejected += 1
+      try:
+        self._reject_queue.put_nowait((request, client_address))
+      except Queue.Full:
+        self._dropReader(request)
+        TCPServer.shutdown_request(self, request)
+
+  def _worker_loop(self):
+    while True:
+      item = self._queue.get()
+      if item is None:
+        return
+      (request, client_address) = item
+      with self._metrics_lock:
+        self._in_flight += 1
+      keep_alive = False
+      try:
+        handler = self.RequestHandlerClass(request, client_address, self)
+        keep_alive = not handler.close_connection
+      except:
+        self.handle_error(request, client_address)
+      finally:
+        with self._metrics_lock:
+          self._in_flight -= 1
+      if keep_alive and not self._finish and self._hasBufferedRequest(request):
+        self._enqueue(request, client_address)
+      elif keep_alive and not self._finish:
+        with self._idle_lock:
+          self._idle[request] = (client_address, time.time())
+          self._idle_added.append(request)
+        os.write(self._wakeup_w, 'x')
+      else:
+        self.shutdown_request(request)
+
+  def _idle_loop(self):
+    '''
+    Watches the idle connections: a connection with a new request is added to 
+    the queue of the workers, a connection without requests since 
+    L{KEEPALIVE_TIMEOUT} is closed. The connections are registered once by 
+    C{poll()}, so the costs of a wake up do not depend on the count of idle 
+    connections.
+    '''
+    poller = select.poll()
+    poller.register(self._wakeup_r, select.POLLIN)
+    watched = dict()
+    last_expire_check = time.time()
+    while not self._finish:
+      with self._idle_lock:
+        added = self._idle_added
+        self._idle_added = []
+      for s in added:
+        try:
+          fd = s.fileno()
+        except socket.error:
+          continue
+        watched[fd] = s
+        poller.register(fd, select.POLLIN | select.POLLPRI)
+      try:
+        events = poller.poll(1000)
+      except select.error, e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+      ready = []
+      expired = []
+      with self._idle_lock:
+        for (fd, event) in events:
+          if fd == self._wakeup_r:
+            os.read(self._wakeup_r, 4096)
+            continue
+          s = watched.pop(fd, None)
+          poller.unregister(fd)
+          if s is None or not s in self._idle:
+            continue
+          (client_address, since) = self._idle.pop(s)
+          if event & (select.POLLERR | select.POLLNVAL):
+            expired.append(s)
+          else:
+            ready.append((s, client_address))
+        now = time.time()
+        if now - last_expire_check >= 1.:
+          last_expire_check = now
+          for (s, (client_address, since)) in self._idle.items():
+            if now - since > self.KEEPALIVE_TIMEOUT:
+              expired.append(s)
+              del self._idle[s]
+              try:
+                fd = s.fileno()
+                watched.pop(fd, None)
+                poller.unregister(fd)
+              except (socket.error, KeyError):
+                pass
+      for (s, client_address) in ready:
+        self._enqueue(s, client_address)
+      for s in expired:
+        self.shutdown_request(s)
+    with self._idle_lock:
+      for s in self._idle.keys():
+        self.shutdown_request(s)
+      self._idle = dict()
+      self._idle_added = []
+
+  def _reject_loop(self):
+    while True:
+      item = self._reject_queue.get()
+      if item is None:
+        return
+      (request, client_address) = item
+      try:
+        OverloadRequestHandler(request, client_address, self)
+      except:
+        pass
+      self.shutdown_request(request)
+
 
 class MasterMonitor(object):
   '''
@@ -71,34 +586,134 @@ class MasterMonitor(object):
   to offer the complete current state of the ROS master by one method call.
   @see: L{getState()}
   RPC Methods:
-  @see: L{getListedMasterInfo()} or L{getMasterContacts()} as RPC: C{masterInfo()} and 
-  C{masterContacts()}
-  @group RPC-methods: getListedMasterInfo, getMasterContacts
+  @see: L{getListedMasterInfo()}, L{getListedMasterInfoSince()}, 
+  L{getListedMasterInfoIfChanged()} or L{getMasterContacts()} as RPC: 
+  C{masterInfo()}, C{masterInfoSince()}, C{masterInfoIfChanged()} and 
+  C{masterContacts()}. The responses of the C{masterInfo*} methods are cached 
+  until the state is changed.
+  Additionally the state is served as compressed binary data on HTTP GET 
+  requests to L{state_codec.BINARY_PATH}, see L{getBinaryMasterInfo()}.
+  The RPC C{waitForChange()} answers like C{masterInfoSince()} as soon as the 
+  state is changed (long polling), see L{_deferredWaitForChange()}.
+  With enabled L{DIAGNOSTICS} the RPC C{monitorStats()} returns the times of 
+  the update phases and the counters of the RPC server, see L{getMonitorStats()}.
+  @group RPC-methods: getListedMasterInfo, getListedMasterInfoSince, getListedMasterInfoIfChanged, getMasterContacts, getMonitorStats
   '''
 
-  def __init__(self, rpcport=11611):
+  MAX_CHANGELOG = 20
+  ''' @ivar: the count of state changes stored to answer the C{masterInfoSince()} requests (Default: 20)'''
+  BINARY_TRANSPORT = True
+  ''' @ivar: serve the state additionally as compressed binary data on L{state_codec.BINARY_PATH} of the RPC server (Default: C{True})'''
+  WAIT_TIMEOUT_MAX = 60.
+  ''' @ivar: the maximal time in [sec] a C{waitForChange()} request is held open (Default: 60 sec)'''
+  RPC_WORKERS = 0
+  ''' @ivar: the count of worker threads of the RPC server with persistent 
+  connections, see L{RPCThreadPool}. 0 creates a thread for each request 
+  like L{RPCThreading} (Default: 0)'''
+  RPC_QUEUE_LIMIT = 64
+  ''' @ivar: the maximal count of requests waiting for a worker of the RPC 
+  server, further requests are rejected with a fault (Default: 64)'''
+  DIAGNOSTICS = False
+  ''' @ivar: measure the times of the update phases of the master state and 
+  provide them by the RPC C{monitorStats()}, see L{PhaseTimer} (Default: C{False})'''
+
+  FULL_UPDATE_INTERVAL = 15.
+  ''' @ivar: the current state will be reused while the ROS master reports the 
+  same system state, topic types and node URIs, but at most for this time in 
+  [sec]. After this time the pids of the nodes and types of the services are 
+  requested again. (Default: 15 sec)'''
+  PID_WORKERS = 8
+  ''' @ivar: the count of threads used to request the pids of the nodes (Default: 8)'''
+  PID_TIMEOUT = 3.
+  ''' @ivar: the timeout for a pid request in [sec] (Default: 3 sec)'''
+  PID_TRANSPORTS = 64
+  ''' @ivar: the count of persistent connections kept by each pid thread, the least recently used is closed first (Default: 64)'''
+  CACHE_REFRESH_INTERVAL = 60.
+  ''' @ivar: the pids of the nodes and types of the services are cached by their 
+  name and URI. A cached value will be requested again after this time in [sec] 
+  with a random variation of 50%, to detect crashed nodes. (Default: 60 sec)'''
+
+  def __init__(self, rpcport=11611, masteruri=None):
     '''
     Initialize method. Creates an XML-RPC server on given port and starts this
     in its own thread.
     @param rpcport: the port number for the XML-RPC server
     @type rpcport:  C{int}
+    @param masteruri: the URI of another local ROS master to monitor. The 
+    parameter C{~name} and C{/mastername} are only used for the ROS master of 
+    this node.
+    @type masteruri:  C{str} (Default: C{None} for the ROS master of this node)
     '''
     self._state_access_lock = threading.RLock()
     self._create_access_lock = threading.RLock()
     self._lock = threading.RLock()
-    self.__masteruri = self._masteruri_from_ros()
+    self._own_master = masteruri is None
+    self.__masteruri = self._masteruri_from_ros() if self._own_master else masteruri
     self.__new_master_state = None
     self.__masteruri_rpc = None
     self.__mastername = None
     self.ros_node_name = str(rospy.get_name())
-    if rospy.has_param('~name'):
+    self._service_prober = ServiceProber(self.ros_node_name)
+    if self._own_master and rospy.has_param('~name'):
       self.__mastername = rospy.get_param('~name')
     self.__mastername = self.getMastername()
-    rospy.set_param('/mastername', self.__mastername)
-
+    if self._own_master:
+      rospy.set_param('/mastername', self.__mastername)
+    if rospy.has_param('~full_update_interval'):
+      MasterMonitor.FULL_UPDATE_INTERVAL = rospy.get_param('~full_update_interval')
+    if rospy.has_param('~binary_transport'):
+      MasterMonitor.BINARY_TRANSPORT = rospy.get_param('~binary_transport')
+    if rospy.has_param('~wait_timeout_max'):
+      MasterMonitor.WAIT_TIMEOUT_MAX = rospy.get_param('~wait_timeout_max')
+    if rospy.has_param('~rpc_workers'):
+      MasterMonitor.RPC_WORKERS = rospy.get_param('~rpc_workers')
+    if rospy.has_param('~rpc_queue_limit'):
+      MasterMonitor.RPC_QUEUE_LIMIT = rospy.get_param('~rpc_queue_limit')
+    if rospy.has_param('~diagnostics'):
+      MasterMonitor.DIAGNOSTICS = rospy.get_param('~diagnostics')
+    self.phase_timer = PhaseTimer(MasterMonitor.DIAGNOSTICS)
+    '''@ivar: the times of the update phases, see L{updateState()}'''
+    self._stats_sources = []
+    if rospy.has_param('~pid_workers'):
+      MasterMonitor.PID_WORKERS = max(1, rospy.get_param('~pid_workers'))
+    self._pid_pool = None
+    self._transports = threading.local()
+    self._contacts_resolver = None
+    self._waiters = []
+    '''@ivar: the deferred C{waitForChange()} requests C{[(deadline, timestamp, responder)]}'''
+    self._waiters_event = threading.Event()
+    self._waiters_finish = False
+    # a small pool sends the deferred responses, so slow clients do not delay the others
+    self._wait_pool = ThreadPool(2)
 
     self.__master_state = None
     '''@ivar: the current state of the ROS master'''
+    self.__listed_state = None
+    '''@ivar: the current state of the ROS master as returned by L{MasterInfo.listedState()}'''
+    self.__changelog = []
+    '''@ivar: the list with last changes C{(since_stamp, stamp, updated, removed)}, see L{MasterInfo.listed_delta()}'''
+    self.__marshaled = dict()
+    '''@ivar: the cached marshalled responses of the RPC methods for the current state'''
+    self.__raw_state = None
+    '''@ivar: the topic types and system state reported by the ROS master on last complete update'''
+    self.__raw_state_ts = 0
+    '''@ivar: the time of the last complete update'''
+    self.__pid_cache = dict()
+    '''@ivar: the cached pids of the local nodes C{{(name, uri): (pid, expire time)}}'''
+    self.__service_type_cache = dict()
+    '''@ivar: the cached types of the local services C{{(name, uri): (type, expire time)}}'''
+    self.__sync_service = None
+    '''@ivar: the name and URI of the used C{get_sync_info} service'''
+    self.__sync_proxy = None
+    '''@ivar: the persistent client of the C{get_sync_info} service'''
+    self.__sync_lookup_digest = None
+    '''@ivar: the digest of the services on last search without a C{get_sync_info} service'''
+    self.__sync_hosts = dict()
+    '''@ivar: the last reported synchronized nodes and services C{{masteruri: (nodes, services)}}'''
+    self.__sync_node_origins = dict()
+    '''@ivar: the origin ROS master URI of the synchronized nodes C{{name: masteruri}}'''
+    self.__sync_service_origins = dict()
+    '''@ivar: the origin ROS master URI of the synchronized services C{{name: masteruri}}'''
     self.rpcport = rpcport
     '''@ivar: the port number of the RPC server'''
     
@@ -106,14 +721,28 @@ class MasterMonitor(object):
     ready = False
     while not ready and (not rospy.is_shutdown()):
       try:
-        self.rpcServer = RPCThreading(('', rpcport), logRequests=False, allow_none=True)
+        if MasterMonitor.RPC_WORKERS > 0:
+          self.rpcServer = RPCThreadPool(('', rpcport), MasterMonitor.RPC_WORKERS, MasterMonitor.RPC_QUEUE_LIMIT, 
+                                         logRequests=False, allow_none=True)
+        else:
+          self.rpcServer = RPCThreading(('', rpcport), logRequests=False, allow_none=True)
         rospy.loginfo("Start RPC-XML Server at %s", self.rpcServer.server_address)
         self.rpcServer.register_introspection_functions()
-        self.rpcServer.register_function(self.getListedMasterInfo, 'masterInfo')
+        self.rpcServer.register_marshaled_function(self._marshaledMasterInfo, 'masterInfo')
+        self.rpcServer.register_marshaled_function(self._marshaledMasterInfoSince, 'masterInfoSince')
+        self.rpcServer.register_marshaled_function(self._marshaledMasterInfoIfChanged, 'masterInfoIfChanged')
         self.rpcServer.register_function(self.getMasterContacts, 'masterContacts')
+        self.rpcServer.register_deferred_function(self._deferredWaitForChange, 'waitForChange')
+        if MasterMonitor.DIAGNOSTICS:
+          self.rpcServer.register_function(self.getMonitorStats, 'monitorStats')
+        if MasterMonitor.BINARY_TRANSPORT:
+          self.rpcServer.register_binary_function(self.getBinaryMasterInfo, state_codec.BINARY_PATH)
         self._rpcThread = threading.Thread(target = self.rpcServer.serve_forever)
         self._rpcThread.setDaemon(True)
         self._rpcThread.start()
+        self._waitersThread = threading.Thread(target = self._notifyWaiters_loop)
+        self._waitersThread.setDaemon(True)
+        self._waitersThread.start()
         ready = True
       except socket.error:
         rospy.logwarn(''.join(["Error while start RPC-XML server on port ", str(rpcport), ". Try again..."]))
@@ -147,76 +776,138 @@ class MasterMonitor(object):
     '''
     if hasattr(self, 'rpcServer'):
       self.rpcServer.shutdown()
+    with self._state_access_lock:
+      self._waiters_finish = True
+      self._waiters_event.set()
+    if not self._pid_pool is None:
+      self._pid_pool.terminate()
+    with self._create_access_lock:
+      self._closeSyncProxy()
 
   def _getNodePid(self, nodes):
     '''
-    Gets process id of the node.
-    @param nodename: the name of the node
-    @type nodename: C{str}
-    @param uri: the uri of the node
-    @type uri: C{str}
+    Gets process id of the nodes. The requests are performed by a pool of 
+    L{PID_WORKERS} threads.
+    @param nodes: the dictionary with nodes C{{name: uri}}
+    @type nodes: C{dict}
     '''
-    for (nodename, uri) in nodes.items():
-      if not uri is None:
-        pid = None
-        try:
-          socket.setdefaulttimeout(3)
-          node = xmlrpclib.ServerProxy(uri)
-          pid = _succeed(node.getPid(self.ros_node_name))
-        except (Exception, socket.error):
-    #      import traceback
-    #      print traceback.format_exc()
-          master = xmlrpclib.ServerProxy(self.getMasteruri())
-    #      print "request again nodeuri for", nodename
-          code, message, new_uri = master.lookupNode(self.ros_node_name, nodename)
-          with self._lock:
-            self.__new_master_state.getNode(nodename).uri = None if (code == -1) else new_uri
+    if self._pid_pool is None:
+      self._pid_pool = ThreadPool(self.PID_WORKERS)
+    results = self._pid_pool.map(self._requestNodePid, [(n, u) for (n, u) in nodes.items() if not u is None])
+    with self._lock:
+      for (nodename, uri, pid, new_uri) in results:
+        if not pid is None:
+          self.__new_master_state.getNode(nodename).pid = pid
+          self.__pid_cache[(nodename, uri)] = (pid, self._cacheExpireTime())
         else:
-          with self._lock:
-            self.__new_master_state.getNode(nodename).pid = pid
-        finally:
-          socket.setdefaulttimeout(None)
+          self.__new_master_state.getNode(nodename).uri = new_uri
+          self.__pid_cache.pop((nodename, uri), None)
 
-  def _getServiceInfo(self, services):
+  def _requestNodePid(self, node):
     '''
-    Gets service info through the RPC interface of the service.
-    @param service: the name of the service
-    @type service: C{str}
-    @param uri: the uri of the service
+    Requests the process id of the node. On errors the URI of the node will be 
+    requested again from the ROS master. Called by the threads of the pid pool.
+    @param node: the tuple with name and URI of the node
+    @type node: C{(str, str)}
+    @return: C{(nodename, uri, pid, new URI)}, the pid is C{None} on errors
+    @rtype: C{(str, str, int, str)}
+    '''
+    (nodename, uri) = node
+    try:
+      node = self._serverProxy(uri)
+      return (nodename, uri, _succeed(node.getPid(self.ros_node_name)), uri)
+    except (Exception, socket.error):
+      self._dropTransport(uri)
+      try:
+        master = self._serverProxy(self.getMasteruri())
+        code, message, new_uri = master.lookupNode(self.ros_node_name, nodename)
+        return (nodename, uri, None, None if (code == -1) else new_uri)
+      except (Exception, socket.error):
+        return (nodename, uri, None, uri)
+
+  def _serverProxy(self, uri):
+    '''
+    Returns a XML-RPC proxy using a transport of the current thread with 
+    persistent connection to the address (host and port) of given URI. Each 
+    thread keeps at most L{PID_TRANSPORTS} transports.
+    @param uri: the URI of the XML-RPC server
     @type uri: C{str}
+    @rtype: C{xmlrpclib.ServerProxy}
     '''
-    for (service, uri) in services.items():
-      if not uri is None:
-        type = dest_addr = dest_port = None
-        try:
-          dest_addr, dest_port = rospy.parse_rosrpc_uri(uri)
-        except:
-    #      print "ERROR while get service info"
-          continue
-#          return
-    #      raise ROSServiceException("service [%s] has an invalid RPC URI [%s]"%(service, uri))
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-          # connect to service and probe it to get the headers
-          s.settimeout(0.5)
-          s.connect((dest_addr, dest_port))
-          header = { 'probe':'1', 'md5sum':'*',
-                    'callerid':self.ros_node_name, 'service':service}
-          roslib.network.write_ros_handshake_header(s, header)
-          type = roslib.network.read_ros_handshake_header(s, cStringIO.StringIO(), 2048)
-          with self._lock:
-            self.__new_master_state.getService(service).type = type['type']
-        except socket.error:
-          pass
-    #      raise ROSServiceIOException("Unable to communicate with service [%s], address [%s]"%(service, uri))
-        except:
-#          import traceback
-#          print traceback.format_exc()
-          pass
-        finally:
-          if s is not None:
-            s.close()
+    if not hasattr(self._transports, 'items'):
+      self._transports.items = collections.OrderedDict()
+    items = self._transports.items
+    netloc = urlparse.urlparse(uri).netloc
+    transport = items.pop(netloc, None)
+    if transport is None:
+      transport = TimeoutTransport(self.PID_TIMEOUT)
+      while len(items) >= self.PID_TRANSPORTS:
+        items.popitem(last=False)[1].close()
+    # the most recently used at the end
+    items[netloc] = transport
+    return xmlrpclib.ServerProxy(uri, transport=transport)
+
+  def _dropTransport(self, uri):
+    '''
+    Closes and removes the transport of the current thread for the address of 
+    given URI, e.g. after a failed request to a node, which is probably gone.
+    @param uri: the URI of the XML-RPC server
+    @type uri: C{str}
+    '''
+    items = getattr(self._transports, 'items', None)
+    if not items is None:
+      transport = items.pop(urlparse.urlparse(uri).netloc, None)
+      if not transport is None:
+        transport.close()
+
+  def _getServiceInfo(self, services):
+    '''
+    Gets the types of the services through the RPC interface of the services. 
+    All services are probed concurrently, see L{ServiceProber}.
+    @param services: the dictionary with services C{{name: uri}}
+    @type services: C{dict}
+    '''
+    types = self._service_prober.probe(services)
+    with self._lock:
+      for (service, uri) in services.items():
+        if service in types:
+          self.__new_master_state.getService(service).type = types[service]
+          self.__service_type_cache[(service, uri)] = (types[service], self._cacheExpireTime())
+        else:
+          self.__service_type_cache.pop((service, uri), None)
 
+  def _cacheExpireTime(self):
+    '''
+    @return: the time until a new cached value is valid
+    @rtype: C{float}
+    '''
+    return time.time() + self.CACHE_REFRESH_INTERVAL * (0.5 + random.random())
+
+  def _takeCached(self, cache, items, now):
+    '''
+    Searches for valid cached values of given items. The found items will be 
+    removed from the C{items} dictionary, so only the items which need to be 
+    requested remain.
+    @param cache: the cache C{{(name, uri): (value, expire time)}}
+    @type cache: C{dict}
+    @param items: the items C{{name: uri}}, changed by this method
+    @type items: C{dict}
+    @param now: the current time
+    @type now: C{float}
+    @return: the cache reduced to the given items, and the dictionary 
+    with valid cached values C{{name: value}}
+    @rtype: C{(dict, dict)}
+    '''
+    new_cache = dict()
+    cached = dict()
+    for name, uri in items.items():
+      entry = cache.get((name, uri), None)
+      if not entry is None:
+        new_cache[(name, uri)] = entry
+        if now < entry[1]:
+          cached[name] = entry[0]
+          del items[name]
+    return new_cache, cached
 
   def getListedMasterInfo(self):
     '''
@@ -260,15 +951,187 @@ class MasterMonitor(object):
                [ [str,str,str,str] ])}
     '''
     with self._state_access_lock:
-      result = (str(time.time()), self.getMasteruri(), str(self.getMastername()), [], [], [], [], [], [] )
-      if not (self.__master_state is None):
-        try:
-          result = self.__master_state.listedState()
-        except:
-          import traceback
-          print traceback.format_exc()
+      if not self.__listed_state is None:
+        return self.__listed_state
+      return (str(time.time()), self.getMasteruri(), str(self.getMastername()), [], [], [], [], [], [] )
+
+  def getListedMasterInfoIfChanged(self, timestamp):
+    '''
+    Returns the roscore state, if it differs from the state with given timestamp.
+    @param timestamp: the timestamp of the state known by the caller, as 
+    returned in the first field of L{getListedMasterInfo()}
+    @type timestamp: C{str}
+    @return: an empty list, if the state is not changed, otherwise see 
+    L{getListedMasterInfo()}
+    @rtype: C{[]} or C{tuple}
+    '''
+    with self._state_access_lock:
+      if not self.__listed_state is None and self.__listed_state[0] == timestamp:
+        return []
+      return self.getListedMasterInfo()
+
+  def _marshaled(self, key, func, *args):
+    '''
+    Returns the marshalled XML-RPC response of given function. The response is 
+    cached until the master state changes.
+    @param key: the key of the response in the cache
+    @param func: the function to create the response
+    @return: the marshalled response
+    @rtype: C{str}
+    '''
+    with self._state_access_lock:
+      result = self.__marshaled.get(key, None)
+      if result is None:
+        result = xmlrpclib.dumps((func(*args),), methodresponse=1, allow_none=True)
+        if not self.__listed_state is None:
+          self.__marshaled[key] = result
+      return result
+
+  def getBinaryMasterInfo(self, ts=None):
+    '''
+    Returns the roscore state encoded by L{state_codec.encode_listed_state()}. 
+    The encoded state is cached until the state is changed.
+    @param ts: the timestamp of the state known by the caller
+    @type ts: C{str}
+    @return: the encoded state or C{None}, if the state with given timestamp 
+    is still valid
+    @rtype: C{str} or C{None}
+    '''
+    with self._state_access_lock:
+      if not ts is None and not self.__listed_state is None and self.__listed_state[0] == ts:
+        return None
+      result = self.__marshaled.get('binary', None)
+      if result is None:
+        result = state_codec.encode_listed_state(self.getListedMasterInfo())
+        if not self.__listed_state is None:
+          self.__marshaled['binary'] = result
       return result
 
+  def getStateSize(self):
+    '''
+    Returns the size of the current state as sent to the remote nodes on a 
+    complete request: the binary encoded state, if L{BINARY_TRANSPORT} is 
+    enabled, otherwise the XML-RPC response of C{masterInfo()}. The encoded 
+    state is cached and used by the following requests.
+    @return: the size in bytes
+    @rtype: C{int}
+    '''
+    if MasterMonitor.BINARY_TRANSPORT:
+      return len(self.getBinaryMasterInfo())
+    return len(self._marshaledMasterInfo())
+
+  def _marshaledMasterInfo(self):
+    return self._marshaled('masterInfo', self.getListedMasterInfo)
+
+  def _marshaledMasterInfoIfChanged(self, timestamp):
+    with self._state_access_lock:
+      changed = self.__listed_state is None or self.__listed_state[0] != timestamp
+      return self._marshaled(('masterInfoIfChanged', changed), self.getListedMasterInfoIfChanged, timestamp)
+
+  def _marshaledMasterInfoSince(self, timestamp):
+    with self._state_access_lock:
+      # cache only the responses for known timestamps, all others get the full state
+      known = (not self.__listed_state is None and self.__listed_state[0] == timestamp) or \
+              timestamp in [since for (since, s, u, r) in self.__changelog]
+      return self._marshaled(('masterInfoSince', timestamp if known else None), self.getListedMasterInfoSince, timestamp)
+
+  def _deferredWaitForChange(self, respond, timestamp, timeout):
+    '''
+    The RPC method C{waitForChange()}: answers like C{masterInfoSince()}, as 
+    soon as the state differs from the state with given timestamp, but at 
+    latest after the timeout, then with an empty delta. The waiting requests 
+    do not hold a thread, they are answered by L{_notifyWaiters_loop()}.
+    @param respond: the method to send the deferred response, see L{RPCThreading.register_deferred_function()}
+    @param timestamp: the timestamp of the state known by the caller
+    @type timestamp: C{str}
+    @param timeout: the maximal time to wait in [sec], limited by L{WAIT_TIMEOUT_MAX}
+    @type timeout: C{float}
+    @return: the marshalled response or C{None}, if the response is deferred
+    @rtype: C{str} or C{None}
+    '''
+    with self._state_access_lock:
+      unchanged = self.__listed_state is None or self.__listed_state[0] == timestamp
+      if unchanged and timeout > 0 and not self._waiters_finish:
+        deadline = time.time() + min(float(timeout), self.WAIT_TIMEOUT_MAX)
+        self._waiters.append((deadline, timestamp, respond))
+        self._waiters_event.set()
+        return None
+    return self._marshaledMasterInfoSince(timestamp)
+
+  def _notifyWaiters_loop(self):
+    '''
+    Answers the deferred C{waitForChange()} requests on change of the state or 
+    after their timeout. On shutdown all requests are answered.
+    '''
+    while True:
+      now = time.time()
+      due = []
+      with self._state_access_lock:
+        stamp = None if self.__listed_state is None else self.__listed_state[0]
+        pending = []
+        for waiter in self._waiters:
+          if self._waiters_finish or waiter[0] <= now or (not stamp is None and waiter[1] != stamp):
+            due.append(waiter)
+          else:
+            pending.append(waiter)
+        self._waiters = pending
+        next_deadline = min([w[0] for w in pending] + [now + 1.])
+        finish = self._waiters_finish
+        self._waiters_event.clear()
+      for (deadline, timestamp, respond) in due:
+        self._wait_pool.apply_async(respond, (self._marshaledMasterInfoSince(timestamp),))
+      if finish:
+        self._wait_pool.close()
+        return
+      self._waiters_event.wait(max(0., next_deadline - time.time()))
+
+  def getListedMasterInfoSince(self, timestamp):
+    '''
+    Returns the changes of the roscore state since the state with given 
+    timestamp. If the changes are not longer available, the complete state 
+    will be returned.
+    @param timestamp: the timestamp of the state known by the caller, as 
+    returned in the first field of L{getListedMasterInfo()}
+    @type timestamp: C{str}
+    @return: C{('delta', (stamp, since_stamp, masteruri, name, updated, removed))}
+             or C{('full', <result of getListedMasterInfo()>)}
+             
+               - C{updated} contains for each list of the roscore state 
+                 C{(publishers, subscribers, services, topicTypes, nodes, serviceProvider)}
+                 the new or changed entries.
+               
+               - C{removed} contains for each of these lists the names of 
+                 the removed entries.
+               
+    @rtype: C{(str, tuple)}
+    @see: L{MasterInfo.apply_listed_delta()}
+    '''
+    with self._state_access_lock:
+      if not self.__listed_state is None:
+        stamp = self.__listed_state[0]
+        since_idx = None
+        if timestamp == stamp:
+          since_idx = len(self.__changelog)
+        else:
+          for idx, (since_stamp, s, u, r) in enumerate(self.__changelog):
+            if since_stamp == timestamp:
+              since_idx = idx
+              break
+        if not since_idx is None:
+          updated = [dict() for i in range(6)]
+          removed = [set() for i in range(6)]
+          for (since_stamp, s, upd, rem) in self.__changelog[since_idx:]:
+            for i in range(6):
+              for name in rem[i]:
+                updated[i].pop(name, None)
+                removed[i].add(name)
+              for entry in upd[i]:
+                removed[i].discard(entry[0])
+                updated[i][entry[0]] = entry
+          return ('delta', (stamp, timestamp, self.__listed_state[1], self.__listed_state[2], 
+                            [u.values() for u in updated], [list(r) for r in removed]))
+      return ('full', self.getListedMasterInfo())
+
   def getCurrentState(self):
     with self._state_access_lock:
       return self.__master_state
@@ -282,68 +1145,57 @@ class MasterMonitor(object):
     with self._create_access_lock:
       now = time.time()
       threads = []
+      timer = self.phase_timer
       try:
-#        import os                                ###################
-#        cputimes = os.times()                    ###################
-#        cputime_init = cputimes[0] + cputimes[1] ###################
         self._lock.acquire(True)
         socket.setdefaulttimeout(5)
-#        cputimes2 = os.times()                    ###################
-#        cputime_init2 = cputimes2[0] + cputimes2[1] ###################
+        phase_start = timer.start()
         self.__new_master_state = master_state = MasterInfo(self.getMasteruri(), self.getMastername())
         master = xmlrpclib.ServerProxy(self.getMasteruri())
         # get topic types
         code, message, topicTypes = master.getTopicTypes(self.ros_node_name)
-#        cputimes2 = os.times()                                            ###################
-#        print "Get types: ", (cputimes2[0] + cputimes2[1] - cputime_init2) ###################
-#        cputimes2 = os.times()                    ###################
-#        cputime_init2 = cputimes2[0] + cputimes2[1] ###################
         #convert topicType list to the dict
         topicTypesDict = {}
         for topic, type in topicTypes:
           topicTypesDict[topic] = type
-#        cputimes2 = os.times()                                            ###################
-#        print "Set types: ", (cputimes2[0] + cputimes2[1] - cputime_init2) ###################
-#        cputimes2 = os.times()                    ###################
-#        cputime_init2 = cputimes2[0] + cputimes2[1] ###################
+        phase_start = timer.lap('topic_types', phase_start)
         # get system state
         code, message, state = master.getSystemState(self.ros_node_name)
-#        cputimes2 = os.times()                                            ###################
-#        print "Get state: ", (cputimes2[0] + cputimes2[1] - cputime_init2) ###################
-#        cputimes2 = os.times()                    ###################
-#        cputime_init2 = cputimes2[0] + cputimes2[1] ###################
+        phase_start = timer.lap('system_state', phase_start)
+        # reuse the current state, if the ROS master reports no changes
+        raw_state = (topicTypes, state)
+        if (not self.__master_state is None and raw_state == self.__raw_state and
+            now - self.__raw_state_ts < self.FULL_UPDATE_INTERVAL):
+          same_uris = self._sameNodeUris(master, self.__master_state)
+          phase_start = timer.lap('node_check', phase_start)
+          if same_uris:
+            self.__new_master_state = self.__master_state
+            self.__master_state.check_ts = now
+            return self.__master_state
 
+        # the lists of the nodes are collected and set at once
+        node_lists = dict() # node: ([published], [subscribed], [services])
         # add published topics
         for t, l in state[0]:
           master_state.topics = t
+          if l:
+            topic = master_state.getTopic(t)
+            topic.publisherNodes = list(l)
+            topic.type = topicTypesDict.get(t, 'None')
           for n in l:
-            master_state.nodes = n
-            master_state.getNode(n).publishedTopics = t
-            master_state.getTopic(t).publisherNodes = n
-            master_state.getTopic(t).type = topicTypesDict.get(t, 'None')
-#        cputimes2 = os.times()                                            ###################
-#        print "read pub topics: ", (cputimes2[0] + cputimes2[1] - cputime_init2) ###################
-#        cputimes2 = os.times()                    ###################
-#        cputime_init2 = cputimes2[0] + cputimes2[1] ###################
+            node_lists.setdefault(n, ([], [], []))[0].append(t)
         # add subscribed topics
         for t, l in state[1]:
           master_state.topics = t
+          if l:
+            topic = master_state.getTopic(t)
+            topic.subscriberNodes = list(l)
+            topic.type = topicTypesDict.get(t, 'None')
           for n in l:
-            master_state.nodes = n
-            master_state.getNode(n).subscribedTopics = t
-            master_state.getTopic(t).subscriberNodes = n
-            master_state.getTopic(t).type = topicTypesDict.get(t, 'None')
-#        cputimes2 = os.times()                                            ###################
-#        print "read sub topics: ", (cputimes2[0] + cputimes2[1] - cputime_init2) ###################
-#        cputimes2 = os.times()                    ###################
-#        cputime_init2 = cputimes2[0] + cputimes2[1] ###################
-#        cputimes = os.times()                                            ###################
-#        print "Auswertung: ", (cputimes[0] + cputimes[1] - cputime_init) ###################
+            node_lists.setdefault(n, ([], [], []))[1].append(t)
+        phase_start = timer.lap('topics', phase_start)
   
         # add services
-#        cputimes = os.times()                    ###################
-#        cputime_init = cputimes[0] + cputimes[1] ###################
-  
         services = dict()
         tmp_slist = []
         # multi-call style xmlrpc to lock up the service uri
@@ -351,8 +1203,7 @@ class MasterMonitor(object):
         for t, l in state[2]:
           master_state.services = t
           for n in l:
-            master_state.nodes = n
-            master_state.getNode(n).services = t
+            node_lists.setdefault(n, ([], [], []))[2].append(t)
             service = master_state.getService(t)
             service.serviceProvider = n
             tmp_slist.append(service)
@@ -362,6 +1213,7 @@ class MasterMonitor(object):
   #            service.uri = None
   #          elif service.isLocal:
   #            services[service.name] = service.uri
+        master_state.setNodeLists(node_lists)
         try:
           r = param_server_multi()
           for (code, msg, uri), service in zip(r, tmp_slist):
@@ -372,10 +1224,15 @@ class MasterMonitor(object):
         except:
           import traceback
           traceback.print_exc()
+        # use the cached types of known services
+        self.__service_type_cache, cached = self._takeCached(self.__service_type_cache, services, now)
+        for name, type in cached.iteritems():
+          master_state.getService(name).type = type
         if services:
           pidThread = threading.Thread(target = self._getServiceInfo, args=((services,)))
           pidThread.start()
           threads.append(pidThread)
+        phase_start = timer.lap('service_lookup', phase_start)
 
         #get additional node information
         nodes = dict()
@@ -395,9 +1252,12 @@ class MasterMonitor(object):
         except:
           import traceback
           traceback.print_exc()
-#        cputimes = os.times() ###################
-#        print "Nodes+Services:", (cputimes[0] + cputimes[1] - cputime_init), ", count nodes:", len(nodes) ###################
+        phase_start = timer.lap('node_lookup', phase_start)
 
+        # use the cached pids of known nodes
+        self.__pid_cache, cached = self._takeCached(self.__pid_cache, nodes, now)
+        for name, pid in cached.iteritems():
+          master_state.getNode(name).pid = pid
         if nodes:
           # get process id of the nodes
           pidThread = threading.Thread(target = self._getNodePid, args=((nodes,)))
@@ -405,6 +1265,8 @@ class MasterMonitor(object):
           threads.append(pidThread)
     
         master_state.timestamp = now
+        self.__raw_state = raw_state
+        self.__raw_state_ts = now
       except socket.error, e:
         if isinstance(e, tuple):
           (errn, msg) = e
@@ -425,9 +1287,6 @@ class MasterMonitor(object):
         self._lock.release()
         socket.setdefaulttimeout(None)
 
-#      cputimes = os.times()                    ###################
-#      cputime_init = cputimes[0] + cputimes[1] ###################
-      
 #      print "threads:", len(threads)
       # wait for all threads are finished 
       while threads:
@@ -437,12 +1296,35 @@ class MasterMonitor(object):
           th.join()
   #        print "release"
         del th
-#      cputimes = os.times() ###################
-#      print "Threads:", (cputimes[0] + cputimes[1] - cputime_init) ###################
+      timer.lap('pid_threads', phase_start)
   #    print "state update of ros master", self.__masteruri, " finished"
 #      return MasterInfo.from_list(master_state.listedState())
       return master_state
   
+  def _sameNodeUris(self, master, master_state):
+    '''
+    Checks by one multi call of C{lookupNode()}, whether the ROS master 
+    reports the URIs of all nodes of the given state. A node restarted with 
+    the same topics and services is recognized only by its new URI.
+    @param master: the proxy of the ROS master
+    @type master: C{xmlrpclib.ServerProxy}
+    @param master_state: the current state
+    @type master_state: L{MasterInfo}
+    @return: C{False}, if an URI is changed or on errors
+    @rtype: C{bool}
+    '''
+    try:
+      param_server_multi = xmlrpclib.MultiCall(master)
+      nodes = master_state.nodes.values()
+      for node in nodes:
+        param_server_multi.lookupNode(self.ros_node_name, node.name)
+      for (code, msg, uri), node in zip(param_server_multi(), nodes):
+        if (uri if code == 1 else None) != node.uri:
+          return False
+      return True
+    except Exception:
+      return False
+
   def updateSyncInfo(self):
     '''
     This method can be called to update the origin ROS master URI of the nodes
@@ -450,39 +1332,118 @@ class MasterMonitor(object):
     running. The synchronization service will be detect automatically by searching
     for the service ending with C{get_sync_info}. The method will be called by 
     C{checkState()}.
+    The client of the service is kept open and created again only, if the URI 
+    of the service is changed. The origin ROS master URIs are cached and 
+    updated only for the changed hosts, see L{_updateSyncOrigins()}.
     '''
     with self._create_access_lock:
       master_state = self.__new_master_state
       sync_info = None
       # get synchronization info, if sync node is running
       # to determine the origin ROS MASTER URI of the nodes
-      for name, service in master_state.services.items():
-        if service.name.endswith('get_sync_info'):
-          if interface_finder.hostFromUri(self.getMasteruri()) == interface_finder.hostFromUri(service.uri):
-            socket.setdefaulttimeout(2)
-            get_sync_info = rospy.ServiceProxy(service.name, GetSyncInfo)
-            try:
-              sync_info = get_sync_info()
-            except rospy.ServiceException, e:
-              rospy.logwarn("ERROR Service call 'get_sync_info' failed: %s", str(e))
-            finally:
-              socket.setdefaulttimeout(None)
+      service = self._findSyncService(master_state)
+      if service is None:
+        self._closeSyncProxy()
+        self.__sync_hosts = dict()
+        self.__sync_node_origins = dict()
+        self.__sync_service_origins = dict()
+        return
+      if self.__sync_proxy is None or self.__sync_service != (service.name, service.uri):
+        self._closeSyncProxy()
+        self.__sync_service = (service.name, service.uri)
+        if self._own_master:
+          self.__sync_proxy = rospy.ServiceProxy(service.name, GetSyncInfo, persistent=True)
+        else:
+          # the service is not known by the ROS master of this node
+          self.__sync_proxy = ServiceProxyByURI(service.name, GetSyncInfo, service.uri, persistent=True)
+        # the timeout is kept by the socket of the persistent connection
+        socket.setdefaulttimeout(2)
+      try:
+        sync_info = self.__sync_proxy()
+      except (rospy.ServiceException, socket.error), e:
+        rospy.logwarn("ERROR Service call 'get_sync_info' failed: %s", str(e))
+        self._closeSyncProxy()
+      finally:
+        socket.setdefaulttimeout(None)
 
       #update the origin ROS MASTER URI of the nodes, if sync node is running
       if sync_info:
-        for m in sync_info.hosts:
-          for n in m.nodes:
-            try:
-              master_state.getNode(n).masteruri = m.masteruri
-            except:
-              pass
-          for s in m.services:
-            try:
-              master_state.getService(s).masteruri = m.masteruri
-            except:
-              pass
+        self._updateSyncOrigins(sync_info)
+        nodes = master_state.nodes
+        for name, masteruri in self.__sync_node_origins.iteritems():
+          node = nodes.get(name)
+          if not node is None:
+            node.masteruri = masteruri
+        services = master_state.services
+        for name, masteruri in self.__sync_service_origins.iteritems():
+          service = services.get(name)
+          if not service is None:
+            service.masteruri = masteruri
+
+  def _findSyncService(self, master_state):
+    '''
+    Returns the local service ending with C{get_sync_info}. The previously used 
+    service is tested first. The services are searched only, if they are 
+    changed since the last search without result.
+    @type master_state: L{MasterInfo}
+    @rtype: L{ServiceInfo} or C{None}
+    '''
+    services = master_state.services
+    if not self.__sync_service is None:
+      service = services.get(self.__sync_service[0])
+      if not service is None and not service.uri is None:
+        return service
+    digest = master_state.digests['services']
+    if digest == self.__sync_lookup_digest:
+      return None
+    masterhost = interface_finder.hostFromUri(self.getMasteruri())
+    for name, service in services.iteritems():
+      if name.endswith('get_sync_info') and masterhost == interface_finder.hostFromUri(service.uri):
+        self.__sync_lookup_digest = None
+        return service
+    self.__sync_lookup_digest = digest
+    return None
+
+  def _closeSyncProxy(self):
+    '''
+    Closes the persistent connection to the C{get_sync_info} service.
+    '''
+    if not self.__sync_proxy is None:
+      try:
+        self.__sync_proxy.close()
+      except:
+        pass
+    self.__sync_proxy = None
+    self.__sync_service = None
+
+  def _updateSyncOrigins(self, sync_info):
+    '''
+    Updates the cached origin ROS master URIs of the nodes and services by the 
+    given response of the C{get_sync_info} service. Only the entries of the 
+    hosts with changed nodes or services are updated.
+    @type sync_info: L{master_discovery_fkie.srv.GetSyncInfoResponse}
+    '''
+    hosts = dict()
+    for m in sync_info.hosts:
+      hosts[m.masteruri] = (tuple(m.nodes), tuple(m.services))
+    # remove the entries of changed or removed hosts
+    for masteruri, (nodes, services) in self.__sync_hosts.iteritems():
+      if hosts.get(masteruri) != (nodes, services):
+        for n in nodes:
+          if self.__sync_node_origins.get(n) == masteruri:
+            del self.__sync_node_origins[n]
+        for s in services:
+          if self.__sync_service_origins.get(s) == masteruri:
+            del self.__sync_service_origins[s]
+    # add the entries of changed or new hosts
+    for masteruri, (nodes, services) in hosts.iteritems():
+      if self.__sync_hosts.get(masteruri) != (nodes, services):
+        for n in nodes:
+          self.__sync_node_origins[n] = masteruri
+        for s in services:
+          self.__sync_service_origins[s] = masteruri
+    self.__sync_hosts = hosts
 
-    
   def getMasteruri(self):
     '''
     Requests the ROS master URI from the ROS master through the RPC interface and 
@@ -517,18 +1478,71 @@ class MasterMonitor(object):
         pass
     return self.__mastername
   
-  def getMasterContacts(self):
+  def setContactsResolver(self, resolver):
+    '''
+    Sets the method to answer the C{masterContacts()} requests for other ROS 
+    masters, e.g. by a discovery relay from its cache.
+    @param resolver: the method returning the contact information for the given 
+    URI of the remote RPC server or C{None}, if the master is not known.
+    @type resolver: C{<method>(str)}
+    '''
+    self._contacts_resolver = resolver
+
+  def getMasterContacts(self, monitoruri=None):
     '''
     The RPC method called by XML-RPC server to request the master contact information.
-    @return: (timestamp of the ROS master state, ROS master URI, master name, name of this service, URI of this RPC server)
+    @param monitoruri: the URI of the RPC server of another ROS master, which 
+    contacts are requested. Answered only, if a resolver is set by 
+    L{setContactsResolver()}, otherwise the own contacts are returned.
+    @type monitoruri: C{str} (Default: C{None})
+    @return: (timestamp of the ROS master state, ROS master URI, master name, 
+    name of this service, URI of this RPC server). The timestamp is C{0}, if the 
+    requested master is not known.
     @rtype: C{(str, str, str, str, str)}
     '''
+    if monitoruri and not self._contacts_resolver is None:
+      result = self._contacts_resolver(monitoruri)
+      if result is None:
+        return ('0', '', '', '', monitoruri)
+      return result
     with self._state_access_lock:
       t = 0
       if not self.__master_state is None:
         t = self.__master_state.timestamp
-      return (str(t), str(self.getMasteruri()), str(self.getMastername()), self.ros_node_name, roslib.network.create_local_xmlrpc_uri(self.rpcport))
+      return (repr(t), str(self.getMasteruri()), str(self.getMastername()), self.ros_node_name, roslib.network.create_local_xmlrpc_uri(self.rpcport))
   
+  def addStatsSource(self, name, func):
+    '''
+    Adds the counters of another component to the result of the RPC 
+    C{monitorStats()}, e.g. of the pool retrieving the discovered masters.
+    @param name: the key of the counters in the result
+    @type name: C{str}
+    @param func: the method returning the current counters
+    @type func: C{<method>()} returning C{dict(str: int)}
+    '''
+    self._stats_sources.append((name, func))
+
+  def getMonitorStats(self):
+    '''
+    The RPC method called by XML-RPC server to request the times of the update 
+    phases, see L{PhaseTimer.stats()}, and the counters of the RPC server and 
+    the added sources, see L{addStatsSource()}. Available if L{DIAGNOSTICS} is 
+    enabled.
+    @return: C{{'phases': {phase: times}, 'buckets': histogram bounds, 
+    'rpc': counters, ...}}
+    @rtype: C{dict}
+    '''
+    result = {'phases': dict(self.phase_timer.stats()),
+              'buckets': list(PhaseTimer.BUCKETS),
+              'rpc': self.rpcServer.metrics()}
+    for name, func in self._stats_sources:
+      try:
+        result[name] = func()
+      except:
+        import traceback
+        rospy.logwarn("Error while get stats of %s: %s", name, traceback.format_exc().splitlines()[-1])
+    return result
+
   def checkState(self):
     '''
     Gets the state from the ROS master and compares it to the stored state. 
@@ -539,13 +1553,33 @@ class MasterMonitor(object):
     s = self.updateState()
     with self._create_access_lock:
       with self._state_access_lock:
-        if s != self.__master_state:
+        if not s is self.__master_state and s != self.__master_state:
+          phase_start = self.phase_timer.start()
           self.updateSyncInfo()
+          self.phase_timer.lap('sync_info', phase_start)
           self.__master_state = self.__new_master_state
+          self._updateChangelog()
           result = True
-        self.__master_state.check_ts = self.__new_master_state.timestamp
+        self.__master_state.check_ts = self.__new_master_state.check_ts
         return result
 
+  def _updateChangelog(self):
+    '''
+    Stores the differences between the last and the current master state to 
+    answer the C{masterInfoSince()} requests. 
+    '''
+    with self._state_access_lock:
+      listed_state = self.__master_state.listedState()
+      if not self.__listed_state is None:
+        updated, removed = MasterInfo.listed_delta(self.__listed_state, listed_state)
+        self.__changelog.append((self.__listed_state[0], listed_state[0], updated, removed))
+        while len(self.__changelog) > self.MAX_CHANGELOG:
+          del self.__changelog[0]
+      self.__listed_state = listed_state
+      self.__marshaled = dict()
+      # answer the waiting requests
+      self._waiters_event.set()
+
   def reset(self):
     '''
     Sets the master state to None. 
@@ -554,3 +1588,9 @@ class MasterMonitor(object):
       if not self.__master_state is None:
         del self.__master_state
       self.__master_state = None
+      self.__listed_state = None
+      self.__changelog = []
+      self.__marshaled = dict()
+      self.__raw_state = None
+      self.__pid_cache = dict()
+      self.__service_type_cache = dict()
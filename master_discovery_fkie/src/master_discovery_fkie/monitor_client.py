@@ -0,0 +1,212 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2012, Fraunhofer FKIE/US, Alexander Tiderko
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Fraunhofer nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import httplib
+import socket
+import urlparse
+import xmlrpclib
+
+import roslib; roslib.load_manifest('master_discovery_fkie')
+import rospy
+
+from master_info import MasterInfo
+import state_codec
+
+
+class TimeoutTransport(xmlrpclib.Transport):
+  '''
+  A XML-RPC transport with a timeout for each request. The HTTP/1.1 connection
+  will be reused for next requests to the same host, if the server keeps it open.
+  '''
+  def __init__(self, timeout):
+    xmlrpclib.Transport.__init__(self)
+    self.timeout = timeout
+
+  def make_connection(self, host):
+    conn = xmlrpclib.Transport.make_connection(self, host)
+    conn.timeout = self.timeout
+    if not conn.sock is None:
+      conn.sock.settimeout(self.timeout)
+    return conn
+
+
+class MonitorClient(object):
+  '''
+  The MonitorClient retrieves the state of a remote ROS master from the RPC 
+  server of the remote master_discovery node. After the first complete state
+  only the changes are requested using the C{masterInfoSince()} method. If the 
+  remote node does not support this method, the complete state will be always 
+  requested. The complete state is retrieved as compressed binary data (see 
+  L{state_codec}), if the remote node supports it, otherwise by 
+  C{masterInfo()}. The connections are kept open and reused for the next 
+  requests, if the remote node supports it.
+  Not thread safe! Only L{waitForChange()} can be called by another thread.
+  '''
+
+  BINARY_TIMEOUT = 30.
+  ''' @ivar: the timeout in seconds for the request of the binary state (Default: 30 sec.)'''
+  WAIT_TIMEOUT_MARGIN = 10.
+  ''' @ivar: the time in seconds added to the timeout of C{waitForChange()} for the connection (Default: 10 sec.)'''
+
+  def __init__(self, monitoruri, binary=True):
+    '''
+    @param monitoruri: the URI of the RPC server of the remote discovery node
+    @type monitoruri: C{str}
+    @param binary: try to retrieve the complete state as binary data
+    @type binary: C{bool} (Default: C{True})
+    '''
+    self.monitoruri = monitoruri
+    self.__listed_state = None
+    self.__delta_supported = True
+    self.__binary_supported = binary
+    self.__wait_supported = True
+    self.__monitor = xmlrpclib.ServerProxy(monitoruri)
+    self.__wait_transport = TimeoutTransport(self.WAIT_TIMEOUT_MARGIN)
+    self.__wait_monitor = xmlrpclib.ServerProxy(monitoruri, transport=self.__wait_transport)
+    self.__binary_conn = None
+
+  def masterInfo(self):
+    '''
+    Retrieves the current state of the remote ROS master.
+    @return: the complete state of the ROS master in the same form as 
+    returned by L{MasterInfo.listedState()}
+    @rtype: C{tuple}
+    @raise Exception: on connection errors
+    '''
+    remote_monitor = self.__monitor
+    try:
+      if not self.__listed_state is None and self.__delta_supported:
+        try:
+          kind, data = remote_monitor.masterInfoSince(self.__listed_state[0])
+        except xmlrpclib.Fault, e:
+          rospy.logdebug("%s does not support masterInfoSince(): %s", self.monitoruri, e.faultString)
+          self.__delta_supported = False
+        else:
+          if kind == 'delta':
+            self.__listed_state = MasterInfo.apply_listed_delta(self.__listed_state, data)
+          else:
+            self.__listed_state = data
+          return self.__listed_state
+      if self.__binary_supported:
+        listed_state = self._binaryMasterInfo()
+        if not listed_state is None:
+          self.__listed_state = listed_state
+          return self.__listed_state
+      self.__listed_state = remote_monitor.masterInfo()
+      return self.__listed_state
+    except:
+      self.reset()
+      raise
+
+  def waitForChange(self, timestamp, timeout):
+    '''
+    Waits by the C{waitForChange()} method of the remote node (long polling), 
+    until the state of the remote ROS master differs from the state with given 
+    timestamp, but at most the given timeout. The stored state is not changed.
+    @param timestamp: the timestamp of the known state, as in the first field 
+    of the state returned by L{masterInfo()}
+    @type timestamp: C{str}
+    @param timeout: the maximal time to wait in seconds
+    @type timeout: C{float}
+    @return: the timestamp of the current state or C{None}, if the remote node 
+    does not support the long polling
+    @rtype: C{str} or C{None}
+    @raise Exception: on connection errors
+    '''
+    if not self.__wait_supported:
+      return None
+    self.__wait_transport.timeout = timeout + self.WAIT_TIMEOUT_MARGIN
+    try:
+      kind, data = self.__wait_monitor.waitForChange(timestamp, timeout)
+    except xmlrpclib.Fault, e:
+      rospy.logdebug("%s does not support waitForChange(): %s", self.monitoruri, e.faultString)
+      self.__wait_supported = False
+      return None
+    return data[0]
+
+  def _binaryMasterInfo(self):
+    '''
+    Retrieves the binary state of the remote ROS master. If the remote node 
+    does not support it, the binary transport will be disabled.
+    @return: the decoded state or C{None}, if the binary transport is not 
+    supported
+    @rtype: C{tuple} or C{None}
+    @raise Exception: on connection errors or invalid data
+    '''
+    try:
+      response, data = self._binaryRequest()
+      if response.status == 200:
+        return state_codec.decode_listed_state(data)
+      if response.status in (httplib.NOT_FOUND, httplib.NOT_IMPLEMENTED):
+        # older versions or disabled binary transport
+        rospy.logdebug("%s does not support the binary state, use XML-RPC", self.monitoruri)
+        self.__binary_supported = False
+        return None
+      raise Exception("%s: binary state request failed with status %d %s" % (self.monitoruri, response.status, response.reason))
+    except:
+      self._closeBinaryConnection()
+      raise
+
+  def _binaryRequest(self):
+    '''
+    Sends the GET request of the binary state on the kept connection. If the 
+    remote node has closed the kept connection meanwhile, the request is 
+    repeated once on a new connection.
+    @return: the response and the read data
+    @rtype: C{(httplib.HTTPResponse, str)}
+    '''
+    for retry in (False, True):
+      if self.__binary_conn is None:
+        o = urlparse.urlparse(self.monitoruri)
+        self.__binary_conn = httplib.HTTPConnection(o.hostname, o.port, timeout=self.BINARY_TIMEOUT)
+      reused = not self.__binary_conn.sock is None
+      try:
+        self.__binary_conn.request('GET', state_codec.BINARY_PATH)
+        response = self.__binary_conn.getresponse()
+        data = response.read()
+      except (socket.error, httplib.BadStatusLine):
+        self._closeBinaryConnection()
+        if retry or not reused:
+          raise
+      else:
+        return response, data
+
+  def _closeBinaryConnection(self):
+    if not self.__binary_conn is None:
+      self.__binary_conn.close()
+      self.__binary_conn = None
+
+  def reset(self):
+    '''
+    Removes the stored state, so the next request retrieves the complete state.
+    '''
+    self.__listed_state = None
@@ -0,0 +1,208 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2012, Fraunhofer FKIE/US, Alexander Tiderko
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Fraunhofer nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import bisect
+import os
+import threading
+import time
+
+
+class PhaseTimer(object):
+  '''
+  Collects the wall and CPU time of named processing phases, e.g. the steps of
+  L{MasterMonitor.updateState()}. Each phase keeps only counters and 
+  histograms of the wall and the CPU times with fixed buckets, so a 
+  measurement costs two calls of C{time.time()} and C{os.times()}. A disabled 
+  timer measures nothing.
+  
+  The CPU time is taken from C{os.times()} and includes all threads of the 
+  process, it is only meaningful for the phases with a significant part of 
+  the overall CPU usage. Its resolution is the clock tick of the system, 
+  usually 10 ms, so the CPU percentiles of short phases are coarse.
+
+  Usage::
+
+    t = timer.start()
+    ...
+    t = timer.lap('first_phase', t)
+    ...
+    timer.lap('second_phase', t)
+  '''
+
+  BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5.)
+  ''' @ivar: the upper bounds in [sec] of the histogram buckets. The last bucket 
+  counts all longer times.'''
+
+  def __init__(self, enabled=True):
+    '''
+    @param enabled: C{False} creates a timer without measurement
+    @type enabled: C{bool} (Default: C{True})
+    '''
+    self.enabled = enabled
+    self._lock = threading.Lock()
+    self._phases = dict()
+    '''@ivar: the collected times C{{phase: [count, wall sum, wall max, wall histogram, cpu sum, cpu max, cpu histogram]}}'''
+    self._order = []
+    '''@ivar: the phases in the order of their first measurement'''
+
+  def start(self):
+    '''
+    Starts a measurement.
+    @return: the start times to pass to L{lap()} or C{None}, if disabled
+    @rtype: C{(float, float)}
+    '''
+    if not self.enabled:
+      return None
+    cputimes = os.times()
+    return (time.time(), cputimes[0] + cputimes[1])
+
+  def lap(self, phase, start):
+    '''
+    Adds the time since C{start} to the given phase and starts the measurement
+    of the next phase.
+    @param phase: the name of the phase
+    @type phase: C{str}
+    @param start: the value returned by L{start()} or L{lap()}
+    @return: the start times of the next phase or C{None}, if disabled
+    @rtype: C{(float, float)}
+    '''
+    if start is None:
+      return None
+    now = self.start()
+    self.add(phase, now[0] - start[0], now[1] - start[1])
+    return now
+
+  def add(self, phase, wall, cpu=0.):
+    '''
+    Adds a measured time to the given phase.
+    @param phase: the name of the phase
+    @type phase: C{str}
+    @param wall: the wall time in [sec]
+    @type wall: C{float}
+    @param cpu: the CPU time in [sec]
+    @type cpu: C{float}
+    '''
+    with self._lock:
+      try:
+        entry = self._phases[phase]
+      except KeyError:
+        entry = self._phases[phase] = [0, 0., 0., [0] * (len(self.BUCKETS) + 1), 0., 0., [0] * (len(self.BUCKETS) + 1)]
+        self._order.append(phase)
+      entry[0] += 1
+      entry[1] += wall
+      if wall > entry[2]:
+        entry[2] = wall
+      entry[3][bisect.bisect_left(self.BUCKETS, wall)] += 1
+      entry[4] += cpu
+      if cpu > entry[5]:
+        entry[5] = cpu
+      entry[6][bisect.bisect_left(self.BUCKETS, cpu)] += 1
+
+  def reset(self):
+    '''
+    Removes all collected times.
+    '''
+    with self._lock:
+      self._phases = dict()
+      self._order = []
+
+  def stats(self):
+    '''
+    Returns the collected times of all phases.
+    @return: the phases with C{count}, C{wall_sum}, C{wall_max}, the estimated 
+    percentiles C{wall_p50} and C{wall_p95}, the C{histogram} of the wall times
+    and the same values of the CPU times: C{cpu_sum}, C{cpu_max}, C{cpu_p50}, 
+    C{cpu_p95} and C{cpu_histogram}, see L{BUCKETS}. All times in [sec].
+    @rtype: C{[(str, dict)]}
+    '''
+    result = []
+    with self._lock:
+      for phase in self._order:
+        (count, wall_sum, wall_max, wall_histogram, cpu_sum, cpu_max, cpu_histogram) = self._phases[phase]
+        result.append((phase, {'count': count,
+                               'wall_sum': wall_sum,
+                               'wall_max': wall_max,
+                               'wall_p50': self._percentile(wall_histogram, count, wall_max, 0.5),
+                               'wall_p95': self._percentile(wall_histogram, count, wall_max, 0.95),
+                               'histogram': list(wall_histogram),
+                               'cpu_sum': cpu_sum,
+                               'cpu_max': cpu_max,
+                               'cpu_p50': self._percentile(cpu_histogram, count, cpu_max, 0.5),
+                               'cpu_p95': self._percentile(cpu_histogram, count, cpu_max, 0.95),
+                               'cpu_histogram': list(cpu_histogram)}))
+    return result
+
+  @classmethod
+  def _percentile(cls, histogram, count, max_time, q):
+    '''
+    Returns the upper bound of the bucket containing the given percentile, 
+    limited by the maximal measured time.
+    '''
+    limit = q * count
+    current = 0
+    for idx, value in enumerate(histogram):
+      current += value
+      if current >= limit and current > 0:
+        if idx < len(cls.BUCKETS):
+          return min(cls.BUCKETS[idx], max_time)
+        break
+    return max_time
+
+  def diagnostics(self, name, hardware_id=''):
+    '''
+    Creates a diagnostic status for each phase, which can be published as 
+    C{diagnostic_msgs/DiagnosticArray}. The times are given in [ms].
+    @param name: the prefix of the status names
+    @type name: C{str}
+    @param hardware_id: the hardware id of the status, e.g. the name of the host
+    @type hardware_id: C{str}
+    @rtype: C{[diagnostic_msgs.msg.DiagnosticStatus]}
+    '''
+    from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
+    result = []
+    for phase, values in self.stats():
+      status = DiagnosticStatus()
+      status.level = DiagnosticStatus.OK
+      status.name = ''.join([name, ': ', phase])
+      status.hardware_id = hardware_id
+      status.message = '%d calls, mean %.1f ms' % (values['count'], values['wall_sum'] * 1000. / values['count'])
+      status.values = [KeyValue('count', str(values['count'])),
+                       KeyValue('wall_mean_ms', '%.3f' % (values['wall_sum'] * 1000. / values['count'])),
+                       KeyValue('wall_p50_ms', '%.3f' % (values['wall_p50'] * 1000.)),
+                       KeyValue('wall_p95_ms', '%.3f' % (values['wall_p95'] * 1000.)),
+                       KeyValue('wall_max_ms', '%.3f' % (values['wall_max'] * 1000.)),
+                       KeyValue('cpu_mean_ms', '%.3f' % (values['cpu_sum'] * 1000. / values['count'])),
+                       KeyValue('cpu_p95_ms', '%.3f' % (values['cpu_p95'] * 1000.)),
+                       KeyValue('cpu_max_ms', '%.3f' % (values['cpu_max'] * 1000.))]
+      result.append(status)
+    return result
@@ -0,0 +1,186 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2012, Fraunhofer FKIE/US, Alexander Tiderko
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Fraunhofer nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import heapq
+import random
+import threading
+import time
+
+import roslib; roslib.load_manifest('master_discovery_fkie')
+import rospy
+
+
+class RetrievalPool(object):
+  '''
+  Retrieves the information about the discovered ROS masters by a fixed count
+  of worker threads, see L{DiscoveredMaster.requestMasterinfo()}. Failed 
+  requests are repeated with an exponential backoff and jitter per master, so
+  many masters appearing at once do not flood the network.
+  '''
+
+  def __init__(self, workers=4, backoff_min=1., backoff_max=60.):
+    '''
+    @param workers: the count of worker threads
+    @type workers: C{int} (Default: C{4})
+    @param backoff_min: the delay in seconds after the first failed request
+    @type backoff_min: C{float} (Default: C{1.})
+    @param backoff_max: the maximal delay in seconds between two requests
+    @type backoff_max: C{float} (Default: C{60.})
+    '''
+    self.backoff_min = backoff_min
+    self.backoff_max = backoff_max
+    self._cv = threading.Condition()
+    self._queue = []
+    '''@ivar: the heap with C{(due time, sequence number, master)}'''
+    self._seq = 0
+    self._scheduled = dict()
+    '''@ivar: the masters to retrieve with the count of failed requests C{{id(master): count}}'''
+    self._in_progress = 0
+    self._retries = 0
+    self._failures = 0
+    self._successes = 0
+    self._do_finish = False
+    self._threads = []
+    for i in range(max(1, workers)):
+      thread = threading.Thread(target=self._run, name='retrieval_%d' % i)
+      thread.setDaemon(True)
+      thread.start()
+      self._threads.append(thread)
+
+  @classmethod
+  def backoff(cls, failures, backoff_min=1., backoff_max=60.):
+    '''
+    Returns the delay before the next request after the given count of failed 
+    requests: exponential growing, limited by C{backoff_max} and randomized 
+    between the half and the full value.
+    @rtype: C{float}
+    '''
+    delay = min(backoff_max, backoff_min * (2 ** min(max(failures, 1) - 1, 30)))
+    return random.uniform(delay / 2., delay)
+
+  def add(self, master):
+    '''
+    Adds the master to the pool. The request will be executed as soon as a 
+    worker is free.
+    @type master: L{DiscoveredMaster}
+    '''
+    with self._cv:
+      self._scheduled[id(master)] = 0
+      self._push(time.time(), master)
+
+  def discard(self, master):
+    '''
+    Removes the master from the pool, a pending request will be skipped.
+    @type master: L{DiscoveredMaster}
+    '''
+    with self._cv:
+      self._scheduled.pop(id(master), None)
+
+  def metrics(self):
+    '''
+    Returns the counters of the pool.
+    @return: C{queue_depth}: the count of masters waiting for a request, 
+    C{in_progress}: the count of running requests, C{retries}: the count of 
+    repeated requests, C{failures}: the count of failed requests, 
+    C{successes}: the count of successful requests
+    @rtype: C{dict(str: int)}
+    '''
+    with self._cv:
+      return {'queue_depth': len(self._scheduled) - self._in_progress,
+              'in_progress': self._in_progress,
+              'retries': self._retries,
+              'failures': self._failures,
+              'successes': self._successes}
+
+  def shutdown(self):
+    '''
+    Stops the worker threads after the running requests.
+    '''
+    with self._cv:
+      self._do_finish = True
+      self._cv.notifyAll()
+
+  def _push(self, due, master):
+    heapq.heappush(self._queue, (due, self._seq, master))
+    self._seq += 1
+    self._cv.notify()
+
+  def _next(self):
+    '''
+    Waits for the next due master.
+    @return: the master or C{None} on shutdown
+    '''
+    with self._cv:
+      while not self._do_finish and not rospy.is_shutdown():
+        if self._queue:
+          due, _, master = self._queue[0]
+          if not id(master) in self._scheduled:
+            heapq.heappop(self._queue)
+            continue
+          now = time.time()
+          if due <= now:
+            heapq.heappop(self._queue)
+            self._in_progress += 1
+            return master
+          self._cv.wait(due - now)
+        else:
+          # wait with timeout to recognize the shutdown of ROS
+          self._cv.wait(1.)
+      return None
+
+  def _run(self):
+    while True:
+      master = self._next()
+      if master is None:
+        return
+      try:
+        success = master.requestMasterinfo()
+      except:
+        import traceback
+        rospy.logwarn("retrieve master info from %s failed: %s", master.monitoruri, traceback.format_exc())
+        success = False
+      with self._cv:
+        self._in_progress -= 1
+        if success:
+          self._successes += 1
+        else:
+          self._failures += 1
+        if not id(master) in self._scheduled:
+          continue
+        if success:
+          del self._scheduled[id(master)]
+        else:
+          self._retries += 1
+          failures = self._scheduled[id(master)] + 1
+          self._scheduled[id(master)] = failures
+          self._push(time.time() + self.backoff(failures, self.backoff_min, self.backoff_max), master)
@@ -0,0 +1,271 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2012, Fraunhofer FKIE/US, Alexander Tiderko
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Fraunhofer nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import errno
+import select
+import socket
+import struct
+import time
+from multiprocessing.pool import ThreadPool
+
+import roslib; roslib.load_manifest('master_discovery_fkie')
+import roslib.network
+import rospy
+
+
+def _isAddress(host):
+  '''
+  Returns C{True}, if the host is given by its IPv4 address and needs no 
+  resolution.
+  '''
+  try:
+    socket.inet_pton(socket.AF_INET, host)
+    return True
+  except (socket.error, TypeError, ValueError):
+    return False
+
+
+class _Probe(object):
+  '''
+  The state of a probe connection to one service.
+  '''
+  def __init__(self, service, host, addr, port, header):
+    self.service = service
+    self.host = host
+    self.addr = addr
+    self.port = port
+    self.sock = None
+    self.outbuf = header
+    self.inbuf = ''
+    self.deadline = 0
+
+  def close(self):
+    if not self.sock is None:
+      try:
+        self.sock.close()
+      except socket.error:
+        pass
+      self.sock = None
+
+
+class ServiceProber(object):
+  '''
+  Requests the types of services by a ROS handshake with C{probe} flag. All 
+  probes are running concurrently in one thread using non blocking sockets, so
+  hanging service provider delay the result only up to given timeout. The 
+  names of the hosts are resolved concurrently by a small thread pool within 
+  the same timeout.
+  '''
+
+  MAX_HEADER_SIZE = 65536
+  ''' @ivar: larger headers are treated as invalid'''
+
+  def __init__(self, callerid, timeout=2.0, probe_timeout=0.5, max_per_host=8, max_concurrent=128, resolve_workers=4):
+    '''
+    @param callerid: the name of the calling node sent in the handshake header
+    @type callerid: C{str}
+    @param timeout: the maximal duration of L{probe()} in [sec]
+    @type timeout: C{float}
+    @param probe_timeout: the timeout for a single service in [sec]
+    @type probe_timeout: C{float}
+    @param max_per_host: the count of concurrent connections to the same host
+    @type max_per_host: C{int}
+    @param max_concurrent: the count of all concurrent connections
+    @type max_concurrent: C{int}
+    @param resolve_workers: the count of threads resolving the host names
+    @type resolve_workers: C{int}
+    '''
+    self.callerid = callerid
+    self.timeout = timeout
+    self.probe_timeout = probe_timeout
+    self.max_per_host = max_per_host
+    self.max_concurrent = max_concurrent
+    self.resolve_workers = resolve_workers
+    self._resolver = None
+
+  def probe(self, services):
+    '''
+    Requests the types of given services.
+    @param services: the dictionary with services C{{name: URI}}
+    @type services: C{dict}
+    @return: the dictionary with the types of the services C{{name: type}}. The
+    services which failed or timed out are not included, also the services on 
+    hosts which names are not resolved in time.
+    @rtype: C{dict}
+    '''
+    result = dict()
+    deadline = time.time() + self.timeout
+    targets = dict() # host: [(service, port)]
+    for (service, uri) in services.items():
+      if uri is None:
+        continue
+      try:
+        dest_addr, dest_port = rospy.parse_rosrpc_uri(uri)
+      except Exception:
+        continue
+      targets.setdefault(dest_addr, []).append((service, dest_port))
+    addresses = self._resolve(targets.keys(), deadline)
+    pending = dict() # host: [_Probe]
+    for (host, addr) in addresses.iteritems():
+      for (service, port) in targets[host]:
+        header = roslib.network.encode_ros_handshake_header({'probe':'1', 'md5sum':'*',
+                                                             'callerid':self.callerid, 'service':service})
+        pending.setdefault(host, []).append(_Probe(service, host, addr, port, header))
+    running = dict() # fileno: _Probe
+    per_host = dict() # host: count of running probes
+    try:
+      while pending or running:
+        now = time.time()
+        if now >= deadline:
+          break
+        # start new probes within the limits
+        for host in pending.keys():
+          probes = pending[host]
+          while probes and per_host.get(host, 0) < self.max_per_host and len(running) < self.max_concurrent:
+            p = probes.pop()
+            if self._connect(p, now):
+              running[p.sock.fileno()] = p
+              per_host[host] = per_host.get(host, 0) + 1
+          if not probes:
+            del pending[host]
+        if not running:
+          continue
+        rlist = [fd for fd, p in running.iteritems() if not p.outbuf]
+        wlist = [fd for fd, p in running.iteritems() if p.outbuf]
+        wait = min(deadline, min(p.deadline for p in running.itervalues())) - now
+        readable, writable, _ = select.select(rlist, wlist, [], max(wait, 0))
+        finished = []
+        for fd in writable:
+          if not self._write(running[fd]):
+            finished.append(fd)
+        for fd in readable:
+          p = running[fd]
+          (done, service_type) = self._read(p)
+          if done:
+            if not service_type is None:
+              result[p.service] = service_type
+            finished.append(fd)
+        now = time.time()
+        for fd, p in running.iteritems():
+          if now >= p.deadline and not fd in finished:
+            finished.append(fd)
+        for fd in finished:
+          p = running.pop(fd)
+          p.close()
+          per_host[p.host] = per_host[p.host] - 1
+    finally:
+      for p in running.itervalues():
+        p.close()
+    return result
+
+  def _resolve(self, hosts, deadline):
+    '''
+    Resolves the names of given hosts concurrently, but at most until the 
+    deadline. A blocking resolution holds only a thread of the resolver pool.
+    @param hosts: the names or addresses of the hosts
+    @type hosts: C{[str]}
+    @param deadline: the time until the names have to be resolved
+    @type deadline: C{float}
+    @return: the addresses C{{host: address}}, the hosts which failed or timed 
+    out are not included.
+    @rtype: C{dict}
+    '''
+    result = dict()
+    requests = []
+    for host in hosts:
+      if _isAddress(host):
+        result[host] = host
+      else:
+        if self._resolver is None:
+          self._resolver = ThreadPool(max(1, self.resolve_workers))
+        requests.append((host, self._resolver.apply_async(socket.gethostbyname, (host,))))
+    for (host, request) in requests:
+      try:
+        result[host] = request.get(max(deadline - time.time(), 0))
+      except Exception:
+        # failed or timed out
+        pass
+    return result
+
+  def _connect(self, probe, now):
+    try:
+      probe.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      probe.sock.setblocking(0)
+      err = probe.sock.connect_ex((probe.addr, probe.port))
+      if err in [0, errno.EINPROGRESS, errno.EWOULDBLOCK]:
+        probe.deadline = now + self.probe_timeout
+        return True
+    except socket.error:
+      pass
+    probe.close()
+    return False
+
+  def _write(self, probe):
+    '''
+    Sends the handshake header after the connection is established.
+    @return: C{False} on error
+    '''
+    try:
+      err = probe.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+      if err != 0:
+        return False
+      sent = probe.sock.send(probe.outbuf)
+      probe.outbuf = probe.outbuf[sent:]
+      return True
+    except socket.error:
+      return False
+
+  def _read(self, probe):
+    '''
+    Reads the response header.
+    @return: C{(done, type)}, the type is C{None} on errors
+    '''
+    try:
+      data = probe.sock.recv(4096)
+    except socket.error, (errn, msg):
+      if errn in [errno.EAGAIN, errno.EWOULDBLOCK]:
+        return (False, None)
+      return (True, None)
+    if not data:
+      return (True, None)
+    probe.inbuf += data
+    if len(probe.inbuf) >= 4:
+      (size,) = struct.unpack('<I', probe.inbuf[0:4])
+      if size > self.MAX_HEADER_SIZE:
+        return (True, None)
+      if len(probe.inbuf) >= size + 4:
+        try:
+          header = roslib.network.decode_ros_handshake_header(probe.inbuf[:size + 4])
+          return (True, header.get('type', None))
+        except Exception:
+          return (True, None)
+    return (False, None)
@@ -0,0 +1,213 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2012, Fraunhofer FKIE/US, Alexander Tiderko
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of Fraunhofer nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+import array
+import struct
+import sys
+import zlib
+
+BINARY_PATH = '/masterInfo.bin'
+'''@ivar: the HTTP path of the binary state on the RPC server of the L{MasterMonitor}'''
+MAGIC = 'MDSB'
+VERSION = 1
+HEADER_FMT = '!4sBII'
+'''@ivar: the header of the encoded state: magic, version, length of the compressed data and of the uncompressed data'''
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+_BODY_FMT = '!II'
+_BODY_SIZE = struct.calcsize(_BODY_FMT)
+_NO_PID = 0xffffffff
+'''@ivar: the stored pid of the nodes without a valid pid, all integers are stored unsigned'''
+
+
+class CodecError(Exception):
+  '''
+  The exception raised on invalid encoded data.
+  '''
+  pass
+
+
+class _StringTable(object):
+  '''
+  Collects the strings of the state. Each string is stored only once and 
+  referenced by its index, which starts with C{1}. The index C{0} stands for
+  C{None}.
+  '''
+  def __init__(self):
+    self.strings = []
+    self.indexes = dict()
+
+  def index(self, s):
+    if s is None:
+      return 0
+    if isinstance(s, unicode):
+      s = s.encode('utf-8')
+    else:
+      s = str(s)
+    try:
+      return self.indexes[s]
+    except KeyError:
+      self.strings.append(s)
+      result = len(self.strings)
+      self.indexes[s] = result
+      return result
+
+
+def _pid(pid):
+  '''
+  Returns the pid as unsigned integer or L{_NO_PID}, if the pid is not an 
+  integer in the range of the unsigned integers.
+  @rtype: C{int}
+  '''
+  try:
+    pid = int(pid)
+  except (TypeError, ValueError):
+    return _NO_PID
+  return pid if 0 <= pid < _NO_PID else _NO_PID
+
+def encode_listed_state(listed, level=6):
+  '''
+  Encodes the state of the ROS master in a compact binary form. All strings 
+  are stored once in a string table, the structure as a list of unsigned 
+  32 bit integers. A pid, which is not a valid unsigned integer, is stored 
+  as C{None}. The result is compressed by zlib and prefixed by a header 
+  containing the length of the data, see L{HEADER_FMT}.
+  @param listed: the state as returned by L{MasterInfo.listedState()}
+  @type listed: C{tuple}
+  @param level: the zlib compression level
+  @type level: C{int}
+  @return: the encoded state
+  @rtype: C{str}
+  '''
+  stamp, masteruri, name, publishers, subscribers, services, topicTypes, nodes, serviceProvider = listed
+  table = _StringTable()
+  idx = table.index
+  ints = [idx(stamp), idx(masteruri), idx(name)]
+  for entries in (publishers, subscribers, services):
+    ints.append(len(entries))
+    for entry, members in entries:
+      ints.append(idx(entry))
+      ints.append(len(members))
+      ints.extend([idx(m) for m in members])
+  ints.append(len(topicTypes))
+  for topic, ttype in topicTypes:
+    ints.append(idx(topic))
+    ints.append(idx(ttype))
+  ints.append(len(nodes))
+  for nodename, uri, origin, pid, local in nodes:
+    ints.extend((idx(nodename), idx(uri), idx(origin), _pid(pid), idx(local)))
+  ints.append(len(serviceProvider))
+  for service, uri, origin, stype, local in serviceProvider:
+    ints.extend((idx(service), idx(uri), idx(origin), idx(stype), idx(local)))
+  strings = '\0'.join(table.strings)
+  int_array = array.array('I', ints)
+  if sys.byteorder == 'little':
+    int_array.byteswap()
+  body = ''.join((struct.pack(_BODY_FMT, len(strings), len(int_array)), strings, int_array.tostring()))
+  data = zlib.compress(body, level)
+  return ''.join((struct.pack(HEADER_FMT, MAGIC, VERSION, len(data), len(body)), data))
+
+def decode_listed_state(data):
+  '''
+  Decodes the state encoded by L{encode_listed_state()}.
+  @param data: the encoded state
+  @type data: C{str}
+  @return: the state in the form of L{MasterInfo.listedState()}
+  @rtype: C{tuple}
+  @raise CodecError: on invalid data
+  '''
+  if len(data) < HEADER_SIZE:
+    raise CodecError("incomplete header")
+  magic, version, length, raw_length = struct.unpack(HEADER_FMT, data[:HEADER_SIZE])
+  if magic != MAGIC or version != VERSION:
+    raise CodecError("unsupported format %r, version %d" % (magic, version))
+  if len(data) != HEADER_SIZE + length:
+    raise CodecError("wrong data length %d, expected %d" % (len(data) - HEADER_SIZE, length))
+  try:
+    body = zlib.decompress(data[HEADER_SIZE:])
+  except zlib.error, e:
+    raise CodecError("invalid compressed data: %s" % e)
+  if len(body) != raw_length or raw_length < _BODY_SIZE:
+    raise CodecError("wrong uncompressed length %d, expected %d" % (len(body), raw_length))
+  strings_length, ints_count = struct.unpack(_BODY_FMT, body[:_BODY_SIZE])
+  if _BODY_SIZE + strings_length + ints_count * 4 != raw_length:
+    raise CodecError("inconsistent section lengths")
+  strings = [None]
+  if strings_length:
+    strings.extend(body[_BODY_SIZE:_BODY_SIZE + strings_length].split('\0'))
+  max_index = len(strings) - 1
+  def string(i):
+    if i > max_index:
+      raise CodecError("invalid string index %d" % i)
+    return strings[i]
+  int_array = array.array('I')
+  int_array.fromstring(body[_BODY_SIZE + strings_length:])
+  if sys.byteorder == 'little':
+    int_array.byteswap()
+  ints = int_array.tolist()
+  try:
+    pos = 3
+    stamp, masteruri, name = string(ints[0]), string(ints[1]), string(ints[2])
+    lists = []
+    for _ in range(3):
+      entries = []
+      count = ints[pos]
+      pos += 1
+      for _ in xrange(count):
+        members_count = ints[pos + 1]
+        if pos + 2 + members_count > len(ints):
+          raise IndexError()
+        entries.append((string(ints[pos]), [string(i) for i in ints[pos + 2:pos + 2 + members_count]]))
+        pos += 2 + members_count
+      lists.append(entries)
+    publishers, subscribers, services = lists
+    count = ints[pos]
+    pos += 1
+    topicTypes = [(string(ints[i]), string(ints[i + 1])) for i in xrange(pos, pos + 2 * count, 2)]
+    pos += 2 * count
+    count = ints[pos]
+    pos += 1
+    nodes = [(string(ints[i]), string(ints[i + 1]), string(ints[i + 2]),
+              None if ints[i + 3] == _NO_PID else int(ints[i + 3]), string(ints[i + 4]))
+             for i in xrange(pos, pos + 5 * count, 5)]
+    pos += 5 * count
+    count = ints[pos]
+    pos += 1
+    serviceProvider = [(string(ints[i]), string(ints[i + 1]), string(ints[i + 2]),
+                        string(ints[i + 3]), string(ints[i + 4]))
+                       for i in xrange(pos, pos + 5 * count, 5)]
+    pos += 5 * count
+  except IndexError:
+    raise CodecError("truncated structure")
+  if pos != len(ints):
+    raise CodecError("unexpected data after the structure")
+  return (stamp, masteruri, name, publishers, subscribers, services, topicTypes, nodes, serviceProvider)
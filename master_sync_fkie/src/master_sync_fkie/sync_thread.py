@@ -41,6 +41,8 @@ import roslib.message
 import rospy
 import rosgraph.masterapi
 
+from master_discovery_fkie.monitor_client import MonitorClient
+
 
 class MasterInfo(object):
   '''
@@ -71,7 +73,12 @@ class SyncThread(threading.Thread):
   A thread to synchronize the local ROS master with a remote master. While the 
   synchronization only the topic of the remote ROS master will be registered by
   the local ROS master. The remote ROS master will be keep unchanged.
+  The changes of the remote ROS master are additionally watched by long 
+  polling, if the remote discovery node supports it.
   '''
+
+  WAIT_TIMEOUT = 30.
+  ''' @ivar: the timeout in seconds of a long polling request for the changes of the remote ROS master (Default: 30 sec)'''
   
   def __init__(self, name, uri, discoverer_name, monitoruri, timestamp):
     '''
@@ -100,6 +107,12 @@ class SyncThread(threading.Thread):
     self.__subscribers = {}
     # a dictionary with services, the key is a tuple of (service name, service URL, node name, node URL), value is a boolean
     self.__services = {}
+    # the client to request the state of the remote ROS master
+    self.__monitor_client = MonitorClient(monitoruri)
+    # the timestamp of the last synchronized remote state, used by the long polling
+    self.__synced_stamp = None
+    self.__synced_event = threading.Event()
+    self.__immediate = False
     
     #node blacklist:
     self.ignore = ['/rosout', rospy.get_name(), self.masterInfo.discoverer_name, '/default_cfg', '/node_manager', '/zeroconf']
@@ -126,6 +139,9 @@ class SyncThread(threading.Thread):
     rospy.loginfo("sync_topics: " + str(self.sync_topics))
 
     self.start()
+    self.__watchThread = threading.Thread(target = self._watchChanges)
+    self.__watchThread.setDaemon(True)
+    self.__watchThread.start()
 
   @classmethod
   def _masteruri_from_ros(cls):
@@ -194,8 +210,10 @@ class SyncThread(threading.Thread):
     Stops running thread.
     '''
     rospy.logdebug("SyncThread[%s]: stop request", self.masterInfo.name)
+    # set the flag also while a synchronization is running, it is checked after
+    self.__stop = True
+    self.__synced_event.set()
     if self.__cv.acquire(blocking=False):
-      self.__stop = True
       self.__cv.notify()
       self.__cv.release()
     rospy.logdebug("SyncThread[%s]: stop exit", self.masterInfo.name)
@@ -226,10 +244,14 @@ class SyncThread(threading.Thread):
           for key in self.__services.keys():
             self.__services[key] = False
           
-          time.sleep(random.random())
+          # the changes reported by long polling are synchronized immediately
+          if not self.__immediate:
+            time.sleep(random.random())
+          self.__immediate = False
           #coonect to master_monitor rpc-xml server
-          remote_monitor = xmlrpclib.ServerProxy(self.masterInfo.monitoruri)
-          remote_state = remote_monitor.masterInfo()
+          if self.__monitor_client.monitoruri != self.masterInfo.monitoruri:
+            self.__monitor_client = MonitorClient(self.masterInfo.monitoruri)
+          remote_state = self.__monitor_client.masterInfo()
           stamp = float(remote_state[0])
           remote_masteruri = remote_state[1]
           remote_mastername = remote_state[2]
@@ -293,12 +315,15 @@ class SyncThread(threading.Thread):
           self.masterInfo.timestamp = stamp
           self.masterInfo.lastsync = stamp
           self.masterInfo.syncts = stamp
+          self.__synced_stamp = remote_state[0]
           rospy.logdebug("SyncThread[%s]: seteeddd timestamp %s", self.masterInfo.name, str(stamp))
         except:
           self.masterInfo.syncts = 0.0
+          self.__synced_stamp = None
           import traceback
           rospy.logwarn("SyncThread[%s] ERROR: %s", self.masterInfo.name, traceback.format_exc())
           time.sleep(3)
+        self.__synced_event.set()
       self.__cv.release()
 
     #end routine if the master was removed
@@ -309,6 +334,48 @@ class SyncThread(threading.Thread):
     for service, serviceuri, node, uri in self.__services:
       self.__unregisterService(service, serviceuri, node)
 
+  def _watchChanges(self):
+    '''
+    Waits by long polling for the changes of the remote ROS master and requests 
+    the synchronization immediately. Ends, if the remote discovery node does 
+    not support the long polling, the changes are then synchronized on the 
+    updates of the master_discovery node only.
+    '''
+    client = MonitorClient(self.masterInfo.monitoruri)
+    while not self.__stop and not rospy.is_shutdown():
+      with self.__cv:
+        stamp = self.__synced_stamp
+        monitoruri = self.masterInfo.monitoruri
+      if stamp is None:
+        self.__synced_event.wait(1.)
+        self.__synced_event.clear()
+        continue
+      try:
+        if client.monitoruri != monitoruri:
+          client = MonitorClient(monitoruri)
+        current_stamp = client.waitForChange(stamp, self.WAIT_TIMEOUT)
+      except:
+        import traceback
+        rospy.logdebug("SyncThread[%s]: waitForChange failed: %s", self.masterInfo.name, traceback.format_exc())
+        time.sleep(3)
+        continue
+      if current_stamp is None:
+        return
+      if current_stamp != stamp:
+        self.__synced_event.clear()
+        # waits for a running synchronization, so the request is not lost
+        with self.__cv:
+          if self.__stop:
+            return
+          # skip, if the change was already synchronized meanwhile
+          if self.__synced_stamp != stamp:
+            continue
+          self.__immediate = True
+          self.masterInfo.syncts = 0.0
+          self.__cv.notify()
+        # wait for the synchronization to request the next changes since its state
+        self.__synced_event.wait(3.)
+
   def _doIgnore(self, node):
     if len(self.sync_nodes) > 0:
       for n in self.sync_nodes:
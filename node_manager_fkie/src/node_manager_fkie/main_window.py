@@ -61,6 +61,7 @@ import node_manager_fkie as nm
 
 from master_discovery_fkie.msg import *
 from master_discovery_fkie.srv import *
+from master_discovery_fkie.phase_timer import PhaseTimer
 
 
 class MainWindow(QtGui.QMainWindow):
@@ -195,6 +196,13 @@ class MainWindow(QtGui.QMainWindow):
     # since the is_local method is threaded for host names, call it to cache the localhost
     nm.is_local("localhost")
 
+    # measure the processing of the received master info, if enabled by ~diagnostics
+    self._phase_timer = PhaseTimer(rospy.get_param('~diagnostics', False))
+    self._pubdiagnostics = None
+    if self._phase_timer.enabled:
+      from diagnostic_msgs.msg import DiagnosticArray
+      self._pubdiagnostics = rospy.Publisher("~diagnostics", DiagnosticArray)
+
     # timer to update the showed update time of the ros state 
     self.master_timecheck_timer = QtCore.QTimer()
     self.master_timecheck_timer.timeout.connect(self.on_master_timecheck)
@@ -435,7 +443,7 @@ class MainWindow(QtGui.QMainWindow):
         master = self.getMaster(m.uri)
         master.master_state = m
         self.master_model.updateMaster(m)
-        self._update_handler.requestMasterInfo(m.uri, m.monitoruri)
+        self._update_handler.requestMasterInfo(m.uri, m.monitoruri, delayed_exec=1.)
 
   def on_master_state_changed(self, msg):
     '''
@@ -459,7 +467,7 @@ class MainWindow(QtGui.QMainWindow):
       self.getMaster(msg.master.uri).master_state = msg.master
       self.master_model.updateMaster(msg.master)
       self.ui.masterListView.doItemsLayout()
-      self._update_handler.requestMasterInfo(msg.master.uri, msg.master.monitoruri)
+      self._update_handler.requestMasterInfo(msg.master.uri, msg.master.monitoruri, delayed_exec=1.)
     if msg.state == master_discovery_fkie.msg.MasterState.STATE_REMOVED:
       nm.nameres().removeMasterEntry(msg.master.uri)
 #      nm.nameres().remove(msg.master.name, masteruri=msg.master.uri, host=nm.nameres().getHostname(msg.master.uri))
@@ -476,19 +484,15 @@ class MainWindow(QtGui.QMainWindow):
     @type minfo: L{master_discovery_fkie.MasterInfo}
     '''
     rospy.loginfo("MASTERINFO from %s (%s) received", minfo.mastername, minfo.masteruri)
-#    cputimes_m = os.times()
-#    cputime_init_m = cputimes_m[0] + cputimes_m[1]
+    start_all = self._phase_timer.start()
     if self.masters.has_key(minfo.masteruri):
       for uri, master in self.masters.items():
         try:
           # check for running discovery service
           new_info = master.master_info is None or master.master_info.timestamp < minfo.timestamp
-#          cputimes = os.times()
-#          cputime_init = cputimes[0] + cputimes[1]
+          phase_start = self._phase_timer.start()
           master.master_info = minfo
-#          cputimes = os.times()
-#          cputime = cputimes[0] + cputimes[1] - cputime_init
-#          print master.master_state.name, cputime
+          phase_start = self._phase_timer.lap('set_master_info', phase_start)
           if not master.master_info is None:
             if nm.is_local(nm.nameres().getHostname(master.master_info.masteruri)) or self.restricted_to_one_master:
               self._local_tries = 0
@@ -506,15 +510,14 @@ class MainWindow(QtGui.QMainWindow):
               self.master_model.setChecked(master.master_state.name, not minfo.getNodeEndsWith('master_sync') is None)
           self.capabilitiesTable.updateState(minfo.masteruri, minfo)
           self.updateDuplicateNodes()
+          self._phase_timer.lap('update_views', phase_start)
         except Exception, e:
           rospy.logwarn("Error while process received master info from %s: %s", minfo.masteruri, str(e))
       # update the buttons, whether master is synchronized or not
       if not self.currentMaster is None and not self.currentMaster.master_info is None and not self.restricted_to_one_master:
         self.ui.syncButton.setEnabled(True)
         self.ui.syncButton.setChecked(not self.currentMaster.master_info.getNodeEndsWith('master_sync') is None)
-#    cputimes_m = os.times()
-#    cputime_m = cputimes_m[0] + cputimes_m[1] - cputime_init_m
-#    print "ALL:", cputime_m
+    self._phase_timer.lap('master_info_retrieved', start_all)
 
   def on_master_info_error(self, masteruri, error):
     if nm.is_local(nm.nameres().getHostname(masteruri)):
@@ -633,7 +636,25 @@ class MainWindow(QtGui.QMainWindow):
         if not master is None and not master.master_state is None:
           self._update_handler.requestMasterInfo(master.master_state.uri, master.master_state.monitoruri)
         self._refresh_time = time.time()
+    self.publishDiagnostics()
 
+  def publishDiagnostics(self):
+    '''
+    Publishes the processing times of the received master info on 
+    C{~diagnostics}, if enabled by the parameter C{~diagnostics}.
+    @see: L{master_discovery_fkie.phase_timer.PhaseTimer}
+    '''
+    if self._pubdiagnostics is None:
+      return
+    try:
+      from diagnostic_msgs.msg import DiagnosticArray
+      msg = DiagnosticArray()
+      msg.header.stamp = rospy.Time.now()
+      msg.status = self._phase_timer.diagnostics('node_manager', rospy.get_name())
+      self._pubdiagnostics.publish(msg)
+    except:
+      import traceback
+      rospy.logwarn("Error while publish diagnostics: %s", traceback.format_exc().splitlines()[-1])
 
   def showMasterName(self, name, timestamp, online=True):
     '''
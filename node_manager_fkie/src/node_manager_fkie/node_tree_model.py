@@ -780,13 +780,13 @@ class NodeItem(QtGui.QStandardItem):
     run_changed = False
     if self._node_info.publishedTopics != node_info.publishedTopics:
       abbos_changed = True
-      self._node_info._publishedTopics = list(node_info.publishedTopics)
+      self._node_info.publishedTopics = list(node_info.publishedTopics)
     if self._node_info.subscribedTopics != node_info.subscribedTopics:
       abbos_changed = True
-      self._node_info._subscribedTopics = list(node_info.subscribedTopics)
+      self._node_info.subscribedTopics = list(node_info.subscribedTopics)
     if self._node_info.services != node_info.services:
       abbos_changed = True
-      self._node_info._services = list(node_info.services)
+      self._node_info.services = list(node_info.services)
     if self._node_info.pid != node_info.pid:
       self._node_info.pid = node_info.pid
       run_changed = True
@@ -34,6 +34,7 @@ import threading
 from PySide import QtCore
 
 from master_discovery_fkie.master_info import MasterInfo
+from master_discovery_fkie.monitor_client import MonitorClient
 from update_thread import UpdateThread
 
 class UpdateHandler(QtCore.QObject):
@@ -57,9 +58,10 @@ class UpdateHandler(QtCore.QObject):
     QtCore.QObject.__init__(self)
     self.__updateThreads = {}
     self.__requestedUpdates = {}
+    self.__monitorClients = {}
     self._lock = threading.RLock()
 
-  def requestMasterInfo(self, masteruri, monitoruri):
+  def requestMasterInfo(self, masteruri, monitoruri, delayed_exec=0.):
     '''
     This method starts a thread to get the informations about the ROS master by
     the given RCP uri of the master_discovery node. If all informations are
@@ -73,13 +75,17 @@ class UpdateHandler(QtCore.QObject):
     @type masteruri: C{str}
     @param monitoruri: the URI of the monitor RPC interface of the master_discovery node
     @type monitoruri: C{str}
+    @param delayed_exec: the maximal random delay in seconds before the request,
+    used for the requests started at once for many masters. The requested 
+    updates are executed without delay.
+    @type delayed_exec: C{float} (Default: C{0.})
     '''
     try:
       self._lock.acquire(True)
       if (self.__updateThreads.has_key(masteruri)):
         self.__requestedUpdates[masteruri] = monitoruri
       else:
-        self.__create_update_thread(monitoruri, masteruri)
+        self.__create_update_thread(monitoruri, masteruri, delayed_exec)
 #        from urlparse import urlparse
 #        om = urlparse(masteruri)
     except:
@@ -113,8 +119,13 @@ class UpdateHandler(QtCore.QObject):
     finally:
       self._lock.release()
 
-  def __create_update_thread(self, monitoruri, masteruri):
-    upthread = UpdateThread(monitoruri, masteruri)
+  def __create_update_thread(self, monitoruri, masteruri, delayed_exec=0.):
+    # reuse the client to request only the changes since last update
+    client = self.__monitorClients.get(masteruri, None)
+    if client is None or client.monitoruri != monitoruri:
+      client = MonitorClient(monitoruri)
+      self.__monitorClients[masteruri] = client
+    upthread = UpdateThread(monitoruri, masteruri, client, delayed_exec)
     self.__updateThreads[masteruri] = upthread
     upthread.update_signal.connect(self._on_master_info)
     upthread.error_signal.connect(self._on_error)
@@ -41,6 +41,7 @@ from PySide import QtCore
 import rospy
 
 from master_discovery_fkie.master_info import MasterInfo
+from master_discovery_fkie.monitor_client import MonitorClient
 
 class UpdateThread(QtCore.QObject, threading.Thread):
   '''
@@ -59,21 +60,32 @@ class UpdateThread(QtCore.QObject, threading.Thread):
   if an error while retrieving a master info was occurred.
   '''
 
-  def __init__(self, monitoruri, masteruri, parent=None):
+  def __init__(self, monitoruri, masteruri, monitor_client=None, delayed_exec=0., parent=None):
+    '''
+    @param monitor_client: the client used to request the state. The state of 
+    the previous requests stored in the client is used to request only the 
+    changes. If C{None} a new client will be created.
+    @type monitor_client: L{master_discovery_fkie.monitor_client.MonitorClient}
+    @param delayed_exec: the maximal random delay in seconds before the 
+    request, to spread the requests started at once
+    @type delayed_exec: C{float} (Default: C{0.})
+    '''
     QtCore.QObject.__init__(self)
     threading.Thread.__init__(self)
     self._monitoruri = monitoruri
     self._masteruri = masteruri
+    self._monitor_client = monitor_client if not monitor_client is None else MonitorClient(monitoruri)
+    self._delayed_exec = delayed_exec
     self.setDaemon(True)
 
   def run(self):
     '''
     '''
     try:
-      time.sleep(random.random())
+      if self._delayed_exec > 0:
+        time.sleep(random.random() * self._delayed_exec)
       socket.setdefaulttimeout(6)
-      remote_monitor = xmlrpclib.ServerProxy(self._monitoruri)
-      remote_info = remote_monitor.masterInfo()
+      remote_info = self._monitor_client.masterInfo()
       master_info = MasterInfo.from_list(remote_info)
       master_info.check_ts = time.time()
       self.update_signal.emit(master_info)